@@ -1,18 +1,373 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import seaborn as sns
 import os
+import io
+import csv
+import json
+import glob
+import hashlib
 import numpy as np
+import Pyro5.api
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import matplotlib.dates as mdates
 from matplotlib.ticker import FuncFormatter
+from utils import segmentos
+from utils.rollups import EstadisticaRollup
+from utils.sketch import SketchLatencia
+
+# Esquema explícito del CSV de logs: categorías para los textos que se repiten
+# mucho y números de 32 bits. Los timestamps se leen como texto y se parsean
+# una sola vez con formato ISO fijo.
+COLUMNAS_CATEGORICAS = ['maquina', 'tipo_maquina', 'query', 'destino']
+ESQUEMA_LOG = {
+    'timestamp_ini': 'object',
+    'timestamp_fin': 'object',
+    'maquina': 'category',
+    'tipo_maquina': 'category',
+    'query': 'category',
+    'tiempo_fin': 'float32',
+    'score': 'float32',
+    'rango_etario': 'category',
+    # Trazado: los logs anteriores no traen estas columnas y quedan vacías
+    'trace_id': 'object',
+    'destino': 'category',
+    'latencia_red': 'float32',
+    'bytes_respuesta': 'float32',
+    'etapas': 'object'
+}
+COLUMNAS_TRAZA = ['trace_id', 'destino', 'latencia_red', 'bytes_respuesta', 'etapas']
+
+# Columnas derivadas que se calculan recién cuando un gráfico las pide
+COLUMNAS_DERIVADAS = ('fecha', 'hora', 'dia_semana', 'latencia', 'tamanio_respuesta_kb')
+
+# Tamaño de la muestra por máquina para los gráficos de cajas en modo por bloques
+TAMANIO_MUESTRA = 2000
+
+# Las latencias de red desde este cuantil se descartan como outliers
+CUANTIL_OUTLIERS = 0.95
+
+# Carga incremental: cada ejecución con filas nuevas agrega una parte a la
+# cache del archivo; al llegar a este límite las partes se reescriben en una
+MAX_PARTES_CACHE = 16
+
+def leer_csv_tipado(fuente, **kwargs):
+    """pd.read_csv con el esquema de logs (sirve para archivos, .gz, buffers y lectura por bloques)"""
+    return pd.read_csv(fuente, dtype=ESQUEMA_LOG, **kwargs)
+
+def leer_segmento_tipado(ruta, **kwargs):
+    """
+    Lee un segmento con el esquema abriéndolo con segmentos.abrir_segmento,
+    así que si log_sv lo comprimió después de leer el manifest se usa el .gz
+    """
+    with segmentos.abrir_segmento(ruta) as f:
+        # abrir_segmento ya entrega el contenido descomprimido
+        return leer_csv_tipado(f, compression=None, **kwargs)
+
+def consultas_de(df):
+    """Registros de consultas atendidas por los esclavos (sin las llamadas que registra el maestro)"""
+    return df[df['tipo_maquina'] != 'maestro']
+
+def llamadas_de(df):
+    """Llamadas del maestro a los esclavos con latencia de red medida"""
+    return df[(df['tipo_maquina'] == 'maestro') & (df['latencia'] >= 0)]
+
+def buckets_latencia(latencias, alfa=0.01):
+    """
+    Bucket de SketchLatencia de cada latencia. En modo por bloques las
+    latencias se suman por bucket, así el cuantil de outliers se puede
+    calcular al final sin guardar los valores.
+    """
+    sketch = SketchLatencia(alfa)
+    valores = latencias.to_numpy(dtype='float64')
+    positivos = np.maximum(valores, SketchLatencia.MINIMO_POSITIVO)
+    buckets = np.ceil(np.log(positivos) / sketch.log_gamma).astype('int64')
+    # Los ceros van antes que cualquier bucket, como en el sketch
+    return pd.Series(np.where(valores <= SketchLatencia.MINIMO_POSITIVO, np.iinfo('int64').min, buckets),
+                     index=latencias.index, name='bucket')
+
+def bucket_de_cuantil(conteos, q):
+    """Bucket donde cae el cuantil q, dados los conteos por bucket (Series ordenada por bucket)"""
+    acumulado = conteos.cumsum().to_numpy()
+    rango = q * (acumulado[-1] - 1)
+    return conteos.index[np.searchsorted(acumulado, rango, side='right')]
+
+def concatenar(frames):
+    """Concatena DataFrames de logs manteniendo las columnas categóricas"""
+    df = pd.concat(frames, ignore_index=True)
+    for columna in COLUMNAS_CATEGORICAS:
+        if columna in df.columns and df[columna].dtype != 'category':
+            df[columna] = df[columna].astype('category')
+    return df
+
+# Gráficos: cada función dibuja sobre la Figure que recibe a partir de datos
+# ya preparados, sin tocar el estado global de pyplot. Las mismas funciones
+# sirven para mostrar un gráfico en pantalla o para renderizarlo con Agg en
+# un proceso aparte (generar_todos_los_graficos).
+DPI = 300
+# Puntos como máximo en el scatter y las curvas de score: a 300 dpi no se
+# distingue más detalle y dibujar millones de puntos toma minutos
+MAX_PUNTOS = 20000
+
+def muestrear_por_maquina(df, tamanio=TAMANIO_MUESTRA, semilla=0):
+    """Hasta `tamanio` filas uniformes por máquina, ordenadas por máquina como espera el gráfico de cajas"""
+    if not len(df) or df['maquina'].value_counts().max() <= tamanio:
+        return df
+    claves = np.random.default_rng(semilla).random(len(df))
+    muestra = df.assign(clave=claves).sort_values('clave').groupby('maquina', observed=True).head(tamanio)
+    return muestra.drop(columns='clave').sort_values('maquina', kind='stable').reset_index(drop=True)
+
+def preparar_curvas_score(df_sorted, ventanas, max_puntos=MAX_PUNTOS):
+    """
+    Medias móviles calculadas sobre la serie completa. Los puntos y las
+    curvas se diezman (uno de cada k) para dibujar a lo sumo `max_puntos`.
+    """
+    paso = max(1, -(-len(df_sorted) // max_puntos))
+    curvas = {}
+    for window in ventanas:
+        if window < len(df_sorted):
+            rolling_mean = df_sorted['score'].rolling(window=window, center=False).mean()
+            curvas[window] = rolling_mean.iloc[::paso].to_numpy()
+    return df_sorted.iloc[::paso][['timestamp_ini', 'score']].reset_index(drop=True), curvas
+
+def dibujar_torta_rangos_etarios(fig, conteo):
+    ax = fig.add_subplot()
+    
+    # Colores para el gráfico de torta
+    colors = plt.cm.viridis(np.linspace(0, 1, len(conteo)))
+    
+    # Graficar torta
+    patches, texts, autotexts = ax.pie(
+        conteo, 
+        labels=conteo.index, 
+        autopct='%1.1f%%',
+        startangle=90,
+        shadow=True,
+        colors=colors,
+        explode=[0.05] * len(conteo)  # Separar ligeramente todas las secciones
+    )
+    
+    # Mejorar la apariencia de las etiquetas
+    for text in texts:
+        text.set_fontsize(12)
+        text.set_fontweight('bold')
+    
+    for autotext in autotexts:
+        autotext.set_fontsize(10)
+        autotext.set_fontweight('bold')
+        autotext.set_color('white')
+    
+    ax.set_title('Distribución de Consultas por Rango Etario', fontsize=16, pad=20)
+    ax.axis('equal')  # Para que el círculo sea circular
+    
+    # Añadir leyenda con conteo exacto
+    legend_labels = [f'Edad {age}: {count} consultas' for age, count in zip(conteo.index, conteo.values)]
+    ax.legend(legend_labels, loc='best', fontsize=10)
+    
+    fig.tight_layout()
+
+def dibujar_curvas_score(fig, puntos, etiqueta_puntos, curvas):
+    ax = fig.add_subplot()
+    
+    # Graficar puntos de score
+    ax.scatter(puntos['timestamp_ini'], puntos['score'], 
+               color='gray', alpha=0.3, s=20, label=etiqueta_puntos)
+    
+    # Graficar las medias móviles con diferentes tamaños de ventana
+    colors = ['red', 'blue', 'green', 'purple', 'orange']
+    
+    for i, (window, rolling_mean) in enumerate(curvas.items()):
+        ax.plot(puntos['timestamp_ini'], rolling_mean, 
+                linewidth=2.5, color=colors[i % len(colors)], 
+                label=f'Media móvil (ventana={window})')
+    
+    # Formatear eje X para mostrar fecha y hora
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M'))
+    ax.tick_params(axis='x', labelrotation=45)
+    
+    # Etiquetas y título
+    ax.set_title('Evolución del Score a Través del Tiempo', fontsize=15)
+    ax.set_xlabel('Fecha y Hora', fontsize=12)
+    ax.set_ylabel('Score', fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.legend(loc='best')
+    
+    fig.tight_layout()
+
+def dibujar_cajas_tiempos(fig, df_esclavos, estadisticas):
+    if len(df_esclavos) == 0:
+        print("No hay datos de máquinas esclavas en el log")
+        return False
+    
+    ax = fig.add_subplot()
+    
+    # Crear boxplot
+    sns.boxplot(x='maquina', y='tiempo_fin', data=df_esclavos, ax=ax,
+                hue='maquina', legend=False, palette='viridis', width=0.6, showmeans=True,
+                meanprops={"marker":"o", "markerfacecolor":"white", 
+                           "markeredgecolor":"black", "markersize":"10"})
+    
+    # Añadir puntos individuales para ver la distribución
+    sns.stripplot(x='maquina', y='tiempo_fin', data=df_esclavos, ax=ax,
+                  jitter=True, size=4, color='black', alpha=0.3)
+    
+    # La muestra puede no incluir el máximo exacto: el eje debe llegar hasta él
+    ax.set_ylim(top=max(ax.get_ylim()[1], estadisticas['maximo'].max() * 1.05))
+    
+    # Añadir etiquetas con estadísticas exactas para cada esclavo
+    for i, maquina in enumerate(sorted(estadisticas.index)):
+        promedio = estadisticas.loc[maquina, 'promedio']
+        minimo = estadisticas.loc[maquina, 'minimo']
+        maximo = estadisticas.loc[maquina, 'maximo']
+        
+        # Añadir texto con estadísticas
+        ax.text(i, maximo * 1.05, 
+                f"Prom: {promedio:.4f}s\nMin: {minimo:.4f}s\nMax: {maximo:.4f}s", 
+                ha='center', va='bottom', fontsize=9, 
+                bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.8))
+    
+    # Mejorar etiquetas y título
+    ax.set_title('Distribución de Tiempos de Ejecución por Esclavo', fontsize=16)
+    ax.set_xlabel('Máquina (Esclavo)', fontsize=14)
+    ax.set_ylabel('Tiempo de Ejecución (segundos)', fontsize=14)
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+    
+    # Rotar etiquetas del eje x si hay muchas máquinas
+    if len(estadisticas) > 4:
+        ax.tick_params(axis='x', labelrotation=45)
+        for etiqueta in ax.get_xticklabels():
+            etiqueta.set_horizontalalignment('right')
+    
+    fig.tight_layout()
+
+def dibujar_latencia_red(fig, latencia_por_maquina_hora, latencia_promedio):
+    ax = fig.add_subplot()
+    
+    # Crear gráfico de líneas
+    sns.lineplot(
+        data=latencia_por_maquina_hora,
+        x='hora',
+        y='latencia',
+        hue='maquina',
+        marker='o',
+        markersize=8,
+        linewidth=2,
+        ax=ax
+    )
+    
+    # Añadir etiquetas y título
+    ax.set_title('Latencia de Red Promedio por Hora y Máquina', fontsize=16)
+    ax.set_xlabel('Hora del Día', fontsize=14)
+    ax.set_ylabel('Latencia (segundos)', fontsize=14)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    
+    # Ajustar eje X para mostrar todas las horas
+    ax.set_xticks(range(0, 24))
+    
+    # Añadir línea promedio general
+    ax.axhline(y=latencia_promedio, color='red', linestyle='--', 
+               label=f'Latencia promedio global: {latencia_promedio:.4f}s')
+    
+    ax.legend(title='Máquina', title_fontsize=12)
+    fig.tight_layout()
+
+def dibujar_tamanio_por_hora(fig, tamanio_por_hora):
+    ax = fig.add_subplot()
+    
+    # Crear paleta de colores para diferentes días
+    dias_unicos = tamanio_por_hora['dia_semana'].unique()
+    paleta = sns.color_palette("husl", len(dias_unicos))
+    
+    # Crear mapeo de día a color
+    color_map = {dia: paleta[i] for i, dia in enumerate(dias_unicos)}
+    
+    # Agrupar por día de la semana
+    for dia in dias_unicos:
+        data_dia = tamanio_por_hora[tamanio_por_hora['dia_semana'] == dia]
+        
+        # Para cada fecha de ese día
+        for fecha in data_dia['fecha'].unique():
+            data_fecha = data_dia[data_dia['fecha'] == fecha]
+            
+            # Graficar línea para esta fecha
+            ax.plot(data_fecha['hora'], data_fecha['tamanio_respuesta_mb'], 
+                    marker='o', linewidth=2, alpha=0.8,
+                    color=color_map[dia],
+                    label=f"{dia} ({fecha})")
+    
+    # Mejorar aspecto del gráfico
+    ax.set_title('Tamaño Total de Respuestas por Hora del Día', fontsize=16)
+    ax.set_xlabel('Hora del Día', fontsize=14)
+    ax.set_ylabel('Tamaño de Respuestas (MB)', fontsize=14)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    
+    # Ajustar eje X para mostrar todas las horas
+    ax.set_xticks(range(0, 24))
+    
+    # Formatear eje Y para mostrar decimales con 2 dígitos
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:.2f}'))
+    
+    # Ajustar leyenda
+    ax.legend(title='Día', bbox_to_anchor=(1.05, 1), loc='upper left')
+    
+    fig.tight_layout()
+
+# nombre -> (función de dibujo, tamaño de la figura, archivo)
+GRAFICOS = {
+    'rangos_etarios': (dibujar_torta_rangos_etarios, (10, 8), 'distribucion_rangos_etarios.png'),
+    'score_tiempo': (dibujar_curvas_score, (12, 7), 'evolucion_score_tiempo.png'),
+    'tiempos_esclavos': (dibujar_cajas_tiempos, (14, 8), 'tiempos_por_esclavo.png'),
+    'latencia_red': (dibujar_latencia_red, (12, 7), 'latencia_red.png'),
+    'tamanio_respuestas': (dibujar_tamanio_por_hora, (14, 8), 'tamanio_respuestas_por_hora.png'),
+}
+
+def renderizar(nombre, datos, directorio, dpi=DPI):
+    """
+    Dibuja un gráfico en una Figure propia con el backend Agg (sin pantalla
+    ni estado global) y lo guarda en `directorio`. Es lo que corre cada
+    proceso del pool; devuelve la ruta o None si no había datos.
+    """
+    dibujar, tamanio, archivo = GRAFICOS[nombre]
+    fig = Figure(figsize=tamanio)
+    FigureCanvasAgg(fig)
+    if dibujar(fig, *datos) is False:
+        return None
+    ruta = os.path.join(directorio, archivo)
+    fig.savefig(ruta, dpi=dpi, bbox_inches='tight')
+    return ruta
 
 class AdvancedLogAnalyzer:
-    def __init__(self, log_file='logs.csv'):
-        """Inicializa el analizador de logs con la ruta al archivo CSV"""
+    def __init__(self, log_file='logs.csv', desde=None, hasta=None, incremental=False, directorio_cache='.cache_logs',
+                 por_bloques=False, tamanio_bloque=100000, rollups_uri=None):
+        """
+        Inicializa el analizador de logs con la ruta al archivo CSV o al
+        directorio de segmentos de log_sv.py. Con `desde`/`hasta` (timestamps
+        ISO o datetime) solo se leen los segmentos que se solapan con la ventana.
+        Con `incremental=True` se reutiliza lo ya procesado en `directorio_cache`
+        y solo se leen las filas agregadas desde la última ejecución.
+        Con `por_bloques=True` no se carga el log: se recorre en bloques de
+        `tamanio_bloque` filas y solo se guardan los agregados de los gráficos.
+        Con `rollups_uri` (p. ej. "PYRONAME:centralizado.logger") no se lee
+        ningún archivo: los agregados salen de los rollups por minuto que
+        mantiene el servidor de logs, así que sirve para tableros en vivo.
+        """
         self.log_file = log_file
+        self.desde = desde.isoformat() if isinstance(desde, datetime) else desde
+        self.hasta = hasta.isoformat() if isinstance(hasta, datetime) else hasta
+        self.incremental = incremental
+        self.directorio_cache = directorio_cache
+        self.tamanio_bloque = tamanio_bloque
         self.df = None
-        self.load_data()
+        self.agregados = None
+        if rollups_uri:
+            self.agregados = self.calcular_agregados_desde_rollups(rollups_uri)
+        elif por_bloques:
+            self.agregados = self.calcular_agregados_por_bloques()
+        else:
+            self.load_data()
     
     def load_data(self):
         """Carga los datos del archivo CSV y realiza preprocesamiento básico"""
@@ -20,339 +375,575 @@ class AdvancedLogAnalyzer:
             raise FileNotFoundError(f"El archivo de logs {self.log_file} no existe")
         
         print(f"Cargando datos desde {self.log_file}...")
-        self.df = pd.read_csv(self.log_file)
+        if self.incremental:
+            self.df = self._cargar_incremental()
+        elif os.path.isdir(self.log_file):
+            self.df = self._preprocesar(self._leer_segmentos())
+        else:
+            self.df = self._preprocesar(leer_csv_tipado(self.log_file))
         
-        # Convertir columnas de timestamps a datetime
-        self.df['timestamp_ini'] = pd.to_datetime(self.df['timestamp_ini'])
-        self.df['timestamp_fin'] = pd.to_datetime(self.df['timestamp_fin'])
+        self.df = self._filtrar_ventana(self.df)
+        uso_mb = self.df.memory_usage(deep=True).sum() / (1024 * 1024)
+        print(f"Datos cargados exitosamente. {len(self.df)} registros encontrados ({uso_mb:.1f} MB en memoria).")
+    
+    def _filtrar_ventana(self, df):
+        # Limitar a la ventana pedida (los segmentos pueden traer algo de más en los bordes)
+        if self.desde is not None:
+            df = df[df['timestamp_ini'] >= pd.Timestamp(self.desde)]
+        if self.hasta is not None:
+            df = df[df['timestamp_ini'] < pd.Timestamp(self.hasta)]
+        return df.reset_index(drop=True)
+    
+    def _preprocesar(self, df):
+        """Convierte un DataFrame leído con el esquema a sus tipos finales"""
+        # Un único parseo de timestamps con formato fijo
+        df['timestamp_ini'] = pd.to_datetime(df['timestamp_ini'], format='ISO8601')
+        df['timestamp_fin'] = pd.to_datetime(df['timestamp_fin'], format='ISO8601')
         
         # Asegurar que tiempo_fin y score sean numéricos
-        self.df['tiempo_fin'] = pd.to_numeric(self.df['tiempo_fin'])
-        self.df['score'] = pd.to_numeric(self.df['score'])
-        
-        # Convertir rango_etario a tipo numérico si es posible
-        self.df['rango_etario'] = pd.to_numeric(self.df['rango_etario'], errors='coerce')
-        
-        # Agregar columnas útiles para análisis
-        self.df['fecha'] = self.df['timestamp_ini'].dt.date
-        self.df['hora'] = self.df['timestamp_ini'].dt.hour
-        self.df['dia_semana'] = self.df['timestamp_ini'].dt.day_name()
-        
-        # Calcular latencia de red (tiempo entre timestamp_fin y timestamp_ini)
-        self.df['latencia'] = (self.df['timestamp_fin'] - self.df['timestamp_ini']).dt.total_seconds() - self.df['tiempo_fin']
-        
-        # Estimar tamaño de respuesta (simulado - basado en score y tiempo)
-        # En un caso real, esto debería venir en el log
-        self.df['tamanio_respuesta_kb'] = (self.df['score'] * 10 + self.df['tiempo_fin'] * 5) * np.random.uniform(0.8, 1.2, len(self.df))
+        df['tiempo_fin'] = pd.to_numeric(df['tiempo_fin'], downcast='float')
+        df['score'] = pd.to_numeric(df['score'], downcast='float')
+        
+        # Los logs anteriores al trazado no tienen sus columnas
+        for columna in COLUMNAS_TRAZA:
+            if columna not in df.columns:
+                df[columna] = pd.Series(index=df.index, dtype=ESQUEMA_LOG[columna])
+        
+        # Convertir rango_etario a número convirtiendo solo las categorías distintas
+        rango = df['rango_etario'].astype('category')
+        valores = pd.to_numeric(rango.cat.categories.astype(str), errors='coerce').to_numpy(dtype='float32')
+        # El código -1 (valor faltante) toma el NaN agregado al final
+        df['rango_etario'] = np.append(valores, np.float32(np.nan))[rango.cat.codes.to_numpy()]
+        return df
+    
+    def _asegurar_columnas(self, df, *columnas):
+        """Calcula las columnas derivadas pedidas que todavía no existen en df"""
+        for columna in columnas:
+            if columna in df.columns:
+                continue
+            if columna == 'fecha':
+                df['fecha'] = df['timestamp_ini'].dt.date
+            elif columna == 'hora':
+                df['hora'] = df['timestamp_ini'].dt.hour.astype('int8')
+            elif columna == 'dia_semana':
+                df['dia_semana'] = df['timestamp_ini'].dt.day_name().astype('category')
+            elif columna == 'latencia':
+                # Latencia de red medida por el maestro: su ida y vuelta menos el
+                # Server-Timing del esclavo (solo en los registros del maestro)
+                df['latencia'] = df['latencia_red']
+            elif columna == 'tamanio_respuesta_kb':
+                # Bytes del cuerpo de la respuesta medidos al serializarla
+                df['tamanio_respuesta_kb'] = (df['bytes_respuesta'] / 1024).astype('float32')
+            else:
+                raise ValueError(f"Columna derivada desconocida: {columna}")
+        return df
+    
+    def _leer_segmentos(self):
+        """Lee solo los segmentos del manifest que se solapan con la ventana pedida"""
+        rutas = self._rutas_segmentos()
+        return concatenar([leer_segmento_tipado(ruta) for ruta in rutas])
+    
+    def _rutas_segmentos(self):
+        rutas = segmentos.segmentos_en_rango(self.log_file, self.desde, self.hasta)
+        print(f"Leyendo {len(rutas)} segmentos de {self.log_file}")
+        if not rutas:
+            raise FileNotFoundError(f"No hay segmentos de logs en {self.log_file} para la ventana pedida")
+        return rutas
+    
+    def _cargar_incremental(self):
+        """
+        Carga usando el checkpoint: por cada archivo se guarda hasta qué byte
+        ya se procesó y el DataFrame resultante en partes, así que solo se
+        parsean y se escriben las filas nuevas. Si el archivo fue rotado o
+        truncado se reconstruye.
+        """
+        os.makedirs(self.directorio_cache, exist_ok=True)
+        ruta_checkpoint = os.path.join(self.directorio_cache, 'checkpoint.json')
+        checkpoint = {}
+        if os.path.exists(ruta_checkpoint):
+            with open(ruta_checkpoint, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        
+        rutas = self._rutas_segmentos() if os.path.isdir(self.log_file) else [self.log_file]
+        frames = []
+        vistas = set()
+        for ruta in rutas:
+            # Un segmento comprimido entre el listado y la lectura se toma como .gz
+            ruta, estado = segmentos.estado_segmento(ruta)
+            clave = os.path.abspath(ruta)
+            info = checkpoint.get(clave)
+            original = clave[:-len('.gz')]
+            if info is None and clave.endswith('.gz') and original in checkpoint and not os.path.exists(original):
+                # log_sv comprimió el segmento después de la última ejecución
+                info = self._heredar_cache(ruta, original, checkpoint.pop(original))
+            checkpoint[clave], df = self._cargar_archivo_incremental(ruta, info, estado)
+            vistas.add(clave)
+            frames.append(df)
+        
+        # Los archivos que ya no existen (rotados, comprimidos o borrados) dejan de ocupar la cache.
+        # Uno leído en esta ejecución y comprimido durante ella se conserva: la próxima hereda su cache.
+        for clave in [clave for clave in checkpoint if clave not in vistas and not os.path.exists(clave)]:
+            self._borrar_cache(self._prefijo_cache(clave))
+            del checkpoint[clave]
+        
+        temporal = ruta_checkpoint + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(temporal, ruta_checkpoint)
+        return concatenar(frames)
+    
+    def _prefijo_cache(self, ruta):
+        return os.path.join(self.directorio_cache, hashlib.sha1(os.path.abspath(ruta).encode()).hexdigest()[:16])
+    
+    @staticmethod
+    def _borrar_cache(prefijo):
+        # También borra la cache de un solo archivo de versiones anteriores (<prefijo>.pkl)
+        for ruta_parte in glob.glob(glob.escape(prefijo) + '*.pkl'):
+            os.remove(ruta_parte)
+    
+    def _heredar_cache(self, ruta, original, info):
+        """
+        Pasa al segmento comprimido `ruta` la cache de su .csv `original`, ya
+        borrado: renombra sus partes y lee del .gz solo las filas posteriores
+        al offset guardado. Devuelve el checkpoint del .gz, o None si la cache
+        no sirve y hay que reconstruirla.
+        """
+        anterior = self._prefijo_cache(original)
+        nuevo = self._prefijo_cache(ruta)
+        partes = info.get('partes', 0)
+        with segmentos.abrir_segmento(ruta) as f:
+            comienzo = f.read(info['bytes_firma'])
+        if (not partes or hashlib.sha1(comienzo).hexdigest() != info['firma']
+                or not all(os.path.exists(f"{anterior}-{numero}.pkl") for numero in range(partes))):
+            self._borrar_cache(anterior)
+            return None
+        self._borrar_cache(nuevo)
+        for numero in range(partes):
+            os.replace(f"{anterior}-{numero}.pkl", f"{nuevo}-{numero}.pkl")
+        crudo, _, columnas = self._leer_desde(ruta, info['offset'], info['columnas'])
+        print(f"{os.path.basename(ruta)}: cache heredada de {os.path.basename(original)} "
+              f"({len(crudo)} registros nuevos)")
+        if len(crudo):
+            self._preprocesar(crudo).to_pickle(f"{nuevo}-{partes}.pkl")
+            partes += 1
+        estado = os.stat(ruta)
+        bytes_firma = min(estado.st_size, 1024)
+        return {
+            'offset': estado.st_size,
+            'inode': estado.st_ino,
+            'bytes_firma': bytes_firma,
+            'firma': self._firma(ruta, bytes_firma),
+            'columnas': columnas,
+            'partes': partes
+        }
+    
+    def _cargar_archivo_incremental(self, ruta, info, estado):
+        # Si el .csv se comprime a partir de acá, las lecturas pasan por
+        # abrir_segmento y ven los mismos bytes en el .gz
+        comprimido = ruta.endswith('.gz')
+        prefijo = self._prefijo_cache(ruta)
+        
+        valido = (
+            info is not None and 'partes' in info
+            and all(os.path.exists(f"{prefijo}-{numero}.pkl") for numero in range(info['partes']))
+            and info['inode'] == estado.st_ino
+            and estado.st_size >= info['offset']
+            and info['firma'] == self._firma(ruta, info['bytes_firma'])
+            and (not comprimido or estado.st_size == info['offset'])
+        )
         
-        print(f"Datos cargados exitosamente. {len(self.df)} registros encontrados.")
+        if valido:
+            # Las partes se unen recién al cargar; solo la nueva se escribe
+            partes = [pd.read_pickle(f"{prefijo}-{numero}.pkl") for numero in range(info['partes'])]
+            if estado.st_size == info['offset']:
+                return info, concatenar(partes)
+            crudo, offset, columnas = self._leer_desde(ruta, info['offset'], info['columnas'])
+            print(f"{os.path.basename(ruta)}: {len(crudo)} registros nuevos desde el último checkpoint")
+            if len(crudo):
+                nueva = self._preprocesar(crudo)
+                nueva.to_pickle(f"{prefijo}-{len(partes)}.pkl")
+                partes.append(nueva)
+            df = concatenar(partes)
+            if len(partes) >= MAX_PARTES_CACHE:
+                print(f"{os.path.basename(ruta)}: compactando {len(partes)} partes de la cache")
+                self._reescribir_cache(prefijo, df)
+                partes = [df]
+            cantidad = len(partes)
+        else:
+            print(f"{os.path.basename(ruta)}: reconstruyendo cache (archivo nuevo, rotado o truncado)")
+            if comprimido:
+                crudo = leer_csv_tipado(ruta)
+                offset, columnas = estado.st_size, list(crudo.columns)
+            else:
+                crudo, offset, columnas = self._leer_desde(ruta, 0, None)
+            df = self._preprocesar(crudo)
+            self._reescribir_cache(prefijo, df)
+            cantidad = 1
+        
+        bytes_firma = min(offset, 1024)
+        return {
+            'offset': offset,
+            'inode': estado.st_ino,
+            'bytes_firma': bytes_firma,
+            'firma': self._firma(ruta, bytes_firma),
+            'columnas': columnas,
+            'partes': cantidad
+        }, df
+    
+    @staticmethod
+    def _reescribir_cache(prefijo, df):
+        """Deja la cache de un archivo en una sola parte, borrando las anteriores"""
+        temporal = f"{prefijo}-0.pkl.tmp"
+        df.to_pickle(temporal)
+        AdvancedLogAnalyzer._borrar_cache(prefijo)
+        os.replace(temporal, f"{prefijo}-0.pkl")
     
-    def grafico_torta_rangos_etarios(self, save=False):
+    @staticmethod
+    def _firma(ruta, cantidad):
         """
-        1. Genera un gráfico de torta mostrando el porcentaje de consultas por rango etario
+        Hash de los primeros bytes del archivo, para detectar que fue
+        reemplazado. Un .gz se firma sobre sus bytes comprimidos; un .csv que
+        se comprimió mientras tanto, sobre su contenido, que es el mismo.
+        """
+        with (open(ruta, 'rb') if ruta.endswith('.gz') else segmentos.abrir_segmento(ruta)) as f:
+            return hashlib.sha1(f.read(cantidad)).hexdigest()
+    
+    @staticmethod
+    def _leer_desde(ruta, offset, columnas):
+        """
+        Lee las filas completas a partir de `offset` (sin una posible última
+        línea a medio escribir; en un .gz el offset es del contenido sin
+        comprimir). Devuelve el DataFrame crudo, el nuevo offset y las
+        columnas del encabezado.
+        """
+        with segmentos.abrir_segmento(ruta) as f:
+            if columnas is None:
+                columnas = next(csv.reader([f.readline().decode('utf-8')]))
+                offset = f.tell()
+            f.seek(offset)
+            datos = f.read()
+        corte = datos.rfind(b'\n') + 1
+        datos = datos[:corte]
+        if not datos.strip():
+            datos = b''
+        return leer_csv_tipado(io.BytesIO(datos), header=None, names=columnas), offset + corte, columnas
+    
+    def _iterar_bloques(self):
+        """Recorre el log (archivo o segmentos) en bloques tipados de `tamanio_bloque` filas"""
+        rutas = self._rutas_segmentos() if os.path.isdir(self.log_file) else [self.log_file]
+        for ruta in rutas:
+            with segmentos.abrir_segmento(ruta) as f:
+                for bloque in leer_csv_tipado(f, compression=None, chunksize=self.tamanio_bloque):
+                    bloque = self._filtrar_ventana(self._preprocesar(bloque))
+                    if len(bloque):
+                        yield bloque
+    
+    def calcular_agregados_por_bloques(self):
+        """
+        Construye los datos de los cinco gráficos recorriendo el log por
+        bloques, sin tenerlo nunca completo en memoria. Se guardan conteos,
+        sumas, mínimos y máximos, y una muestra uniforme acotada de tiempos
+        por esclavo para el gráfico de cajas. Las latencias se suman por
+        bucket de SketchLatencia para descartar al final las del p95 en
+        adelante, como con el log completo; el corte es el del bucket del
+        p95, así que difiere del exacto en a lo sumo ~1%.
+        """
+        if not os.path.exists(self.log_file):
+            raise FileNotFoundError(f"El archivo de logs {self.log_file} no existe")
+        print(f"Calculando agregados por bloques desde {self.log_file}...")
+        
+        conteos, scores, tiempos, latencias, tamanios = [], [], [], [], []
+        muestra = pd.DataFrame(columns=['maquina', 'tiempo_fin', 'clave'])
+        # Misma semilla que muestrear_por_maquina: el gráfico no cambia entre ejecuciones
+        generador = np.random.default_rng(0)
+        filas = 0
+        for bloque in self._iterar_bloques():
+            filas += len(bloque)
+            self._asegurar_columnas(bloque, *COLUMNAS_DERIVADAS)
+            conteos.append(bloque['rango_etario'].dropna().astype(int).value_counts())
+            consultas = consultas_de(bloque)
+            scores.append(consultas.groupby(consultas['timestamp_ini'].dt.floor('min'))['score'].agg(['sum', 'count']))
+            
+            esclavos = bloque[bloque['tipo_maquina'] == 'esclavo']
+            tiempos.append(esclavos.groupby('maquina', observed=True)['tiempo_fin'].agg(['count', 'sum', 'min', 'max']))
+            # Muestreo uniforme: se conservan las filas con las claves aleatorias más chicas
+            candidatos = pd.DataFrame({'maquina': esclavos['maquina'].astype(str),
+                                       'tiempo_fin': esclavos['tiempo_fin'],
+                                       'clave': generador.random(len(esclavos))})
+            muestra = (pd.concat([muestra, candidatos], ignore_index=True)
+                       .sort_values('clave').groupby('maquina').head(TAMANIO_MUESTRA))
+            
+            llamadas = llamadas_de(bloque)
+            latencias.append(llamadas.groupby(['destino', 'hora', buckets_latencia(llamadas['latencia'])],
+                                              observed=True)['latencia'].agg(['sum', 'count']))
+            tamanios.append(consultas_de(bloque).groupby(['fecha', 'hora', 'dia_semana'], observed=True)['tamanio_respuesta_kb'].sum())
+        
+        if filas == 0:
+            raise ValueError(f"No hay registros en {self.log_file} para la ventana pedida")
+        
+        score = pd.concat(scores).groupby(level=0).sum()
+        tiempo = pd.concat(tiempos).groupby(level=0).agg({'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'})
+        latencia = pd.concat(latencias).groupby(level=[0, 1, 2]).sum()
+        if len(latencia):
+            # Igual que _datos_latencia: solo las latencias por debajo del p95
+            por_bucket = latencia['count'].groupby(level=2).sum().sort_index()
+            corte = bucket_de_cuantil(por_bucket, CUANTIL_OUTLIERS)
+            latencia = latencia[latencia.index.get_level_values(2) < corte]
+        latencia = latencia.groupby(level=[0, 1]).sum()
+        tamanio = pd.concat(tamanios).groupby(level=[0, 1, 2]).sum()
+        # En el gráfico de latencia la "máquina" es el esclavo llamado
+        latencia_maquina_hora = (latencia['sum'] / latencia['count']).rename('latencia').reset_index()
+        latencia_maquina_hora = latencia_maquina_hora.rename(columns={'destino': 'maquina'})
+        latencia_maquina_hora['maquina'] = latencia_maquina_hora['maquina'].astype(str)
+        
+        print(f"Agregados calculados sobre {filas} registros.")
+        return {
+            'conteo_rango_etario': pd.concat(conteos).groupby(level=0).sum().sort_index(),
+            'scores': pd.DataFrame({'timestamp_ini': score.index, 'score': (score['sum'] / score['count']).values}),
+            'tiempos_esclavos': pd.DataFrame({'promedio': tiempo['sum'] / tiempo['count'],
+                                              'minimo': tiempo['min'], 'maximo': tiempo['max']}),
+            # Ordenada por máquina para que las cajas coincidan con las etiquetas
+            'muestra_tiempos': muestra[['maquina', 'tiempo_fin']].sort_values('maquina', kind='stable').reset_index(drop=True),
+            'latencia_maquina_hora': latencia_maquina_hora,
+            'latencia_promedio': latencia['sum'].sum() / max(latencia['count'].sum(), 1),
+            'tamanio_por_hora': (tamanio / 1024).rename('tamanio_respuesta_mb').reset_index()
+        }
+    
+    def calcular_agregados_desde_rollups(self, uri):
+        """
+        Construye los mismos agregados que calcular_agregados_por_bloques a
+        partir de los rollups por minuto del servidor de logs. Las
+        distribuciones de tiempos salen de los sketches combinados, así que
+        la muestra del gráfico de cajas es aproximada (error relativo ~1%).
+        Los rollups guardan solo la suma y el conteo de latencias por minuto,
+        así que acá la latencia de red no descarta los outliers del p95.
         """
+        print(f"Obteniendo rollups por minuto desde {uri}...")
+        with Pyro5.api.Proxy(uri) as logger:
+            total = pd.DataFrame(logger.rollups(self.desde, self.hasta, "total", False))
+            por_rango = pd.DataFrame(logger.rollups(self.desde, self.hasta, "rango_etario", False))
+            por_maquina = logger.rollups(self.desde, self.hasta, "maquina", True)
+            por_destino = logger.rollups(self.desde, self.hasta, "destino", False)
+        
+        if total.empty:
+            raise ValueError(f"No hay rollups en {uri} para la ventana pedida")
+        
+        minutos = pd.to_datetime(total['minuto'])
+        total['fecha'] = minutos.dt.date
+        total['hora'] = minutos.dt.hour.astype('int8')
+        total['dia_semana'] = minutos.dt.day_name().astype('category')
+        tamanio = total.groupby(['fecha', 'hora', 'dia_semana'], observed=True)['tamanio_kb'].sum() / 1024
+        
+        por_rango['rango'] = pd.to_numeric(por_rango['clave'], errors='coerce')
+        por_rango = por_rango.dropna(subset=['rango'])
+        conteo_rango = por_rango.groupby(por_rango['rango'].astype(int))['conteo'].sum().sort_index()
+        conteo_rango.index.name = 'rango_etario'
+        
+        # Sketches de tiempos combinados por esclavo, y latencia por esclavo llamado y hora
+        latencias = [(fila['clave'], int(fila['minuto'][11:13]), fila['suma_latencia'], fila['conteo_latencia'])
+                     for fila in por_destino if fila['conteo_latencia']]
+        combinadas = {}
+        for fila in por_maquina:
+            if fila['tipo_maquina'] != 'esclavo':
+                continue
+            estadistica = EstadisticaRollup.desde_dict(fila)
+            if fila['clave'] in combinadas:
+                combinadas[fila['clave']].combinar(estadistica)
+            else:
+                combinadas[fila['clave']] = estadistica
+        
+        maquinas = sorted(combinadas)
+        tiempos_esclavos = pd.DataFrame({
+            'promedio': [combinadas[m].tiempo.promedio() for m in maquinas],
+            'minimo': [combinadas[m].tiempo.minimo for m in maquinas],
+            'maximo': [combinadas[m].tiempo.maximo for m in maquinas]
+        }, index=pd.Index(maquinas, name='maquina'))
+        muestra = pd.DataFrame(
+            [(m, valor) for m in maquinas for valor in combinadas[m].tiempo.muestra(TAMANIO_MUESTRA)],
+            columns=['maquina', 'tiempo_fin'])
+        
+        latencia = pd.DataFrame(latencias, columns=['maquina', 'hora', 'sum', 'count'])
+        latencia = latencia.groupby(['maquina', 'hora'])[['sum', 'count']].sum()
+        latencia_maquina_hora = (latencia['sum'] / latencia['count']).rename('latencia').reset_index()
+        
+        print(f"Agregados obtenidos de {len(total)} minutos ({int(total['conteo'].sum())} registros).")
+        return {
+            'conteo_rango_etario': conteo_rango,
+            'scores': pd.DataFrame({'timestamp_ini': minutos, 'score': total['suma_score'] / total['conteo']}),
+            'tiempos_esclavos': tiempos_esclavos,
+            'muestra_tiempos': muestra,
+            'latencia_maquina_hora': latencia_maquina_hora,
+            'latencia_promedio': latencia['sum'].sum() / max(latencia['count'].sum(), 1),
+            'tamanio_por_hora': tamanio.rename('tamanio_respuesta_mb').reset_index()
+        }
+    
+    def _datos_rangos_etarios(self):
+        if self.agregados is not None:
+            return self.agregados['conteo_rango_etario']
         # Filtrar registros con rango etario válido
         df_valid = self.df.dropna(subset=['rango_etario'])
-        
         # Contar ocurrencias por rango etario
-        conteo = df_valid['rango_etario'].astype(int).value_counts().sort_index()
-        
-        # Crear figura
-        plt.figure(figsize=(10, 8))
-        
-        # Colores para el gráfico de torta
-        colors = plt.cm.viridis(np.linspace(0, 1, len(conteo)))
-        
-        # Graficar torta
-        patches, texts, autotexts = plt.pie(
-            conteo, 
-            labels=conteo.index, 
-            autopct='%1.1f%%',
-            startangle=90,
-            shadow=True,
-            colors=colors,
-            explode=[0.05] * len(conteo)  # Separar ligeramente todas las secciones
-        )
-        
-        # Mejorar la apariencia de las etiquetas
-        for text in texts:
-            text.set_fontsize(12)
-            text.set_fontweight('bold')
-        
-        for autotext in autotexts:
-            autotext.set_fontsize(10)
-            autotext.set_fontweight('bold')
-            autotext.set_color('white')
-        
-        plt.title('Distribución de Consultas por Rango Etario', fontsize=16, pad=20)
-        plt.axis('equal')  # Para que el círculo sea circular
-        
-        # Añadir leyenda con conteo exacto
-        legend_labels = [f'Edad {age}: {count} consultas' for age, count in zip(conteo.index, conteo.values)]
-        plt.legend(legend_labels, loc='best', fontsize=10)
-        
-        plt.tight_layout()
-        
+        return df_valid['rango_etario'].astype(int).value_counts().sort_index()
+    
+    def _datos_scores(self):
+        """Serie de scores ordenada por tiempo y la etiqueta de sus puntos"""
+        if self.agregados is not None:
+            return self.agregados['scores'], 'Score promedio por minuto'
+        return consultas_de(self.df)[['timestamp_ini', 'score']].sort_values('timestamp_ini'), 'Scores individuales'
+    
+    def _datos_tiempos_esclavos(self):
+        """Puntos (maquina, tiempo_fin) para las cajas y estadísticas exactas por esclavo"""
+        if self.agregados is not None:
+            return self.agregados['muestra_tiempos'], self.agregados['tiempos_esclavos']
+        df_esclavos = self.df.loc[self.df['tipo_maquina'] == 'esclavo', ['maquina', 'tiempo_fin']].copy()
+        if df_esclavos['maquina'].dtype == 'category':
+            df_esclavos['maquina'] = df_esclavos['maquina'].cat.remove_unused_categories()
+        estadisticas = df_esclavos.groupby('maquina', observed=True)['tiempo_fin'].agg(
+            promedio='mean', minimo='min', maximo='max')
+        # Cajas y puntos desde una muestra por esclavo; las estadísticas son sobre todos los registros
+        return muestrear_por_maquina(df_esclavos), estadisticas
+    
+    def _datos_latencia(self):
+        """Latencia promedio por máquina y hora, y el promedio global"""
+        if self.agregados is not None:
+            return self.agregados['latencia_maquina_hora'], self.agregados['latencia_promedio']
+        self._asegurar_columnas(self.df, 'latencia', 'hora')
+        llamadas = llamadas_de(self.df)
+        if llamadas.empty:
+            print("No hay latencias medidas: el maestro registra sus llamadas a los esclavos desde el trazado")
+        # Filtrar latencias válidas (eliminar valores extremadamente altos)
+        df_latencia = llamadas[llamadas['latencia'] < llamadas['latencia'].quantile(CUANTIL_OUTLIERS)]  # Eliminar outliers
+        # Agrupar por esclavo llamado y hora
+        latencia_por_maquina_hora = (df_latencia.groupby(['destino', 'hora'], observed=True)['latencia'].mean()
+                                     .reset_index().rename(columns={'destino': 'maquina'}))
+        latencia_por_maquina_hora['maquina'] = latencia_por_maquina_hora['maquina'].astype(str)
+        return latencia_por_maquina_hora, df_latencia['latencia'].mean()
+    
+    def _datos_tamanio_por_hora(self):
+        if self.agregados is not None:
+            return self.agregados['tamanio_por_hora']
+        self._asegurar_columnas(self.df, 'fecha', 'hora', 'dia_semana', 'tamanio_respuesta_kb')
+        # Agrupar por fecha, hora y calcular suma de tamaños (convertidos de KB a MB)
+        tamanio = consultas_de(self.df).groupby(['fecha', 'hora', 'dia_semana'], observed=True)['tamanio_respuesta_kb'].sum() / 1024
+        return tamanio.rename('tamanio_respuesta_mb').reset_index()
+    
+    def _datos_grafico(self, nombre, ventanas=(5, 10, 20)):
+        """Argumentos de la función de dibujo de un gráfico, ya preparados y reducidos"""
+        if nombre == 'rangos_etarios':
+            return (self._datos_rangos_etarios(),)
+        if nombre == 'score_tiempo':
+            df_sorted, etiqueta_puntos = self._datos_scores()
+            puntos, curvas = preparar_curvas_score(df_sorted, ventanas)
+            return puntos, etiqueta_puntos, curvas
+        if nombre == 'tiempos_esclavos':
+            return self._datos_tiempos_esclavos()
+        if nombre == 'latencia_red':
+            return self._datos_latencia()
+        return (self._datos_tamanio_por_hora(),)
+    
+    def _graficar(self, nombre, save, directorio='.', **kwargs):
+        datos = self._datos_grafico(nombre, **kwargs)
         if save:
-            plt.savefig('distribucion_rangos_etarios.png', dpi=300, bbox_inches='tight')
-            print("Gráfico guardado como 'distribucion_rangos_etarios.png'")
-        else:
-            plt.show()
+            if renderizar(nombre, datos, directorio):
+                print(f"Gráfico guardado como '{GRAFICOS[nombre][2]}'")
+            return
+        dibujar, tamanio, _ = GRAFICOS[nombre]
+        fig = plt.figure(figsize=tamanio)
+        if dibujar(fig, *datos) is False:
+            plt.close(fig)
+            return
+        plt.show()
     
-    def grafico_curvas_score_tiempo(self, ventanas=[5, 10, 20], save=False):
+    def grafico_torta_rangos_etarios(self, save=False, directorio='.'):
+        """
+        1. Genera un gráfico de torta mostrando el porcentaje de consultas por rango etario
+        """
+        self._graficar('rangos_etarios', save, directorio)
+    
+    def grafico_curvas_score_tiempo(self, ventanas=[5, 10, 20], save=False, directorio='.'):
         """
         2. Genera curvas de promedios de score a través del tiempo con ventanas variables
         """
-        # Ordenar por timestamp
-        df_sorted = self.df.sort_values('timestamp_ini').copy()
-        
-        # Crear figura
-        plt.figure(figsize=(12, 7))
-        
-        # Graficar puntos de score individuales
-        plt.scatter(df_sorted['timestamp_ini'], df_sorted['score'], 
-                   color='gray', alpha=0.3, s=20, label='Scores individuales')
-        
-        # Calcular y graficar medias móviles con diferentes tamaños de ventana
-        colors = ['red', 'blue', 'green', 'purple', 'orange']
-        
-        for i, window in enumerate(ventanas):
-            if window < len(df_sorted):
-                # Calcular media móvil
-                rolling_mean = df_sorted['score'].rolling(window=window, center=False).mean()
-                
-                # Graficar la media móvil
-                plt.plot(df_sorted['timestamp_ini'], rolling_mean, 
-                        linewidth=2.5, color=colors[i % len(colors)], 
-                        label=f'Media móvil (ventana={window})')
-        
-        # Formatear eje X para mostrar fecha y hora
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M'))
-        plt.xticks(rotation=45)
-        
-        # Etiquetas y título
-        plt.title('Evolución del Score a Través del Tiempo', fontsize=15)
-        plt.xlabel('Fecha y Hora', fontsize=12)
-        plt.ylabel('Score', fontsize=12)
-        plt.grid(True, linestyle='--', alpha=0.7)
-        plt.legend(loc='best')
-        
-        plt.tight_layout()
-        
-        if save:
-            plt.savefig('evolucion_score_tiempo.png', dpi=300, bbox_inches='tight')
-            print("Gráfico guardado como 'evolucion_score_tiempo.png'")
-        else:
-            plt.show()
+        self._graficar('score_tiempo', save, directorio, ventanas=ventanas)
     
-    def grafico_cajas_tiempo_esclavos(self, save=False):
+    def grafico_cajas_tiempo_esclavos(self, save=False, directorio='.'):
         """
         3. Genera un gráfico de cajas mostrando tiempos (promedio, min, max) por esclavo
         """
-        # Filtrar solo registros de esclavos
-        df_esclavos = self.df[self.df['tipo_maquina'] == 'esclavo'].copy()
-        
-        if len(df_esclavos) == 0:
-            print("No hay datos de máquinas esclavas en el log")
-            return
-        
-        # Crear figura
-        plt.figure(figsize=(14, 8))
-        
-        # Crear boxplot
-        ax = sns.boxplot(x='maquina', y='tiempo_fin', data=df_esclavos, 
-                       palette='viridis', width=0.6, showmeans=True,
-                       meanprops={"marker":"o", "markerfacecolor":"white", 
-                                  "markeredgecolor":"black", "markersize":"10"})
-        
-        # Añadir puntos individuales para ver la distribución
-        sns.stripplot(x='maquina', y='tiempo_fin', data=df_esclavos,
-                     jitter=True, size=4, color='black', alpha=0.3)
-        
-        # Añadir etiquetas con estadísticas para cada esclavo
-        for i, maquina in enumerate(sorted(df_esclavos['maquina'].unique())):
-            datos_maquina = df_esclavos[df_esclavos['maquina'] == maquina]['tiempo_fin']
-            
-            # Calcular estadísticas
-            promedio = datos_maquina.mean()
-            minimo = datos_maquina.min()
-            maximo = datos_maquina.max()
-            
-            # Añadir texto con estadísticas
-            plt.text(i, maximo * 1.05, 
-                     f"Prom: {promedio:.4f}s\nMin: {minimo:.4f}s\nMax: {maximo:.4f}s", 
-                     ha='center', va='bottom', fontsize=9, 
-                     bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.8))
-        
-        # Mejorar etiquetas y título
-        plt.title('Distribución de Tiempos de Ejecución por Esclavo', fontsize=16)
-        plt.xlabel('Máquina (Esclavo)', fontsize=14)
-        plt.ylabel('Tiempo de Ejecución (segundos)', fontsize=14)
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
-        
-        # Rotar etiquetas del eje x si hay muchas máquinas
-        if df_esclavos['maquina'].nunique() > 4:
-            plt.xticks(rotation=45, ha='right')
-        
-        plt.tight_layout()
-        
-        if save:
-            plt.savefig('tiempos_por_esclavo.png', dpi=300, bbox_inches='tight')
-            print("Gráfico guardado como 'tiempos_por_esclavo.png'")
-        else:
-            plt.show()
+        self._graficar('tiempos_esclavos', save, directorio)
     
-    def grafico_latencia_red(self, save=False):
+    def grafico_latencia_red(self, save=False, directorio='.'):
         """
         4. Genera un gráfico mostrando la latencia de red entre el maestro y los esclavos
         """
-        # Filtrar latencias válidas (eliminar valores negativos o extremadamente altos)
-        df_latencia = self.df[
-            (self.df['latencia'] >= 0) & 
-            (self.df['latencia'] < self.df['latencia'].quantile(0.95))  # Eliminar outliers
-        ].copy()
-        
-        # Crear figura
-        plt.figure(figsize=(12, 7))
-        
-        # Agrupar por máquina y hora
-        latencia_por_maquina_hora = df_latencia.groupby(['maquina', 'hora'])['latencia'].mean().reset_index()
-        
-        # Crear gráfico de líneas
-        sns.lineplot(
-            data=latencia_por_maquina_hora,
-            x='hora',
-            y='latencia',
-            hue='maquina',
-            marker='o',
-            markersize=8,
-            linewidth=2
-        )
-        
-        # Añadir etiquetas y título
-        plt.title('Latencia de Red Promedio por Hora y Máquina', fontsize=16)
-        plt.xlabel('Hora del Día', fontsize=14)
-        plt.ylabel('Latencia (segundos)', fontsize=14)
-        plt.grid(True, linestyle='--', alpha=0.7)
-        
-        # Ajustar eje X para mostrar todas las horas
-        plt.xticks(range(0, 24), rotation=0)
-        
-        # Añadir línea promedio general
-        plt.axhline(y=df_latencia['latencia'].mean(), color='red', linestyle='--', 
-                   label=f'Latencia promedio global: {df_latencia["latencia"].mean():.4f}s')
-        
-        plt.legend(title='Máquina', title_fontsize=12)
-        plt.tight_layout()
-        
-        if save:
-            plt.savefig('latencia_red.png', dpi=300, bbox_inches='tight')
-            print("Gráfico guardado como 'latencia_red.png'")
-        else:
-            plt.show()
+        self._graficar('latencia_red', save, directorio)
     
-    def grafico_tamanio_respuestas_hora(self, save=False):
+    def grafico_tamanio_respuestas_hora(self, save=False, directorio='.'):
         """
         5. Genera un gráfico de tamaño en MB de las respuestas por hora a través del día
         """
-        # Convertir KB a MB
-        self.df['tamanio_respuesta_mb'] = self.df['tamanio_respuesta_kb'] / 1024
-        
-        # Agrupar por fecha, hora y calcular suma de tamaños
-        tamanio_por_hora = self.df.groupby(['fecha', 'hora', 'dia_semana'])['tamanio_respuesta_mb'].sum().reset_index()
-        
-        # Crear figura
-        plt.figure(figsize=(14, 8))
-        
-        # Crear paleta de colores para diferentes días
-        dias_unicos = tamanio_por_hora['dia_semana'].unique()
-        paleta = sns.color_palette("husl", len(dias_unicos))
-        
-        # Crear mapeo de día a color
-        color_map = {dia: paleta[i] for i, dia in enumerate(dias_unicos)}
-        
-        # Agrupar por día de la semana
-        for dia in dias_unicos:
-            data_dia = tamanio_por_hora[tamanio_por_hora['dia_semana'] == dia]
-            
-            # Convertir fecha a string para etiquetas
-            data_dia['fecha_str'] = data_dia['fecha'].astype(str)
-            
-            # Para cada fecha de ese día
-            for fecha in data_dia['fecha'].unique():
-                data_fecha = data_dia[data_dia['fecha'] == fecha]
-                
-                # Graficar línea para esta fecha
-                plt.plot(data_fecha['hora'], data_fecha['tamanio_respuesta_mb'], 
-                        marker='o', linewidth=2, alpha=0.8,
-                        color=color_map[dia],
-                        label=f"{dia} ({fecha})")
-        
-        # Mejorar aspecto del gráfico
-        plt.title('Tamaño Total de Respuestas por Hora del Día', fontsize=16)
-        plt.xlabel('Hora del Día', fontsize=14)
-        plt.ylabel('Tamaño de Respuestas (MB)', fontsize=14)
-        plt.grid(True, linestyle='--', alpha=0.7)
-        
-        # Ajustar eje X para mostrar todas las horas
-        plt.xticks(range(0, 24))
-        
-        # Formatear eje Y para mostrar decimales con 2 dígitos
-        plt.gca().yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:.2f}'))
-        
-        # Ajustar leyenda
-        plt.legend(title='Día', bbox_to_anchor=(1.05, 1), loc='upper left')
-        
-        plt.tight_layout()
-        
-        if save:
-            plt.savefig('tamanio_respuestas_por_hora.png', dpi=300, bbox_inches='tight')
-            print("Gráfico guardado como 'tamanio_respuestas_por_hora.png'")
-        else:
-            plt.show()
+        self._graficar('tamanio_respuestas', save, directorio)
     
-    def generar_todos_los_graficos(self, directorio="analisis_logs"):
-        """Genera todos los gráficos solicitados y los guarda en un directorio"""
+    def generar_todos_los_graficos(self, directorio="analisis_logs", procesos=None, dpi=DPI):
+        """
+        Genera todos los gráficos y los guarda en `directorio`. Los datos de
+        cada gráfico se preparan una sola vez aquí (muestreados o agregados,
+        así pesan poco) y los gráficos se renderizan en paralelo en `procesos`
+        procesos (por defecto uno por gráfico, sin pasar la cantidad de CPUs).
+        """
         # Crear directorio si no existe
         if not os.path.exists(directorio):
             os.makedirs(directorio)
             print(f"Directorio '{directorio}' creado.")
         
-        # Guardar directorio actual y cambiar al nuevo
-        dir_actual = os.getcwd()
-        os.chdir(directorio)
-        
+        print("\nGenerando gráficos...")
         try:
-            print("\nGenerando gráficos...")
-            
-            # 1. Gráfico de torta de rangos etarios
-            self.grafico_torta_rangos_etarios(save=True)
-            
-            # 2. Curvas de score a través del tiempo
-            self.grafico_curvas_score_tiempo(ventanas=[3, 5, 10], save=True)
-            
-            # 3. Gráfico de cajas por esclavo
-            self.grafico_cajas_tiempo_esclavos(save=True)
-            
-            # 4. Latencia de red
-            self.grafico_latencia_red(save=True)
-            
-            # 5. Tamaño de respuestas por hora
-            self.grafico_tamanio_respuestas_hora(save=True)
-            
-            print(f"\nTodos los gráficos generados correctamente en '{directorio}'")
-            
+            tareas = {nombre: self._datos_grafico(nombre, ventanas=[3, 5, 10]) for nombre in GRAFICOS}
         except Exception as e:
-            print(f"Error al generar gráficos: {e}")
-        
-        # Volver al directorio original
-        os.chdir(dir_actual)
-
+            print(f"Error al preparar los datos de los gráficos: {e}")
+            return []
+        
+        procesos = procesos or min(len(tareas), os.cpu_count() or 1)
+        generados = []
+        errores = 0
+        if procesos <= 1:
+            for nombre, datos in tareas.items():
+                try:
+                    generados.append(renderizar(nombre, datos, directorio, dpi))
+                except Exception as e:
+                    errores += 1
+                    print(f"Error al generar el gráfico {GRAFICOS[nombre][2]}: {e}")
+        else:
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                futuros = {pool.submit(renderizar, nombre, datos, directorio, dpi): nombre
+                           for nombre, datos in tareas.items()}
+                for futuro in as_completed(futuros):
+                    try:
+                        generados.append(futuro.result())
+                    except Exception as e:
+                        errores += 1
+                        print(f"Error al generar el gráfico {GRAFICOS[futuros[futuro]][2]}: {e}")
+        
+        generados = [ruta for ruta in generados if ruta]
+        for ruta in sorted(generados):
+            print(f"Gráfico guardado como '{os.path.basename(ruta)}'")
+        if not errores:
+            print(f"\nTodos los gráficos generados correctamente en '{directorio}'")
+        return generados
+    
 
 # Ejecutar el script
 if __name__ == "__main__":
     try:
-        analyzer = AdvancedLogAnalyzer()
+        # Con LOG_DIR_SEGMENTOS se leen los segmentos por hora; LOG_DESDE/LOG_HASTA acotan la ventana
+        analyzer = AdvancedLogAnalyzer(
+            os.environ.get("LOG_DIR_SEGMENTOS") or 'logs.csv',
+            desde=os.environ.get("LOG_DESDE"),
+            hasta=os.environ.get("LOG_HASTA"),
+            incremental=os.environ.get("LOG_INCREMENTAL", "0") == "1",
+            por_bloques=os.environ.get("LOG_POR_BLOQUES", "0") == "1",
+            rollups_uri=os.environ.get("LOG_ROLLUPS_URI") or None
+        )
         
         print("\n=== ANALIZADOR DE LOGS AVANZADO ===")
         print("1. Gráfico de torta con porcentajes por rango etario")
@@ -378,7 +969,13 @@ if __name__ == "__main__":
         elif opcion == "5":
             analyzer.grafico_tamanio_respuestas_hora()
         elif opcion == "6":
-            analyzer.generar_todos_los_graficos()
+            # GRAFICOS_PROCESOS=1 renderiza en el mismo proceso; GRAFICOS_DPI baja la resolución
+            procesos = os.environ.get("GRAFICOS_PROCESOS")
+            analyzer.generar_todos_los_graficos(
+                directorio=os.environ.get("GRAFICOS_DIR", "analisis_logs"),
+                procesos=int(procesos) if procesos else None,
+                dpi=int(os.environ.get("GRAFICOS_DPI", DPI))
+            )
         elif opcion == "0":
             print("Saliendo...")
         else:
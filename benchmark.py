@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from utils import catalogo
+from utils.bench import comparar, metadatos, microbenchmarks
+from utils.carga import EntornoLocal, etapas_maestro, lazo_abierto, lazo_cerrado, resumir
+from utils.ranking import cargar_configuracion
+from utils.snapshot import compilar_snapshot, ruta_snapshot_de
+
+TIPOS = ("libros", "tesis", "videos", "papers")
+
+def vocabulario_de(tipo, terminos):
+    vocabulario = catalogo.cargar_vocabulario([os.path.join("esclavos", f"{tipo}.json")])
+    return catalogo.ampliar(vocabulario, terminos) if terminos else vocabulario
+
+def ruta_catalogo(destino, tipo, documentos, terminos, semilla):
+    return os.path.join(destino, f"{tipo}-{documentos}-t{terminos or 0}-s{semilla}.json")
+
+def asegurar_catalogo(destino, tipo, documentos, terminos, semilla, snapshot=False):
+    """Genera el catálogo sintético si no existe (es determinista, así que se reutiliza entre corridas)"""
+    os.makedirs(destino, exist_ok=True)
+    ruta = ruta_catalogo(destino, tipo, documentos, terminos, semilla)
+    if not os.path.exists(ruta):
+        inicio = time.perf_counter()
+        resumen = catalogo.escribir_catalogo(ruta, vocabulario_de(tipo, terminos), documentos, semilla)
+        print(f"{ruta}: {resumen['documentos']} documentos, {resumen['terminos']} términos, "
+              f"{resumen['bytes'] / (1024 * 1024):.1f} MB en {time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+    if snapshot and not os.path.exists(ruta_snapshot_de(ruta)):
+        compilar_snapshot(ruta, ruta_snapshot_de(ruta))
+    return ruta
+
+def escribir_resultado(resultado, salida):
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if salida:
+        with open(salida, 'w', encoding='utf-8') as f:
+            f.write(texto + "\n")
+        print(f"Resultados guardados en {salida}", file=sys.stderr)
+    else:
+        print(texto)
+
+def comando_catalogo(args):
+    for tipo in args.tipos:
+        asegurar_catalogo(args.destino, tipo, args.documentos, args.terminos, args.semilla, args.snapshot)
+
+def comando_micro(args):
+    rangos, intereses = cargar_configuracion("config/rango_etario.json", "config/intereses_por_categoria.json")
+    resultados = {}
+    for cantidad in args.documentos:
+        vocabulario = vocabulario_de(args.tipo, args.terminos)
+        documentos = [doc for bloque in catalogo.generar_documentos(vocabulario, cantidad, args.semilla)
+                      for doc in bloque]
+        consultas = catalogo.generar_consultas(vocabulario, args.consultas, args.semilla)
+        print(f"Microbenchmarks con {cantidad} documentos...", file=sys.stderr)
+        resultados.update(microbenchmarks(documentos, consultas, rangos, intereses, limite=args.limit,
+                                          max_lineal=args.max_lineal, repeticiones=args.repeticiones))
+    escribir_resultado({"tipo": "micro", "metadatos": metadatos(),
+                        "parametros": {"tipo": args.tipo, "terminos": args.terminos, "semilla": args.semilla,
+                                       "consultas": args.consultas},
+                        "resultados": resultados}, args.salida)
+
+def comando_carga(args):
+    colecciones = {tipo: asegurar_catalogo(args.destino, tipo, args.documentos, args.terminos, args.semilla,
+                                           args.snapshot)
+                   for tipo in args.tipos}
+    # Las consultas usan el vocabulario de todas las colecciones, como un usuario que no sabe dónde buscar
+    palabras = dict.fromkeys(palabra for tipo in args.tipos
+                             for palabra in vocabulario_de(tipo, args.terminos).palabras)
+    vocabulario = catalogo.Vocabulario(list(palabras), [])
+    consultas = catalogo.generar_consultas(vocabulario, args.consultas, args.semilla)
+    directorio = args.directorio or tempfile.mkdtemp(prefix="carga-")
+    resultados = {}
+    with EntornoLocal(colecciones, directorio, maestro=args.maestro, workers=args.workers) as entorno:
+        print(f"Sistema local listo en {entorno.url_maestro} (salida de los procesos en {directorio})",
+              file=sys.stderr)
+        url = entorno.url_maestro + "/query"
+        if args.modo == "cerrado":
+            for concurrencia in args.concurrencia:
+                muestras = asyncio.run(lazo_cerrado(url, consultas, concurrencia, args.duracion,
+                                                    args.calentamiento, args.limit))
+                resultados[f"cerrado/c{concurrencia}"] = resumir(muestras, args.duracion)
+                print(f"concurrencia {concurrencia}: {resultados[f'cerrado/c{concurrencia}']}", file=sys.stderr)
+        else:
+            for tasa in args.tasa:
+                muestras = asyncio.run(lazo_abierto(url, consultas, tasa, args.duracion, args.calentamiento,
+                                                    args.limit, semilla=args.semilla))
+                resultados[f"abierto/r{tasa:g}"] = resumir(muestras, args.duracion)
+                print(f"tasa {tasa:g}/s: {resultados[f'abierto/r{tasa:g}']}", file=sys.stderr)
+        etapas = etapas_maestro(entorno.url_maestro)
+    escribir_resultado({"tipo": "carga", "metadatos": metadatos(),
+                        "parametros": {"maestro": args.maestro, "modo": args.modo, "documentos": args.documentos,
+                                       "terminos": args.terminos, "tipos": args.tipos, "workers": args.workers,
+                                       "duracion": args.duracion, "calentamiento": args.calentamiento,
+                                       "limit": args.limit, "semilla": args.semilla, "consultas": args.consultas,
+                                       "cache_tamanio": os.environ.get("CACHE_TAMANIO")},
+                        "resultados": resultados, "etapas_maestro": etapas}, args.salida)
+
+def comando_comparar(args):
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.nuevo, 'r', encoding='utf-8') as f:
+        nuevo = json.load(f)
+    try:
+        filas = comparar(base, nuevo, args.tolerancia)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"Base: {base['metadatos'].get('commit')}  Nuevo: {nuevo['metadatos'].get('commit')}")
+    if base.get("parametros") != nuevo.get("parametros"):
+        print("Atención: las corridas usaron parámetros distintos")
+    regresiones = 0
+    for nombre, metrica, anterior, valor, cambio, regresion in filas:
+        regresiones += regresion
+        marca = "  REGRESIÓN" if regresion else ""
+        print(f"{nombre:45} {metrica:18} {anterior:>14g} -> {valor:<14g} {cambio:+8.1%}{marca}")
+    if regresiones:
+        sys.exit(f"{regresiones} regresiones por encima de {args.tolerancia:.0%}")
+    print(f"Sin regresiones por encima de {args.tolerancia:.0%}")
+
+def lista_enteros(texto):
+    return [int(valor) for valor in texto.split(",")]
+
+def lista_numeros(texto):
+    return [float(valor) for valor in texto.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Catálogos sintéticos, microbenchmarks y pruebas de carga")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    def opciones_catalogo(sub, documentos):
+        sub.add_argument("--terminos", type=int, default=None,
+                         help="palabras distintas en los títulos (por defecto las de la colección original)")
+        sub.add_argument("--semilla", type=int, default=0)
+        if documentos:
+            sub.add_argument("--documentos", type=int, default=100_000, help="documentos por colección")
+            sub.add_argument("--destino", default="catalogos_sinteticos", help="directorio de los catálogos")
+            sub.add_argument("--tipos", nargs="+", choices=TIPOS, default=list(TIPOS))
+            sub.add_argument("--snapshot", action="store_true", help="compilar también el snapshot binario")
+
+    sub = comandos.add_parser("catalogo", help="generar catálogos sintéticos a partir del vocabulario de esclavos/")
+    opciones_catalogo(sub, documentos=True)
+    sub.set_defaults(funcion=comando_catalogo)
+
+    sub = comandos.add_parser("micro", help="microbenchmarks de normalizar, calcular_puntaje y aplicar_ranking")
+    opciones_catalogo(sub, documentos=False)
+    sub.add_argument("--documentos", type=lista_enteros, default=[10_000, 100_000],
+                     help="tamaños de catálogo separados por coma")
+    sub.add_argument("--tipo", choices=TIPOS, default="libros", help="colección de la que se toma el vocabulario")
+    sub.add_argument("--consultas", type=int, default=20, help="consultas distintas por medición")
+    sub.add_argument("--limit", type=int, default=10)
+    sub.add_argument("--max-lineal", type=int, default=100_000,
+                     help="tamaño máximo para medir el ranking sin índice")
+    sub.add_argument("--repeticiones", type=int, default=5)
+    sub.add_argument("--salida", default=None, help="archivo JSON de resultados (por defecto stdout)")
+    sub.set_defaults(funcion=comando_micro)
+
+    sub = comandos.add_parser("carga", help="prueba de carga contra maestro y esclavos levantados localmente")
+    opciones_catalogo(sub, documentos=True)
+    sub.add_argument("--maestro", choices=("maestro.py", "maestro_async.py"), default="maestro.py")
+    sub.add_argument("--workers", type=int, default=1, help="WORKERS de cada esclavo")
+    sub.add_argument("--modo", choices=("cerrado", "abierto"), default="cerrado",
+                     help="cerrado: N clientes en serie; abierto: llegadas de Poisson a tasa fija")
+    sub.add_argument("--concurrencia", type=lista_enteros, default=[1, 8, 32],
+                     help="clientes simultáneos en modo cerrado, separados por coma")
+    sub.add_argument("--tasa", type=lista_numeros, default=[50.0, 200.0],
+                     help="consultas por segundo en modo abierto, separadas por coma")
+    sub.add_argument("--duracion", type=float, default=20.0, help="segundos medidos por punto")
+    sub.add_argument("--calentamiento", type=float, default=3.0, help="segundos iniciales que no se miden")
+    sub.add_argument("--consultas", type=int, default=5000, help="consultas distintas que se recorren")
+    sub.add_argument("--limit", type=int, default=10)
+    sub.add_argument("--directorio", default=None, help="directorio de trabajo (logs, salida de los procesos)")
+    sub.add_argument("--salida", default=None, help="archivo JSON de resultados (por defecto stdout)")
+    sub.set_defaults(funcion=comando_carga)
+
+    sub = comandos.add_parser("comparar", help="comparar dos resultados; termina con error si hay regresiones")
+    sub.add_argument("base")
+    sub.add_argument("nuevo")
+    sub.add_argument("--tolerancia", type=float, default=0.10, help="empeoramiento tolerado (0.10 = 10%%)")
+    sub.set_defaults(funcion=comando_comparar)
+
+    args = parser.parse_args()
+    args.funcion(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import argparse
+import time
+from utils.snapshot import compilar_snapshot, ruta_snapshot_de
+
+def main():
+    parser = argparse.ArgumentParser(description="Compila colecciones JSON a snapshots binarios para esclavo.py")
+    parser.add_argument("archivos", nargs="+", help="colecciones JSON, p. ej. esclavos/libros.json")
+    parser.add_argument("--salida", default=None, help="ruta del snapshot (solo con un archivo)")
+    args = parser.parse_args()
+    if args.salida and len(args.archivos) > 1:
+        parser.error("--salida solo se puede usar con un archivo")
+
+    for ruta_json in args.archivos:
+        destino = args.salida or ruta_snapshot_de(ruta_json)
+        inicio = time.perf_counter()
+        resumen = compilar_snapshot(ruta_json, destino)
+        print(f"{ruta_json} -> {destino}: {resumen['documentos']} documentos, {resumen['terminos']} términos, "
+              f"{resumen['bytes'] / (1024 * 1024):.1f} MB en {time.perf_counter() - inicio:.2f}s")
+
+if __name__ == "__main__":
+    main()
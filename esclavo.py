@@ -1,27 +1,172 @@
+import bisect
 import json
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import os
+import tempfile
 from utils import ranking
 import datetime
-import time
 import socket
-import Pyro5.api
+import signal
 import threading
+from collections import namedtuple
+import Pyro5.api
+from utils.envio_logs import EnviadorLogs
+from utils import particion
+from utils import snapshot
+from utils import trazas
+from utils.metricas import Metricas, PublicadorMetricas, formato_prometheus, resumen
+from utils.ranking_lote import aplicar_ranking_lote
+from utils.lotes import leer_lote
+from utils.prefork import Supervisor
 
 # Cargar configuración del esclavo desde variables de entorno
 ARCHIVO_DATOS = os.environ.get("ARCHIVO_DATOS", "esclavos/libros.json")
 PUERTO = int(os.environ.get("PUERTO", 5001))
 RANGO_ETARIO_PATH = os.environ.get("RANGO_ETARIO", "config/rango_etario.json")
 INTERESES_PATH = os.environ.get("INTERESES", "config/intereses_por_categoria.json")
+# Con colecciones particionadas (particionar.py) ARCHIVO_DATOS es el archivo del shard
+SHARD_ID = os.environ.get("SHARD_ID")
+NUM_SHARDS = int(os.environ.get("NUM_SHARDS", 1))
+# Método con que se particionó (el --metodo de particionar.py); decide el id de los documentos nuevos
+METODO_PARTICION = os.environ.get("METODO_PARTICION", "hash")
+# Snapshot binario compilado con compilar_indice.py; si falta o quedó viejo se usa el JSON
+ARCHIVO_SNAPSHOT = os.environ.get("ARCHIVO_SNAPSHOT") or snapshot.ruta_snapshot_de(ARCHIVO_DATOS)
+SNAPSHOT_VERIFICAR = os.environ.get("SNAPSHOT_VERIFICAR", "1") == "1"
+# Si se define, los endpoints /admin exigen la cabecera X-Admin-Token con este valor
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# Procesos que atienden consultas; con más de uno todos comparten el índice cargado antes del fork
+WORKERS = int(os.environ.get("WORKERS", 1))
+TIMEOUT_LATIDO = float(os.environ.get("TIMEOUT_LATIDO", 30.0))
+MAX_LOTE = int(os.environ.get("MAX_LOTE", 1000))  # consultas por petición a /query/batch
+# Percentiles de /metrics: ventana reciente en segundos y directorio donde
+# los workers dejan sus métricas para combinarlas (por defecto uno temporal)
+METRICAS_VENTANA = float(os.environ.get("METRICAS_VENTANA", 60.0))
+METRICAS_DIR = os.environ.get("METRICAS_DIR")
+# pid del supervisor cuando hay varios workers (lo heredan los workers)
+pid_supervisor = None
+publicador_metricas = None
 
-# Cargar datos
-try:
-    with open(ARCHIVO_DATOS, 'r', encoding='utf-8') as f:
-        documentos = json.load(f)
-    print(f"Datos cargados correctamente desde {ARCHIVO_DATOS}")
-except Exception as e:
-    print(f"Error al cargar datos: {e}")
-    documentos = []  # Usar una lista vacía como fallback
+def calcular_version_datos(ruta):
+    """Versión de los datos cargados, derivada de la fecha y tamaño del archivo"""
+    try:
+        info = os.stat(ruta)
+        return f"{info.st_mtime_ns:x}-{info.st_size:x}"
+    except OSError:
+        return "0"
+
+# Índice y versión de datos con que se atienden las consultas. Se reemplazan
+# juntos con una sola asignación, así una consulta nunca ve un índice a medio
+# actualizar. `ids` (MapaIds) se arma al cargar y lo usa solo /admin.
+EstadoDatos = namedtuple("EstadoDatos", ["indice", "version_base", "revision", "ids"])
+
+class MapaIds:
+    """
+    id del documento -> posición, para /admin. Se arma una vez al cargar y
+    cada cambio lo actualiza en el lugar (solo se usa con lock_admin tomado).
+    Mientras los ids sean enteros crecientes según la posición (sin campo
+    "id" el id es la posición, y particionar.py lo exige) se guardan en un
+    ArregloPorTramos y se buscan por bisección; si no, en un dict.
+    """
+    def __init__(self, ids, crecientes=None):
+        if crecientes is None:
+            crecientes = snapshot.ids_crecientes(ids)
+        self.ordenados = ranking.ArregloPorTramos("q", ids) if crecientes else None
+        self.eliminados = set()  # posiciones de ids ordenados que ya no existen
+        self.por_id = None if crecientes else {str(doc_id): posicion for posicion, doc_id in enumerate(ids)}
+
+    def posicion(self, doc_id):
+        """Posición del documento con ese id (el de la URL, como texto); KeyError si no existe"""
+        if self.por_id is not None:
+            return self.por_id[doc_id]
+        try:
+            valor = int(doc_id)
+        except ValueError:
+            raise KeyError(doc_id) from None
+        posicion = bisect.bisect_left(self.ordenados, valor)
+        if (str(valor) != doc_id or posicion == len(self.ordenados) or self.ordenados[posicion] != valor
+                or posicion in self.eliminados):
+            raise KeyError(doc_id)
+        return posicion
+
+    def __len__(self):
+        """Documentos vivos: el índice conserva los lugares de los eliminados"""
+        if self.por_id is not None:
+            return len(self.por_id)
+        return len(self.ordenados) - len(self.eliminados)
+
+    def __contains__(self, doc_id):
+        try:
+            self.posicion(str(doc_id))
+        except KeyError:
+            return False
+        return True
+
+    def quitar(self, doc_id):
+        posicion = self.posicion(doc_id)
+        if self.por_id is not None:
+            del self.por_id[doc_id]
+        else:
+            self.eliminados.add(posicion)
+        return posicion
+
+    def ultimo(self):
+        """Mayor id entero asignado (aunque se haya eliminado); None si los ids no son enteros crecientes"""
+        if self.por_id is not None or not len(self.ordenados):
+            return None
+        return self.ordenados[-1]
+
+    def agregar(self, doc_id, posicion):
+        """Registra un documento nuevo, que siempre va al final del índice"""
+        if self.por_id is None:
+            ultimo = self.ultimo()
+            if (isinstance(doc_id, int) and not isinstance(doc_id, bool)
+                    and (ultimo is None or doc_id > ultimo) and posicion == len(self.ordenados)):
+                self.ordenados.append(doc_id)
+                return
+            # Un id fuera de orden: se pasa al dict (una sola vez)
+            self.por_id = {str(valor): numero for numero, valor in enumerate(self.ordenados)
+                           if numero not in self.eliminados}
+            self.ordenados = None
+        self.por_id[str(doc_id)] = posicion
+
+def version_de(estado_datos):
+    """Versión informada a /health y al maestro: la del archivo más los cambios aplicados por /admin"""
+    if estado_datos.revision == 0:
+        return estado_datos.version_base
+    return f"{estado_datos.version_base}-r{estado_datos.revision}"
+
+def cargar_datos():
+    """Carga ARCHIVO_DATOS (o su snapshot) y construye el índice"""
+    # Primero el snapshot mapeado en memoria, que no requiere parsear nada
+    indice = snapshot.abrir_snapshot(ARCHIVO_SNAPSHOT, ARCHIVO_DATOS, verificar=SNAPSHOT_VERIFICAR)
+    if indice is not None:
+        print(f"Snapshot mapeado desde {ARCHIVO_SNAPSHOT}: {len(indice)} documentos, {len(indice.postings)} términos")
+        ids = MapaIds(indice.ids_documentos(), crecientes=indice.ids is not None)
+        return EstadoDatos(indice, indice.version_datos, 0, ids)
+
+    version = calcular_version_datos(ARCHIVO_DATOS)
+    try:
+        with open(ARCHIVO_DATOS, 'r', encoding='utf-8') as f:
+            documentos = json.load(f)
+        print(f"Datos cargados correctamente desde {ARCHIVO_DATOS}")
+    except Exception as e:
+        print(f"Error al cargar datos: {e}")
+        documentos = []  # Usar una lista vacía como fallback
+
+    # Construir el índice una sola vez: títulos y categorías normalizados + posting lists
+    indice = ranking.construir_indice(documentos)
+    print(f"Índice construido: {len(indice)} documentos, {len(indice.postings)} términos")
+    ids = MapaIds([doc.get("id", posicion) for posicion, doc in enumerate(documentos)])
+    return EstadoDatos(indice, version, 0, ids)
+
+estado = cargar_datos()
+# Los cambios por /admin se aplican de a uno; las consultas no toman este lock
+lock_admin = threading.Lock()
+if SHARD_ID is not None:
+    print(f"Sirviendo el shard {SHARD_ID} de {NUM_SHARDS} ({len(estado.indice)} documentos)")
+    if estado.ids.por_id is not None:
+        print("Advertencia: los ids del shard no son enteros crecientes; el maestro no podrá desempatar "
+              "bien y /admin no aceptará documentos nuevos. Vuelva a generarlo con particionar.py")
 
 try:
     rangos, intereses = ranking.cargar_configuracion(RANGO_ETARIO_PATH, INTERESES_PATH)
@@ -33,41 +178,70 @@ except Exception as e:
 # Configurar timeout para Pyro
 Pyro5.config.COMMTIMEOUT = 5.0
 
-# Thread-local storage para mantener un proxy por hilo
-thread_local = threading.local()
+# Histogramas por etapa y contadores que expone /metrics
+metricas = Metricas(ventana=METRICAS_VENTANA)
 
-def get_logger_proxy():
-    """
-    Obtiene un proxy para el logger, creando uno nuevo si no existe
-    para el hilo actual.
-    """
-    if not hasattr(thread_local, 'logger_proxy'):
-        thread_local.logger_proxy = Pyro5.api.Proxy("PYRONAME:centralizado.logger")
-    return thread_local.logger_proxy
+# Envío de logs en segundo plano y por lotes: la consulta solo encola el registro
+enviador_logs = EnviadorLogs(
+    capacidad=int(os.environ.get("LOG_CAPACIDAD", 10000)),
+    tamanio_lote=int(os.environ.get("LOG_LOTE", 100)),
+    intervalo=float(os.environ.get("LOG_INTERVALO", 1.0)),
+    politica=os.environ.get("LOG_POLITICA", "descartar_nuevos"),
+    metricas=metricas,
+    desborde=os.environ.get("LOG_DESBORDE_DIR", ".desborde_logs") or None,
+    max_desborde=int(os.environ.get("LOG_DESBORDE_MAX_MB", 64)) * 1024 * 1024,
+    fallos_apertura=int(os.environ.get("LOG_FALLOS_APERTURA", 3)),
+    espera_maxima=float(os.environ.get("LOG_ESPERA_MAXIMA", 60.0))
+)
 
 # Servidor Flask
 app = Flask(__name__)
 
+def responder_trazado(response, cronometro, trace_id, actual, endpoint):
+    """Cabeceras comunes de /query y /query/batch: versión de datos, traza y duración de cada etapa"""
+    metricas.observar_etapas("etapa_segundos", cronometro.etapas, endpoint=endpoint)
+    metricas.observar("peticion_segundos", cronometro.total(), endpoint=endpoint)
+    metricas.contar("peticiones", endpoint=endpoint)
+    response.headers["X-Version-Datos"] = version_de(actual)
+    response.headers[trazas.CABECERA_TRAZA] = trace_id
+    # El maestro resta estas etapas a su ida y vuelta para obtener la latencia de red
+    response.headers["Server-Timing"] = trazas.server_timing(cronometro.etapas)
+    return response
+
 @app.route("/query", methods=["GET"])
 def query():
+    cronometro = trazas.Cronometro()
+    trace_id = trazas.trace_id_de(request.headers.get(trazas.CABECERA_TRAZA))
     consulta_titulo = request.args.get("titulo", "")
     edad = request.args.get("edad", type=int)
     if edad is None:
-        edad = 30  # Valor por defecto
+        edad = ranking.EDAD_POR_DEFECTO  # Valor por defecto
+    # Paginación: solo se devuelve el top-k solicitado en vez de todo el catálogo
+    limite = request.args.get("limit", type=int)
+    desplazamiento = request.args.get("offset", default=0, type=int)
+    if (limite is not None and limite < 0) or desplazamiento < 0:
+        return jsonify({"error": "limit y offset deben ser enteros no negativos"}), 400
     
     timestamp_ini = datetime.datetime.now().isoformat()
-    inicio = time.time()
+    # Toda la consulta usa el mismo estado aunque /admin lo reemplace mientras tanto
+    actual = estado
+    cronometro.marcar("parse")
 
     try:
-        resultados = ranking.aplicar_ranking(documentos, consulta_titulo, edad, rangos, intereses)
+        resultados = ranking.aplicar_ranking(None, consulta_titulo, edad, rangos, intereses, indice=actual.indice,
+                                             limite=limite, desplazamiento=desplazamiento)
     except Exception as e:
         print(f"Error al aplicar ranking: {e}")
+        metricas.contar("errores", endpoint="query")
         resultados = []
 
-    fin = time.time()
+    cronometro.marcar("rank")
     timestamp_fin = datetime.datetime.now().isoformat()
-    tiempo_total = fin - inicio
+    tiempo_total = cronometro.etapas["rank"]
     score = resultados[0]["score"] if resultados else 0
+    response = jsonify(resultados)
+    bytes_respuesta = len(response.get_data())
+    cronometro.marcar("serializar")
     rango_etario = f"{edad}"
 
     # Log al Servidor
@@ -79,28 +253,294 @@ def query():
         "query": consulta_titulo,
         "tiempo_fin": round(tiempo_total, 4),
         "score": score,
-        "rango_etario": rango_etario
+        "rango_etario": rango_etario,
+        "trace_id": trace_id,
+        "bytes_respuesta": bytes_respuesta,
+        # La etapa "log" termina después de armar el registro: solo va en Server-Timing
+        "etapas": trazas.formatear_etapas(cronometro.etapas)
     }
     
+    # Log al Servidor (asíncrono, no espera la ida y vuelta de Pyro)
+    if not enviador_logs.enviar(log):
+        print("Cola de logs llena: registro descartado")
+    cronometro.marcar("log")
+
+    return responder_trazado(response, cronometro, trace_id, actual, "query")
+
+@app.route("/query/batch", methods=["POST"])
+def query_batch():
+    """Puntúa muchas consultas en una pasada; cada resultado es idéntico al de /query"""
+    cronometro = trazas.Cronometro()
+    trace_id = trazas.trace_id_de(request.headers.get(trazas.CABECERA_TRAZA))
+    consultas, limite, desplazamiento, error = leer_lote(request.get_json(silent=True), MAX_LOTE)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    consultas = [(titulo, ranking.EDAD_POR_DEFECTO if edad is None else edad) for titulo, edad in consultas]
+
+    timestamp_ini = datetime.datetime.now().isoformat()
+    actual = estado
+    cronometro.marcar("parse")
     try:
-        # Obtener el proxy específico para este hilo
-        log_servidor = get_logger_proxy()
-        log_servidor.registro(log)  # Llama al método registro con el diccionario log
-        print(f"Log enviado al servidor: {log}")
+        resultados = aplicar_ranking_lote(consultas, rangos, intereses, actual.indice,
+                                          limite=limite, desplazamiento=desplazamiento)
     except Exception as e:
-        # Si hay un error con el proxy, limpiarlo para forzar recreación
-        if hasattr(thread_local, 'logger_proxy'):
-            delattr(thread_local, 'logger_proxy')
-        print(f"Error al registrar el log: {e}")
-        print(f"Detalles del error: {type(e)}")
+        print(f"Error al aplicar ranking por lotes: {e}")
+        metricas.contar("errores", endpoint="batch")
+        return jsonify({"error": "Error al aplicar ranking"}), 500
+    cronometro.marcar("rank")
+    tiempo_total = cronometro.etapas["rank"]
+    timestamp_fin = datetime.datetime.now().isoformat()
+    response = jsonify(resultados)
+    bytes_respuesta = len(response.get_data())
+    cronometro.marcar("serializar")
+
+    # Un registro por consulta, con el tiempo y los bytes del lote repartidos entre todas
+    # (un lote vacío no deja registros)
+    etapas = trazas.formatear_etapas({etapa: duracion / len(consultas)
+                                      for etapa, duracion in cronometro.etapas.items()}) if consultas else None
+    descartados = 0
+    for (titulo, edad), resultados_consulta in zip(consultas, resultados):
+        log = {
+            "timestamp_ini": timestamp_ini,
+            "timestamp_fin": timestamp_fin,
+            "maquina": socket.gethostname(),
+            "tipo_maquina": "esclavo",
+            "query": titulo,
+            "tiempo_fin": round(tiempo_total / len(consultas), 4),
+            "score": resultados_consulta[0]["score"] if resultados_consulta else 0,
+            "rango_etario": f"{edad}",
+            "trace_id": trace_id,
+            "bytes_respuesta": bytes_respuesta // len(consultas),
+            "etapas": etapas
+        }
+        if not enviador_logs.enviar(log):
+            descartados += 1
+    if descartados:
+        print(f"Cola de logs llena: {descartados} registros del lote descartados")
+    cronometro.marcar("log")
+    metricas.contar("consultas_lote", len(consultas))
 
-    return jsonify(resultados)
+    return responder_trazado(response, cronometro, trace_id, actual, "batch")
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Percentiles p50/p95/p99 por etapa (ventana reciente) y contadores, en
+    formato de Prometheus o con ?formato=json. Con varios workers se
+    combinan las métricas de todos.
+    """
+    foto = publicador_metricas.foto_combinada() if publicador_metricas else metricas.a_dict()
+    if request.args.get("formato") == "json":
+        return jsonify(resumen(foto))
+    envio = enviador_logs.estadisticas()
+    medidores = {
+        "logs_en_cola": ("gauge", envio["en_cola"]),
+        "logs_enviados_total": ("counter", envio["enviados"]),
+        "logs_descartados_total": ("counter", envio["descartados"]),
+        "logs_errores_envio_total": ("counter", envio["errores_envio"]),
+        "logs_desbordados_total": ("counter", envio["desbordados"]),
+        "logs_reenviados_total": ("counter", envio["reenviados"]),
+        "logs_lotes_envenenados_total": ("counter", envio["lotes_envenenados"]),
+        "logs_interruptor_abierto": ("gauge", int(envio["interruptor"] == "abierto")),
+        "documentos": ("gauge", len(estado.ids))
+    }
+    return Response(formato_prometheus(foto, "esclavo", medidores), mimetype="text/plain; version=0.0.4")
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok", "message": "Esclavo funcionando correctamente"})
+    return jsonify({"status": "ok", "message": "Esclavo funcionando correctamente",
+                    "version_datos": version_de(estado),
+                    "shard": {"id": int(SHARD_ID), "total": NUM_SHARDS} if SHARD_ID is not None else None,
+                    "proceso": {"pid": os.getpid(), "workers": WORKERS},
+                    "envio_logs": enviador_logs.estadisticas()})
+
+def siguiente_id_shard(ids):
+    """
+    Menor id que puede tomar un documento nuevo en este shard. Tiene que ser
+    mayor que todos los del shard, así la posición sigue el orden de los ids
+    y el desempate local coincide con el del maestro.
+    """
+    if ids.por_id is not None:
+        raise ValueError("Los ids de este shard no son enteros crecientes; vuelva a generarlo con particionar.py")
+    if METODO_PARTICION == "rango":
+        # Los ids nuevos son mayores que los de toda la colección, así que van al último rango
+        if int(SHARD_ID) != NUM_SHARDS - 1:
+            raise ValueError(f"Con partición por rango solo el último shard ({NUM_SHARDS - 1}) acepta documentos nuevos")
+        if ids.ultimo() is None:
+            raise ValueError("El último shard está vacío: no se puede saber el siguiente id de la colección")
+    ultimo = ids.ultimo()
+    return 0 if ultimo is None else ultimo + 1
+
+def id_nuevo_shard(doc, minimo):
+    """
+    Id de un documento nuevo en este shard: el indicado o el siguiente libre.
+    Con hash tiene que caer en este shard; como ningún otro shard puede
+    tenerlo, el id queda único en toda la colección.
+    """
+    if "id" not in doc:
+        doc_id = minimo
+        while METODO_PARTICION == "hash" and particion.shard_de(doc_id, None, NUM_SHARDS) != int(SHARD_ID):
+            doc_id += 1
+        return doc_id
+    doc_id = doc["id"]
+    if doc_id < minimo:
+        raise ValueError(f"El id {doc_id} no es mayor que los del shard (el siguiente libre es {minimo})")
+    if METODO_PARTICION == "hash" and particion.shard_de(doc_id, None, NUM_SHARDS) != int(SHARD_ID):
+        raise ValueError(f"El id {doc_id} corresponde al shard {particion.shard_de(doc_id, None, NUM_SHARDS)}")
+    return doc_id
+
+def aplicar_cambios(agregar=(), reemplazar=None, eliminar=()):
+    """
+    Arma un índice nuevo con los cambios (copiando solo lo afectado) y lo
+    publica de una vez junto a la nueva versión. Devuelve el estado nuevo.
+    Lanza KeyError si un id a reemplazar o eliminar no existe y ValueError
+    si un documento nuevo repite un id o, con shards, no puede ir en este.
+    """
+    global estado
+    with lock_admin:
+        actual = estado
+        ids = actual.ids
+        # Primero se valida todo y se arma el índice nuevo; el mapa de ids (compartido
+        # con el estado publicado) se modifica recién cuando el cambio ya no puede fallar
+        posiciones_reemplazo = {}
+        posiciones_eliminar = [ids.posicion(doc_id) for doc_id in eliminar]
+        for doc_id, doc in (reemplazar or {}).items():
+            posicion = ids.posicion(doc_id)
+            anterior = actual.indice.documento(posicion)
+            if "id" in anterior:
+                doc["id"] = anterior["id"]
+            posiciones_reemplazo[posicion] = doc
+        total = len(actual.indice)
+        nuevos = set()
+        minimo = siguiente_id_shard(ids) if SHARD_ID is not None and agregar else None
+        for numero, doc in enumerate(agregar):
+            if minimo is not None:
+                doc["id"] = id_nuevo_shard(doc, minimo)
+                minimo = doc["id"] + 1
+            else:
+                # Sin id explícito el documento toma su posición, igual que los de la colección
+                doc.setdefault("id", total + numero)
+            if doc["id"] in ids or str(doc["id"]) in nuevos:
+                raise ValueError(f"Ya existe un documento con id {doc['id']}")
+            nuevos.add(str(doc["id"]))
+
+        indice, _ = actual.indice.con_cambios(agregar=agregar, reemplazar=posiciones_reemplazo,
+                                              eliminar=posiciones_eliminar)
+        for doc_id in eliminar:
+            ids.quitar(doc_id)
+        for numero, doc in enumerate(agregar):
+            ids.agregar(doc["id"], total + numero)
+        estado = EstadoDatos(indice, actual.version_base, actual.revision + 1, ids)
+        return estado
+
+def respuesta_admin(estado_datos, ids, codigo=200):
+    response = jsonify({"version_datos": version_de(estado_datos), "ids": ids})
+    response.headers["X-Version-Datos"] = version_de(estado_datos)
+    return response, codigo
+
+def validar_admin():
+    """Devuelve una respuesta de error si la petición no está autorizada"""
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "No autorizado"}), 401
+    return None
+
+def cambios_no_compartidos():
+    """Con varios workers un cambio por documento quedaría solo en el proceso que lo recibe"""
+    if pid_supervisor is not None:
+        return jsonify({"error": "Con WORKERS > 1 los cambios por documento no se comparten entre workers; "
+                                 "actualice ARCHIVO_DATOS y use /admin/recargar"}), 409
+    return None
+
+def documento_valido(doc):
+    """El índice normaliza "titulo" y "categoria": tienen que ser texto"""
+    return (isinstance(doc, dict) and isinstance(doc.get("titulo"), str)
+            and isinstance(doc.get("categoria", ""), str))
+
+def documentos_validos(cuerpo):
+    documentos_nuevos = cuerpo if isinstance(cuerpo, list) else [cuerpo]
+    if not documentos_nuevos or not all(documento_valido(doc) for doc in documentos_nuevos):
+        return None
+    return documentos_nuevos
+
+@app.route("/admin/documentos", methods=["POST"])
+def agregar_documentos():
+    """Agrega uno o varios documentos (objeto o lista de objetos con al menos "titulo")"""
+    error = validar_admin() or cambios_no_compartidos()
+    if error:
+        return error
+    documentos_nuevos = documentos_validos(request.get_json(silent=True))
+    if documentos_nuevos is None:
+        return jsonify({"error": "Se esperaba un documento o una lista de documentos con 'titulo' "
+                                 "(y 'categoria', si está) de texto"}), 400
+    if SHARD_ID is not None and not all(particion.id_valido(doc.get("id", 0)) for doc in documentos_nuevos):
+        # El maestro desempata por id entre shards: tienen que ser enteros comparables
+        return jsonify({"error": "En un shard los ids de los documentos deben ser enteros"}), 400
+    try:
+        nuevo = aplicar_cambios(agregar=documentos_nuevos)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return respuesta_admin(nuevo, [doc["id"] for doc in documentos_nuevos], 201)
+
+@app.route("/admin/documentos/<doc_id>", methods=["PUT", "DELETE"])
+def modificar_documento(doc_id):
+    """Reemplaza (PUT) o elimina (DELETE) el documento con ese id"""
+    error = validar_admin() or cambios_no_compartidos()
+    if error:
+        return error
+    if request.method == "DELETE":
+        cambios = {"eliminar": [doc_id]}
+    else:
+        documentos_nuevos = documentos_validos(request.get_json(silent=True))
+        if documentos_nuevos is None or len(documentos_nuevos) != 1:
+            return jsonify({"error": "Se esperaba un documento con 'titulo' (y 'categoria', si está) de texto"}), 400
+        cambios = {"reemplazar": {doc_id: documentos_nuevos[0]}}
+    try:
+        nuevo = aplicar_cambios(**cambios)
+    except KeyError:
+        return jsonify({"error": f"No existe un documento con id {doc_id}"}), 404
+    return respuesta_admin(nuevo, [doc_id])
+
+def recargar_estado():
+    global estado
+    with lock_admin:
+        nuevo = cargar_datos()
+        if estado.revision:
+            # La numeración sigue creciendo para que una versión nunca se repita con otro contenido
+            nuevo = nuevo._replace(revision=estado.revision + 1)
+        estado = nuevo
+    return nuevo
+
+@app.route("/admin/recargar", methods=["POST"])
+def recargar():
+    """Vuelve a cargar ARCHIVO_DATOS completo; las consultas siguen con el índice anterior hasta el cambio"""
+    error = validar_admin()
+    if error:
+        return error
+    if pid_supervisor is not None:
+        # El supervisor recarga una vez y reemplaza los workers de a uno
+        os.kill(pid_supervisor, signal.SIGHUP)
+        return jsonify({"recarga": "en curso", "version_datos": version_de(estado)}), 202
+    return respuesta_admin(recargar_estado(), [])
 
 if __name__ == "__main__":
     print(f"Iniciando servidor en puerto {PUERTO}...")
-    # Ejecutar sin modo debug
-    app.run(host="0.0.0.0", port=PUERTO, debug=False, threaded=True)
\ No newline at end of file
+    if WORKERS > 1:
+        pid_supervisor = os.getpid()
+        directorio_metricas = METRICAS_DIR or tempfile.mkdtemp(prefix="metricas-esclavo-")
+        os.makedirs(directorio_metricas, exist_ok=True)
+        publicador_metricas = PublicadorMetricas(metricas, directorio_metricas)
+
+        def terminar_worker():
+            publicador_metricas.cerrar()
+            enviador_logs.cerrar()
+
+        supervisor = Supervisor(app, "0.0.0.0", PUERTO, workers=WORKERS, al_recargar=recargar_estado,
+                                al_iniciar_worker=publicador_metricas.iniciar, al_terminar_worker=terminar_worker,
+                                timeout_latido=TIMEOUT_LATIDO)
+        supervisor.ejecutar()
+    else:
+        # Apagado limpio también con SIGTERM: app.run termina con KeyboardInterrupt
+        # y los atexit (envío de los logs pendientes) se ejecutan
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        # Ejecutar sin modo debug
+        app.run(host="0.0.0.0", port=PUERTO, debug=False, threaded=True)
\ No newline at end of file
@@ -1,13 +1,314 @@
 import Pyro5.api
 import threading
 import datetime
-import copy
 import csv
 import os
+import signal
+import itertools
+from collections import deque
+from utils import segmentos
+from utils.rollups import RollupsPorMinuto, DIMENSIONES
+
+# Las últimas columnas vienen del trazado de punta a punta: id de traza,
+# réplica llamada (registros del maestro), latencia de red y bytes medidos,
+# y la duración de cada etapa
+CAMPOS_LOG = ['timestamp_ini', 'timestamp_fin', 'maquina', 'tipo_maquina',
+              'query', 'tiempo_fin', 'score', 'rango_etario',
+              'trace_id', 'destino', 'latencia_red', 'bytes_respuesta', 'etapas']
+CAMPOS_TRAZA = CAMPOS_LOG[8:]
+
+MODOS_DURABILIDAD = ("registro", "periodico", "cierre")
+
+# Máximo de registros que se devuelven en una sola lectura paginada
+LIMITE_LECTURA = 1000
+# Máximo de registros del buffer en memoria que revisa una lectura filtrada
+# (con el lock tomado); si no alcanza, se sigue desde el cursor devuelto
+LIMITE_EXAMINADOS = 10 * LIMITE_LECTURA
+
+def coincide_filtros(registro, desde=None, hasta=None, maquina=None, tipo_maquina=None, query=None,
+                     trace_id=None):
+    """
+    Aplica los filtros de lectura a un registro (diccionario). `desde` y
+    `hasta` son timestamps ISO comparados contra timestamp_ini; `query`
+    busca una subcadena sin distinguir mayúsculas y `trace_id` junta los
+    registros del maestro y de los esclavos de una misma consulta.
+    """
+    timestamp = str(registro.get('timestamp_ini', ''))
+    if desde is not None and timestamp < desde:
+        return False
+    if hasta is not None and timestamp >= hasta:
+        return False
+    if maquina is not None and registro.get('maquina') != maquina:
+        return False
+    if tipo_maquina is not None and registro.get('tipo_maquina') != tipo_maquina:
+        return False
+    if query is not None and query.lower() not in str(registro.get('query', '')).lower():
+        return False
+    if trace_id is not None and registro.get('trace_id') != trace_id:
+        return False
+    return True
+
+def iterar_csv_con_posicion(ruta, desplazamiento=0):
+    """
+    Recorre un CSV de logs desde un byte dado sin cargarlo completo.
+    Produce (registro, posicion_siguiente) para poder retomar la lectura.
+    """
+    with segmentos.abrir_segmento(ruta) as file:
+        encabezado = file.readline()
+        campos = next(csv.reader([encabezado.decode('utf-8')]))
+        if desplazamiento > file.tell():
+            file.seek(desplazamiento)
+        posicion = [file.tell()]
+
+        def lineas():
+            # Cuenta los bytes consumidos para conocer la posición tras cada fila
+            for linea in iter(file.readline, b''):
+                posicion[0] += len(linea)
+                yield linea.decode('utf-8')
+
+        for fila in csv.reader(lineas()):
+            if fila:
+                yield dict(zip(campos, fila)), posicion[0]
+
+class EscritorAgrupado:
+    """
+    Escritor CSV con commit agrupado: mantiene el archivo abierto y acumula
+    registros en un buffer que se vuelca al llegar a `tamanio_buffer`
+    registros o cada `intervalo` segundos.
+    Modos de durabilidad:
+      - registro: cada registro se escribe y se hace fsync antes de volver.
+      - periodico: fsync en cada volcado del buffer.
+      - cierre: los volcados solo llegan al sistema operativo; fsync al cerrar.
+    """
+    def __init__(self, ruta, campos=CAMPOS_LOG, modo="periodico", tamanio_buffer=500, intervalo=1.0):
+        if modo not in MODOS_DURABILIDAD:
+            raise ValueError(f"Modo de durabilidad desconocido: {modo}")
+        self.ruta = ruta
+        self.modo = modo
+        self.tamanio_buffer = tamanio_buffer
+        self.intervalo = intervalo
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.campos = campos
+        self.volcados = 0
+        self.registros_escritos = 0
+        self.file = None
+        self._abrir(ruta)
+
+        self.detener = threading.Event()
+        self.hilo = threading.Thread(target=self._ciclo, name="volcado-logs", daemon=True)
+        self.hilo.start()
+
+    def _abrir(self, ruta):
+        self._rotar_si_cambio_encabezado(ruta)
+        nuevo = not os.path.exists(ruta) or os.path.getsize(ruta) == 0
+        self.file = open(ruta, 'a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.campos)
+        if nuevo:
+            self.writer.writeheader()
+            self._sincronizar(forzar=True)
+
+    def _rotar_si_cambio_encabezado(self, ruta):
+        """
+        Un archivo con otras columnas (de una versión anterior) no se sigue
+        escribiendo: las filas nuevas no coincidirían con su encabezado. Se
+        renombra agregando la fecha y se empieza un archivo nuevo.
+        """
+        if not os.path.exists(ruta) or os.path.getsize(ruta) == 0:
+            return
+        with open(ruta, 'r', newline='', encoding='utf-8') as f:
+            encabezado = next(csv.reader([f.readline()]), [])
+        if encabezado == list(self.campos):
+            return
+        base, extension = os.path.splitext(ruta)
+        destino = f"{base}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}{extension}"
+        os.replace(ruta, destino)
+        print(f"{ruta} tenía otras columnas; se renombró a {destino}")
+
+    def escribir(self, registros):
+        """Agrega uno o más registros (diccionarios) al buffer"""
+        with self.lock:
+            self.buffer.extend(registros)
+            if self.modo == "registro" or len(self.buffer) >= self.tamanio_buffer:
+                self._volcar()
+
+    def _volcar(self):
+        # Se llama con self.lock tomado
+        if not self.buffer:
+            return
+        escritos = 0
+        try:
+            for registro in self.buffer:
+                self.writer.writerow(registro)
+                escritos += 1
+        finally:
+            # Si falla a mitad de camino, las filas ya escritas salen del buffer
+            # para que el próximo volcado no las repita
+            del self.buffer[:escritos]
+            self.registros_escritos += escritos
+        self.volcados += 1
+        self._sincronizar()
+
+    def _sincronizar(self, forzar=False):
+        self.file.flush()
+        if forzar or self.modo != "cierre":
+            os.fsync(self.file.fileno())
+
+    def _ciclo(self):
+        while not self.detener.wait(self.intervalo):
+            try:
+                self.volcar()
+            except (OSError, ValueError) as e:
+                print(f'Error al volcar logs a disco: {e}')
+
+    def volcar(self):
+        with self.lock:
+            self._volcar()
+
+    def cerrar(self):
+        self.detener.set()
+        self.hilo.join(timeout=self.intervalo + 1)
+        with self.lock:
+            if self.file is None or self.file.closed:
+                return
+            self._volcar()
+            self._sincronizar(forzar=True)
+            self.file.close()
+
+    def estadisticas(self):
+        with self.lock:
+            return {
+                "modo": self.modo,
+                "en_buffer": len(self.buffer),
+                "registros_escritos": self.registros_escritos,
+                "volcados": self.volcados
+            }
+
+class EscritorSegmentado(EscritorAgrupado):
+    """
+    Variante de EscritorAgrupado que particiona el historial por hora en
+    `directorio`. Un segmento se cierra al cambiar la hora o al superar
+    `tamanio_maximo` bytes; los segmentos cerrados se comprimen con gzip.
+    El manifest guarda los límites de timestamp_ini y las filas de cada
+    segmento para que los lectores solo abran los que necesitan.
+    """
+    def __init__(self, directorio, campos=CAMPOS_LOG, modo="periodico", tamanio_buffer=500, intervalo=1.0,
+                 tamanio_maximo=64 * 1024 * 1024, comprimir=True):
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        self.tamanio_maximo = tamanio_maximo
+        self.comprimir = comprimir
+        self.segmento = None  # entrada del manifest del segmento abierto
+        self.hora_segmento = None
+        self.manifest = segmentos.leer_manifest(directorio)
+
+        # Lo que quedó abierto en una ejecución anterior ya no recibirá registros
+        pendientes = []
+        for entrada in self.manifest["segmentos"]:
+            entrada["abierto"] = False
+            if comprimir and not entrada.get("comprimido"):
+                pendientes.append(entrada)
+        segmentos.guardar_manifest(directorio, self.manifest)
+
+        super().__init__(None, campos=campos, modo=modo, tamanio_buffer=tamanio_buffer, intervalo=intervalo)
+        for entrada in pendientes:
+            self._comprimir_en_fondo(entrada)
+
+    def _abrir(self, ruta):
+        # Los segmentos se abren recién cuando hay registros que escribir
+        pass
+
+    def _abrir_segmento(self, ahora):
+        hora = segmentos.inicio_de_hora(ahora)
+        existentes = {entrada["archivo"].removesuffix(".gz") for entrada in self.manifest["segmentos"]}
+        parte = 0
+        while (segmentos.nombre_segmento(hora, parte) in existentes
+               or os.path.exists(os.path.join(self.directorio, segmentos.nombre_segmento(hora, parte)))):
+            parte += 1
+        nombre = segmentos.nombre_segmento(hora, parte)
+        self.ruta = os.path.join(self.directorio, nombre)
+        super()._abrir(self.ruta)
+        self.hora_segmento = hora
+        self.segmento = {"archivo": nombre, "inicio": None, "fin": None, "filas": 0,
+                         "bytes": self.file.tell(), "comprimido": False, "abierto": True}
+        self.manifest["segmentos"].append(self.segmento)
+
+    def _cerrar_segmento(self):
+        self._sincronizar(forzar=True)
+        self.file.close()
+        self.segmento["abierto"] = False
+        segmentos.guardar_manifest(self.directorio, self.manifest)
+        if self.comprimir:
+            self._comprimir_en_fondo(self.segmento)
+        self.segmento = None
+        self.hora_segmento = None
+
+    def _comprimir_en_fondo(self, entrada):
+        # La compresión no debe frenar la escritura, corre en su propio hilo
+        def comprimir():
+            ruta = os.path.join(self.directorio, entrada["archivo"])
+            try:
+                if os.path.exists(ruta):
+                    ruta = segmentos.comprimir_segmento(ruta)
+                with self.lock:
+                    entrada["archivo"] = os.path.basename(ruta)
+                    entrada["bytes"] = os.path.getsize(ruta)
+                    entrada["comprimido"] = True
+                    segmentos.guardar_manifest(self.directorio, self.manifest)
+            except OSError as e:
+                print(f'Error al comprimir segmento {entrada["archivo"]}: {e}')
+        threading.Thread(target=comprimir, name="comprimir-segmento", daemon=True).start()
+
+    def _volcar(self):
+        # Se llama con self.lock tomado
+        ahora = datetime.datetime.now()
+        if self.segmento is not None and (
+                segmentos.inicio_de_hora(ahora) != self.hora_segmento
+                or self.file.tell() >= self.tamanio_maximo):
+            self._cerrar_segmento()
+        if not self.buffer:
+            return
+        if self.segmento is None:
+            self._abrir_segmento(ahora)
+
+        marcas = [str(registro.get("timestamp_ini", "")) for registro in self.buffer]
+        inicio, fin = min(marcas), max(marcas)
+        if self.segmento["inicio"] is None or inicio < self.segmento["inicio"]:
+            self.segmento["inicio"] = inicio
+        if self.segmento["fin"] is None or fin > self.segmento["fin"]:
+            self.segmento["fin"] = fin
+
+        escritos_antes = self.registros_escritos
+        try:
+            super()._volcar()
+        finally:
+            self.segmento["filas"] += self.registros_escritos - escritos_antes
+            self.segmento["bytes"] = self.file.tell()
+            segmentos.guardar_manifest(self.directorio, self.manifest)
+
+    def cerrar(self):
+        self.detener.set()
+        self.hilo.join(timeout=self.intervalo + 1)
+        with self.lock:
+            self._volcar()
+            if self.segmento is not None:
+                self._sincronizar(forzar=True)
+                self.file.close()
+                self.segmento["abierto"] = False
+                self.segmento = None
+            segmentos.guardar_manifest(self.directorio, self.manifest)
+
+    def estadisticas(self):
+        datos = super().estadisticas()
+        with self.lock:
+            datos["segmentos"] = len(self.manifest["segmentos"])
+            datos["segmento_abierto"] = self.segmento["archivo"] if self.segmento else None
+        return datos
 
 @Pyro5.api.expose
 class entradaLog:
-    def __init__(self, timestamp_ini, timestamp_fin, maquina, tipo_maquina, query, tiempo_fin, score, rango_etario):
+    def __init__(self, timestamp_ini, timestamp_fin, maquina, tipo_maquina, query, tiempo_fin, score, rango_etario,
+                 trace_id="", destino="", latencia_red="", bytes_respuesta="", etapas=""):
         self.timestamp_ini = timestamp_ini
         self.timestamp_fin = timestamp_fin
         self.maquina = maquina
@@ -16,9 +317,14 @@ class entradaLog:
         self.tiempo_fin = tiempo_fin
         self.score = score
         self.rango_etario = rango_etario
+        self.trace_id = trace_id
+        self.destino = destino
+        self.latencia_red = latencia_red
+        self.bytes_respuesta = bytes_respuesta
+        self.etapas = etapas
 
     def __str__(self):
-        return f'{self.timestamp_ini}, {self.timestamp_fin}, {self.maquina}, {self.tipo_maquina}, {self.query}, {self.tiempo_fin}, {self.score}, {self.rango_etario}'
+        return f'{self.timestamp_ini}, {self.timestamp_fin}, {self.maquina}, {self.tipo_maquina}, {self.query}, {self.tiempo_fin}, {self.score}, {self.rango_etario}, {self.trace_id}, {self.destino}, {self.latencia_red}, {self.bytes_respuesta}, {self.etapas}'
     
     def to_dict(self):
         """Convierte el objeto a un diccionario para facilitar la escritura en CSV"""
@@ -30,95 +336,278 @@ class entradaLog:
             'query': self.query,
             'tiempo_fin': self.tiempo_fin,
             'score': self.score,
-            'rango_etario': self.rango_etario
+            'rango_etario': self.rango_etario,
+            'trace_id': self.trace_id,
+            'destino': self.destino,
+            'latencia_red': self.latencia_red,
+            'bytes_respuesta': self.bytes_respuesta,
+            'etapas': self.etapas
         }
 
 @Pyro5.api.expose
 class logCentralizado:
-    def __init__(self):
-        self.logs = []
+    def __init__(self, log_file="logs.csv", modo_durabilidad="periodico", tamanio_buffer=500, intervalo_volcado=1.0,
+                 capacidad_memoria=100000, log_dir=None, tamanio_segmento=64 * 1024 * 1024, comprimir_segmentos=True,
+                 retencion_rollups=1440, minutos_query_rollups=30, max_bytes_rollups=128 * 1024 * 1024):
+        # Agregados por minuto (por máquina, rango etario y query) para estadísticas en vivo
+        self.rollups_minuto = RollupsPorMinuto(retencion_minutos=retencion_rollups,
+                                               minutos_query=minutos_query_rollups,
+                                               max_bytes=max_bytes_rollups)
+        # Buffer circular: solo se conservan en memoria los últimos registros,
+        # cada uno con su número de secuencia (que sirve de cursor)
+        self.logs = deque(maxlen=capacidad_memoria)
+        self.siguiente_secuencia = 0
         self.lock = threading.Lock()
-        self.log_file = "logs.csv"
+        self.log_file = log_file
+        self.log_dir = log_dir
+        
+        if self.log_dir:
+            # Historial particionado por hora con manifest
+            self.escritor = EscritorSegmentado(self.log_dir, modo=modo_durabilidad, tamanio_buffer=tamanio_buffer,
+                                               intervalo=intervalo_volcado, tamanio_maximo=tamanio_segmento,
+                                               comprimir=comprimir_segmentos)
+            print(f"Logs segmentados por hora en: {self.log_dir}")
+            return
         
-        # Comprobar si el archivo existe, si no, crear con encabezados
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, 'w', newline='', encoding='utf-8') as file:
-                fieldnames = ['timestamp_ini', 'timestamp_fin', 'maquina', 'tipo_maquina', 
-                              'query', 'tiempo_fin', 'score', 'rango_etario']
-                writer = csv.DictWriter(file, fieldnames=fieldnames)
-                writer.writeheader()
+        # Crea el archivo con encabezados si no existe y lo deja abierto
+        creado = not os.path.exists(self.log_file)
+        self.escritor = EscritorAgrupado(self.log_file, modo=modo_durabilidad,
+                                         tamanio_buffer=tamanio_buffer, intervalo=intervalo_volcado)
+        if creado:
             print(f"Archivo de logs creado: {self.log_file}")
     
     def save_to_file(self, log_entry):
-        """Guarda una entrada de log en el archivo CSV"""
-        log_dict = log_entry.to_dict()
-        with open(self.log_file, 'a', newline='', encoding='utf-8') as file:
-            fieldnames = ['timestamp_ini', 'timestamp_fin', 'maquina', 'tipo_maquina', 
-                          'query', 'tiempo_fin', 'score', 'rango_etario']
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writerow(log_dict)
+        """Agrega una entrada de log al buffer del archivo CSV"""
+        self.escritor.escribir([log_entry.to_dict()])
     
-    def registro(self, entrada_log):
-        # Hacer una copia profunda del diccionario de entrada
-        log_copy = copy.deepcopy(entrada_log)
-        
-        # Crear una instancia separada de entradaLog para cada registro
-        entrada = entradaLog(
-            timestamp_ini=log_copy["timestamp_ini"],
-            timestamp_fin=log_copy["timestamp_fin"],
-            maquina=log_copy["maquina"],
-            tipo_maquina=log_copy["tipo_maquina"],
-            query=log_copy["query"],
-            tiempo_fin=log_copy["tiempo_fin"],
-            score=log_copy["score"],
-            rango_etario=log_copy["rango_etario"]
+    def _crear_entrada(self, entrada_log):
+        # Pyro ya entrega un diccionario nuevo por llamada y los campos son
+        # inmutables, así que no hace falta una copia profunda
+        return entradaLog(
+            timestamp_ini=entrada_log["timestamp_ini"],
+            timestamp_fin=entrada_log["timestamp_fin"],
+            maquina=entrada_log["maquina"],
+            tipo_maquina=entrada_log["tipo_maquina"],
+            query=entrada_log["query"],
+            tiempo_fin=entrada_log["tiempo_fin"],
+            score=entrada_log["score"],
+            rango_etario=entrada_log["rango_etario"],
+            # Los esclavos sin trazado no mandan estos campos
+            **{campo: entrada_log.get(campo, "") for campo in CAMPOS_TRAZA}
         )
+    
+    def registro(self, entrada_log):
+        entrada = self._crear_entrada(entrada_log)
         
         with self.lock:
-            # Agregar el nuevo log a la lista en memoria
-            self.logs.append(entrada)
-            
-            # Guardar el log en el archivo
+            # Agregar el nuevo log al buffer en memoria
+            self.logs.append((self.siguiente_secuencia, entrada))
+            self.siguiente_secuencia += 1
+        
+        # Guardar el log en el archivo (el escritor tiene su propio lock)
+        try:
+            self.save_to_file(entrada)
+            print(f'Log registrado y guardado en archivo: {entrada.maquina} - {entrada.timestamp_ini}')
+        except Exception as e:
+            print(f'Error al guardar log en archivo: {e}')
+        # Después de escribir: un registro que los rollups no aceptan solo se cuenta como descartado
+        self.rollups_minuto.agregar([entrada.to_dict()])
+    
+    def registro_lote(self, entradas_log):
+        """Registra varios logs en una sola llamada remota"""
+        entradas = []
+        for entrada_log in entradas_log:
             try:
-                self.save_to_file(entrada)
-                print(f'Log registrado y guardado en archivo: {entrada.maquina} - {entrada.timestamp_ini}')
-            except Exception as e:
-                print(f'Error al guardar log en archivo: {e}')
+                entradas.append(self._crear_entrada(entrada_log))
+            except (KeyError, TypeError) as e:
+                print(f'Log inválido descartado: {e}')
+        
+        with self.lock:
+            for entrada in entradas:
+                self.logs.append((self.siguiente_secuencia, entrada))
+                self.siguiente_secuencia += 1
+        registros = [entrada.to_dict() for entrada in entradas]
+        
+        try:
+            self.escritor.escribir(registros)
+            print(f'Lote de {len(entradas)} logs registrado y guardado en archivo')
+        except Exception as e:
+            print(f'Error al guardar lote de logs en archivo: {e}')
+        self.rollups_minuto.agregar(registros)
+        return len(entradas)
+    
+    def _cerrar(self):
+        """
+        Vuelca y sincroniza los registros pendientes antes de apagar el
+        servidor. Es privado (Pyro no expone los métodos que empiezan con "_"):
+        solo lo llama main(), ningún cliente puede cerrar el archivo compartido.
+        """
+        self.escritor.cerrar()
     
     def lectura(self):
+        """Los últimos LIMITE_LECTURA registros como texto; para más, leer() paginado"""
         with self.lock:
+            ultimos = itertools.islice(self.logs, max(0, len(self.logs) - LIMITE_LECTURA), None)
             # Convertir cada objeto entradaLog a string para la serialización
-            return [str(log) for log in self.logs]
+            return [str(log) for _, log in ultimos]
     
     def get_logs(self):
         # Redirigir a lectura() para mantener consistencia
         return self.lectura()
     
-    def leer_archivo_logs(self):
-        """Lee todos los logs del archivo CSV y los devuelve como una lista de diccionarios"""
-        if not os.path.exists(self.log_file):
-            return []
+    def leer(self, cursor=0, limite=100, desde=None, hasta=None, maquina=None, tipo_maquina=None, query=None,
+             trace_id=None):
+        """
+        Lectura paginada del buffer en memoria. Devuelve hasta `limite`
+        registros con secuencia >= cursor que cumplan los filtros, el cursor
+        para la siguiente página y cuántos registros se perdieron porque ya
+        salieron del buffer. Cada llamada revisa a lo sumo LIMITE_EXAMINADOS
+        registros, así que una página puede venir corta o vacía con `fin`
+        en False: se sigue pidiendo desde el cursor.
+        """
+        limite = max(0, min(int(limite), LIMITE_LECTURA))
+        entradas = []
+        with self.lock:
+            primera = self.logs[0][0] if self.logs else self.siguiente_secuencia
+            perdidos = max(0, primera - cursor)
+            siguiente = max(cursor, primera)
+            inicio = siguiente - primera
+            for secuencia, entrada in itertools.islice(self.logs, inicio, inicio + LIMITE_EXAMINADOS):
+                if len(entradas) >= limite:
+                    break
+                siguiente = secuencia + 1
+                registro = entrada.to_dict()
+                if coincide_filtros(registro, desde, hasta, maquina, tipo_maquina, query, trace_id):
+                    registro['secuencia'] = secuencia
+                    entradas.append(registro)
+            fin = siguiente >= self.siguiente_secuencia
+        return {"entradas": entradas, "cursor": siguiente, "perdidos": perdidos, "fin": fin}
+    
+    def _archivos_historial(self, desde=None, hasta=None):
+        """Archivos del historial en disco; con segmentos solo los que se solapan con la ventana"""
+        if self.log_dir:
+            return segmentos.segmentos_en_rango(self.log_dir, desde, hasta)
+        return [self.log_file] if os.path.exists(self.log_file) else []
+    
+    def leer_archivo_logs(self, cursor=0, limite=LIMITE_LECTURA, desde=None, hasta=None,
+                          maquina=None, tipo_maquina=None, query=None, trace_id=None):
+        """
+        Lectura paginada del historial en disco. El cursor es la posición en
+        bytes dentro del CSV (o "segmento@posición" con logs segmentados), así
+        que cada página se lee sin recorrer el historial desde el principio.
+        `fin` indica que no quedan más registros.
+        """
+        # Volcar el buffer para que la lectura incluya lo último registrado
+        self.escritor.volcar()
+        limite = max(0, min(int(limite), LIMITE_LECTURA))
         
-        logs = []
-        with open(self.log_file, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                logs.append(row)
-        return logs
+        if isinstance(cursor, str):
+            segmento_cursor, desplazamiento = cursor.rsplit("@", 1)
+            desplazamiento = int(desplazamiento)
+        else:
+            segmento_cursor, desplazamiento = None, int(cursor or 0)
+        
+        def armar_cursor(ruta, posicion):
+            if not self.log_dir:
+                return posicion
+            return f"{os.path.basename(ruta).removesuffix('.gz')}@{posicion}"
+        
+        entradas = []
+        siguiente = cursor
+        for ruta in self._archivos_historial(desde, hasta):
+            nombre = os.path.basename(ruta).removesuffix('.gz')
+            if segmento_cursor is not None and nombre < segmento_cursor:
+                continue
+            inicio = desplazamiento if segmento_cursor in (None, nombre) else 0
+            for registro, posicion in iterar_csv_con_posicion(ruta, inicio):
+                if len(entradas) >= limite:
+                    return {"entradas": entradas, "cursor": siguiente, "fin": False}
+                siguiente = armar_cursor(ruta, posicion)
+                if coincide_filtros(registro, desde, hasta, maquina, tipo_maquina, query, trace_id):
+                    entradas.append(registro)
+        return {"entradas": entradas, "cursor": siguiente, "fin": True}
+    
+    def rollups(self, desde=None, hasta=None, dimension="total", con_sketches=True):
+        """
+        Agregados por minuto de una dimensión ("total", "maquina",
+        "rango_etario" o "query") entre `desde` y `hasta` (timestamps ISO).
+        Cada fila trae conteo, sumas, mínimos/máximos y percentiles; con
+        `con_sketches` también los sketches serializados para poder
+        combinarlos del lado del cliente.
+        """
+        return self.rollups_minuto.consultar(desde, hasta, dimension, con_sketches)
+    
+    def estadisticas_en_vivo(self, minutos=5, dimension="maquina"):
+        """Resumen de los últimos `minutos` minutos por clave de la dimensión (qps, promedio y percentiles)"""
+        if dimension not in DIMENSIONES:
+            raise ValueError(f"Dimensión desconocida: {dimension}")
+        minutos = max(1, int(minutos))
+        combinadas = self.rollups_minuto.combinar(minutos, dimension, ultimo=datetime.datetime.now().isoformat())
+        resumen = {}
+        for clave, estadistica in combinadas.items():
+            resumen[clave] = {
+                "conteo": estadistica.conteo,
+                "qps": round(estadistica.conteo / (minutos * 60), 4),
+                "tipo_maquina": estadistica.tipo_maquina,
+                "score_promedio": estadistica.suma_score / estadistica.conteo,
+                "tiempo_promedio": estadistica.tiempo.promedio(),
+                "tiempo_p50": estadistica.tiempo.cuantil(0.5),
+                "tiempo_p95": estadistica.tiempo.cuantil(0.95),
+                "tiempo_p99": estadistica.tiempo.cuantil(0.99),
+                "tiempo_maximo": estadistica.tiempo.maximo,
+                "latencia_p95": estadistica.latencia.cuantil(0.95)
+            }
+        return {"minutos": minutos, "dimension": dimension, "claves": resumen,
+                "rollups": self.rollups_minuto.estadisticas()}
+    
+    def iterar_archivo_logs(self, desde=None, hasta=None, maquina=None, tipo_maquina=None, query=None,
+                            trace_id=None):
+        """Recorre el historial en disco como un iterador remoto (streaming de Pyro)"""
+        self.escritor.volcar()
+        for ruta in self._archivos_historial(desde, hasta):
+            for registro, _ in iterar_csv_con_posicion(ruta):
+                if coincide_filtros(registro, desde, hasta, maquina, tipo_maquina, query, trace_id):
+                    yield registro
 
 def main():
     # Configurar Pyro para esperar a que terminen todas las solicitudes
     Pyro5.config.COMMTIMEOUT = 5.0
     Pyro5.config.SERVERTYPE = "thread"
     
+    # Una sola instancia compartida por todos los esclavos, para que el
+    # archivo y el buffer de escritura sean comunes
+    servidor = logCentralizado(
+        log_file=os.environ.get("LOG_ARCHIVO", "logs.csv"),
+        modo_durabilidad=os.environ.get("LOG_DURABILIDAD", "periodico"),
+        tamanio_buffer=int(os.environ.get("LOG_BUFFER", 500)),
+        intervalo_volcado=float(os.environ.get("LOG_INTERVALO_VOLCADO", 1.0)),
+        capacidad_memoria=int(os.environ.get("LOG_CAPACIDAD_MEMORIA", 100000)),
+        log_dir=os.environ.get("LOG_DIR_SEGMENTOS") or None,
+        tamanio_segmento=int(os.environ.get("LOG_TAMANIO_SEGMENTO_MB", 64)) * 1024 * 1024,
+        comprimir_segmentos=os.environ.get("LOG_COMPRIMIR_SEGMENTOS", "1") == "1",
+        retencion_rollups=int(os.environ.get("LOG_ROLLUP_MINUTOS", 1440)),
+        minutos_query_rollups=int(os.environ.get("LOG_ROLLUP_MINUTOS_QUERY", 30)),
+        max_bytes_rollups=int(os.environ.get("LOG_ROLLUP_MAX_MB", 128)) * 1024 * 1024
+    )
+    
     daemon = Pyro5.api.Daemon()
     ns = Pyro5.api.locate_ns()
-    uri = daemon.register(logCentralizado)
+    uri = daemon.register(servidor)
     ns.register('centralizado.logger', uri)
     print('Servidor de logs centralizados iniciado')
     print(f"URI: {uri}")
-    print(f"Logs se guardarán en: {os.path.abspath('logs.csv')}")
-    daemon.requestLoop()
+    print(f"Logs se guardarán en: {os.path.abspath(servidor.log_dir or servidor.log_file)}")
+    
+    # Apagado limpio también con SIGTERM
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        daemon.requestLoop()
+    except KeyboardInterrupt:
+        print('Deteniendo servidor de logs...')
+    finally:
+        servidor._cerrar()
+        daemon.close()
+        print('Logs pendientes guardados en disco')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,57 +1,489 @@
-
 import json
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import os
+import time
+import heapq
+import itertools
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from utils import ranking
+from utils.cache import CacheLRU
+from utils.replicas import crear_grupos
+from utils.lotes import leer_lote
+from utils.envio_logs import EnviadorLogs
+from utils import trazas
+from utils.metricas import Metricas, formato_prometheus, resumen
 
 # Cargar configuración de esclavos
-with open("config/esclavos_config.json", "r", encoding="utf-8") as f:
+ESCLAVOS_CONFIG_PATH = os.environ.get("ESCLAVOS_CONFIG", "config/esclavos_config.json")
+PUERTO_MAESTRO = int(os.environ.get("PUERTO_MAESTRO", 5000))
+with open(ESCLAVOS_CONFIG_PATH, "r", encoding="utf-8") as f:
     esclavos = json.load(f)
 
+# Plazo total de una consulta y presupuesto por esclavo (segundos).
+# Un esclavo puede definir su propio "timeout" en esclavos_config.json.
+DEADLINE_CONSULTA = float(os.environ.get("DEADLINE_CONSULTA", 3.0))
+TIMEOUT_ESCLAVO = float(os.environ.get("TIMEOUT_ESCLAVO", 2.0))
+MAX_HILOS_FANOUT = int(os.environ.get("MAX_HILOS_FANOUT", 32))
+# /query/batch: consultas por petición y plazo total de un lote
+MAX_LOTE = int(os.environ.get("MAX_LOTE", 1000))
+DEADLINE_LOTE = float(os.environ.get("DEADLINE_LOTE", 30.0))
+
+# Conexiones persistentes: un pool keep-alive por réplica
+POOL_TAMANIO = int(os.environ.get("POOL_TAMANIO", 10))
+POOL_BLOQUEAR = os.environ.get("POOL_BLOQUEAR", "0") == "1"
+
+# Réplicas: balanceo de carga, hedging y expulsión de réplicas caídas
+BALANCEO = os.environ.get("BALANCEO", "menos_pendientes")
+HEDGING = os.environ.get("HEDGING", "1") == "1"
+HEDGE_MINIMO = float(os.environ.get("HEDGE_MINIMO", 0.01))
+EXPULSION_REPLICA = float(os.environ.get("EXPULSION_REPLICA", 10.0))
+FALLOS_EXPULSION = int(os.environ.get("FALLOS_EXPULSION", 3))
+grupos = crear_grupos(esclavos, tamanio=POOL_TAMANIO, bloquear=POOL_BLOQUEAR, politica=BALANCEO,
+                      hedging=HEDGING, hedge_minimo=HEDGE_MINIMO, expulsion=EXPULSION_REPLICA,
+                      fallos_expulsion=FALLOS_EXPULSION)
+
+# Cache de resultados: las puntuaciones solo dependen de las palabras clave
+# normalizadas y del grupo etario, no de la edad exacta
+CACHE_TAMANIO = int(os.environ.get("CACHE_TAMANIO", 1024))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 60.0))
+INTERVALO_VERSIONES = float(os.environ.get("INTERVALO_VERSIONES", 5.0))
+RANGO_ETARIO_PATH = os.environ.get("RANGO_ETARIO", "config/rango_etario.json")
+INTERESES_PATH = os.environ.get("INTERESES", "config/intereses_por_categoria.json")
+
+rangos, _ = ranking.cargar_configuracion(RANGO_ETARIO_PATH, INTERESES_PATH)
+cache = CacheLRU(capacidad=CACHE_TAMANIO, ttl=CACHE_TTL)
+
+# Última versión de datos informada por cada réplica: (tipo, réplica) -> versión
+versiones_esclavos = {}
+versiones_lock = threading.Lock()
+
+# Pool compartido para consultar a los esclavos en paralelo
+executor = ThreadPoolExecutor(max_workers=MAX_HILOS_FANOUT, thread_name_prefix="fanout")
+
+# Cada llamada a un esclavo se registra en el servidor de logs con el id de
+# traza de la consulta, la ida y vuelta, los bytes recibidos y la latencia de red
+LOG_MAESTRO = os.environ.get("LOG_MAESTRO", "1") == "1"
+MAQUINA = socket.gethostname()
+# Histogramas por etapa (llamada a cada esclavo, mezcla, total) que expone /metrics
+metricas = Metricas(ventana=float(os.environ.get("METRICAS_VENTANA", 60.0)))
+enviador_logs = EnviadorLogs(
+    capacidad=int(os.environ.get("LOG_CAPACIDAD", 10000)),
+    tamanio_lote=int(os.environ.get("LOG_LOTE", 100)),
+    intervalo=float(os.environ.get("LOG_INTERVALO", 1.0)),
+    politica=os.environ.get("LOG_POLITICA", "descartar_nuevos"),
+    metricas=metricas,
+    desborde=os.environ.get("LOG_DESBORDE_DIR", ".desborde_logs") or None,
+    max_desborde=int(os.environ.get("LOG_DESBORDE_MAX_MB", 64)) * 1024 * 1024,
+    fallos_apertura=int(os.environ.get("LOG_FALLOS_APERTURA", 3)),
+    espera_maxima=float(os.environ.get("LOG_ESPERA_MAXIMA", 60.0))
+)
+
 app = Flask(__name__)
 
+def clave_cache(consulta_titulo, edad, tipos_requeridos, limite, desplazamiento):
+    """
+    Clave canónica de una consulta. Las palabras clave se ordenan pero se
+    conservan las repeticiones, porque cada repetición suma coincidencias.
+    Los tipos mantienen su orden porque definen el desempate entre esclavos.
+    """
+    palabras = tuple(sorted(ranking.extraer_palabras_clave(consulta_titulo)))
+    if edad is None:
+        edad = ranking.EDAD_POR_DEFECTO
+    grupo = ranking.determinar_grupo_etario(edad, rangos)
+    return palabras, grupo, tuple(tipos_requeridos), limite, desplazamiento
+
+def registrar_version(tipo, replica, version):
+    """Guarda la versión de datos de una réplica e invalida el cache si cambió"""
+    if not version:
+        return
+    with versiones_lock:
+        anterior = versiones_esclavos.get((tipo, replica))
+        versiones_esclavos[(tipo, replica)] = version
+    if anterior is not None and anterior != version:
+        eliminadas = cache.invalidar(lambda clave: tipo in clave[2])
+        print(f"Esclavo {tipo} ({replica}) cambió de versión ({anterior} -> {version}); "
+              f"{eliminadas} entradas de cache invalidadas")
+
+def vigilar_versiones():
+    """
+    Consulta periódicamente /health de cada réplica: detecta cambios de datos
+    aunque haya aciertos de cache y expulsa temporalmente las réplicas caídas
+    """
+    while True:
+        for tipo, shards in grupos.items():
+            for grupo in shards:
+                for replica, version in grupo.verificar_salud(timeout=1.0).items():
+                    registrar_version(tipo, replica.nombre, version)
+        time.sleep(INTERVALO_VERSIONES)
+
+def iniciar_vigilancia_versiones():
+    hilo = threading.Thread(target=vigilar_versiones, name="versiones", daemon=True)
+    hilo.start()
+    return hilo
+
+def registrar_llamada(trace_id, replica, query, duracion, server_timing, bytes_respuesta, score=0):
+    """Encola el registro de una llamada a un esclavo; nunca bloquea la consulta"""
+    if not LOG_MAESTRO:
+        return
+    registro = trazas.registro_llamada(trace_id, MAQUINA, replica, query, duracion,
+                                       trazas.leer_server_timing(server_timing), bytes_respuesta, score)
+    if not enviador_logs.enviar(registro):
+        print("Cola de logs llena: registro del maestro descartado")
+
+def registrar_metricas(cronometro, endpoint, parcial=False, aciertos=0, fallos=0):
+    """Etapas y total de una consulta (o lote) del maestro, y cuántas salieron del cache"""
+    metricas.observar_etapas("etapa_segundos", cronometro.etapas, endpoint=endpoint)
+    metricas.observar("consulta_segundos", cronometro.total(), endpoint=endpoint)
+    if aciertos:
+        metricas.contar("consultas", aciertos, endpoint=endpoint, cache="hit")
+    if fallos:
+        metricas.contar("consultas", fallos, endpoint=endpoint, cache="miss")
+    if parcial:
+        metricas.contar("respuestas_parciales", endpoint=endpoint)
+
+def registrar_fallo_esclavo(nombre, pendiente):
+    metricas.contar("esclavos_pendientes" if pendiente else "esclavos_fallidos", esclavo=nombre)
+
+def consultar_esclavo(tipo, shard, params, timeout, trace_id):
+    """
+    Consulta a una réplica de un shard del esclavo y devuelve (réplica,
+    versión de datos) y sus resultados ya aplanados
+    """
+    replica, response = grupos[tipo][shard].get("/query", params=params, timeout=timeout,
+                                                headers={trazas.CABECERA_TRAZA: trace_id})
+    response.raise_for_status()
+    version = response.headers.get("X-Version-Datos")
+    registrar_version(tipo, replica.nombre, version)
+    resultados = aplanar(tipo, response.json())
+    metricas.observar("llamada_esclavo_segundos", response.duracion, esclavo=grupos[tipo][shard].tipo,
+                      replica=replica.nombre)
+    registrar_llamada(trace_id, replica.nombre, params["titulo"], response.duracion,
+                      response.headers.get("Server-Timing"), len(response.content),
+                      resultados[0]["score"] if resultados else 0)
+    return (replica.nombre, version), resultados
+
+def consultar_lote_esclavo(tipo, shard, cuerpo, timeout, trace_id):
+    """
+    Como consultar_esclavo pero con /query/batch: devuelve los resultados de
+    cada consulta. Lanza ValueError si no hay una lista por consulta enviada.
+    """
+    replica, response = grupos[tipo][shard].post_lote("/query/batch", json=cuerpo, timeout=timeout,
+                                                      headers={trazas.CABECERA_TRAZA: trace_id})
+    response.raise_for_status()
+    listas = response.json()
+    if not isinstance(listas, list) or len(listas) != len(cuerpo["consultas"]):
+        # Sin una lista por consulta no se sabe a cuál corresponde cada una: el esclavo cuenta como fallido
+        raise ValueError(f"la réplica {replica.nombre} devolvió {len(listas) if isinstance(listas, list) else 0} "
+                         f"listas de resultados para {len(cuerpo['consultas'])} consultas")
+    version = response.headers.get("X-Version-Datos")
+    registrar_version(tipo, replica.nombre, version)
+    resultados = [aplanar(tipo, items) for items in listas]
+    metricas.observar("llamada_esclavo_segundos", response.duracion, esclavo=grupos[tipo][shard].tipo,
+                      replica=replica.nombre, endpoint="batch")
+    registrar_llamada(trace_id, replica.nombre, f"(lote de {len(resultados)} consultas)", response.duracion,
+                      response.headers.get("Server-Timing"), len(response.content))
+    return (replica.nombre, version), resultados
+
+def aplanar(tipo, items):
+    resultados = []
+    for item in items:
+        doc = item["documento"]
+        doc["score"] = item["score"]
+        doc["coincidencias_titulo"] = item["coincidencias_titulo"]
+        doc["puntaje_categoria"] = item["puntaje_categoria"]
+        doc["tipo"] = tipo
+        resultados.append(doc)
+    return resultados
+
+def mezclar_shards(listas):
+    """
+    Une los resultados ordenados de los shards de un tipo en un solo ranking.
+    En empate de score manda el id del documento: particionar.py exige ids
+    enteros crecientes según la posición en la colección original (o asigna
+    esa posición), así el orden queda igual al de un único esclavo con toda
+    la colección. Los esclavos de un shard solo aceptan ids enteros, pero un
+    id de otro tipo se ordena después de los enteros en vez de romper la mezcla.
+    """
+    if len(listas) == 1:
+        return listas[0]
+    return heapq.merge(*listas, key=clave_de_shard)
+
+def clave_de_shard(doc):
+    doc_id = doc.get("id", 0)
+    if isinstance(doc_id, int) and not isinstance(doc_id, bool):
+        return -doc["score"], 0, doc_id, ""
+    return -doc["score"], 1, 0, str(doc_id)
+
+def claves_de_mezcla(resultados, orden_tipo):
+    for rango, doc in enumerate(resultados):
+        yield -doc["score"], orden_tipo, rango, doc
+
+def combinar_tipos(resultados_por_tipo, limite, desplazamiento):
+    """
+    Cada esclavo ya entrega sus resultados ordenados: mezcla k-way por score
+    (mayor a menor); en empate manda el orden de tipos y luego el del esclavo
+    """
+    flujos = [
+        claves_de_mezcla(mezclar_shards(listas), orden_tipo)
+        for orden_tipo, listas in enumerate(resultados_por_tipo.values()) if listas
+    ]
+    fin = desplazamiento + limite if limite is not None else None
+    return [doc for _, _, _, doc in itertools.islice(heapq.merge(*flujos), desplazamiento, fin)]
+
+def tipos_de(tipos):
+    if tipos:
+        return [t.strip() for t in tipos.split("+") if t.strip()]
+    return list(esclavos.keys())
+
+def en_cache_vigente(clave):
+    """Resultados en cache si todas las réplicas usadas siguen en la misma versión de datos"""
+    en_cache = cache.obtener(clave)
+    if en_cache is None:
+        return None
+    versiones_usadas, resultados_totales = en_cache
+    with versiones_lock:
+        vigente = all(versiones_esclavos.get((tipo, replica)) == version
+                      for tipo, (replica, version) in versiones_usadas)
+    return resultados_totales if vigente else None
+
 @app.route("/")
 def home():
     return "Servidor maestro en funcionamiento. Usa /query para consultas."
 
 @app.route("/query", methods=["GET"])
 def query():
+    cronometro = trazas.Cronometro()
+    # El id de traza llega del cliente o se genera acá, y viaja a cada esclavo
+    trace_id = trazas.trace_id_de(request.headers.get(trazas.CABECERA_TRAZA))
     consulta_titulo = request.args.get("titulo", "")
     edad = request.args.get("edad", type=int)
     tipos = request.args.get("tipo_doc", "")
+    limite = request.args.get("limit", type=int)
+    desplazamiento = request.args.get("offset", default=0, type=int)
+    if (limite is not None and limite < 0) or desplazamiento < 0:
+        return jsonify({"error": "limit y offset deben ser enteros no negativos"}), 400
 
-    resultados_totales = []
+    tipos_requeridos = tipos_de(tipos)
 
-    if tipos:
-        tipos_requeridos = [t.strip() for t in tipos.split("+") if t.strip()]
-    else:
-        tipos_requeridos = list(esclavos.keys())
+    clave = clave_cache(consulta_titulo, edad, tipos_requeridos, limite, desplazamiento)
+    resultados_totales = en_cache_vigente(clave)
+    cronometro.marcar("cache")
+    if resultados_totales is not None:
+        response = jsonify(resultados_totales)
+        cronometro.marcar("serializar")
+        registrar_metricas(cronometro, "query", aciertos=1)
+        response.headers["X-Resultado-Parcial"] = "false"
+        response.headers["X-Cache"] = "HIT"
+        response.headers[trazas.CABECERA_TRAZA] = trace_id
+        return response
+
+    params = {"titulo": consulta_titulo}
+    if edad is not None:
+        params["edad"] = edad
+    if limite is not None:
+        # Cada esclavo solo necesita su top-(offset + limit) para armar la página
+        params["limit"] = desplazamiento + limite
 
+    # Lanzar todas las consultas a la vez (una por shard de cada tipo); cada
+    # una con su propio presupuesto, acotado por el plazo total de la consulta
+    inicio = time.monotonic()
+    futuros = {}
     for tipo in tipos_requeridos:
         esclavo = esclavos.get(tipo)
         if esclavo:
-            url = f"http://{esclavo['host']}:{esclavo['port']}/query"
+            timeout = min(float(esclavo.get("timeout", TIMEOUT_ESCLAVO)), DEADLINE_CONSULTA)
+            for shard in range(len(grupos[tipo])):
+                futuros[(tipo, shard)] = executor.submit(consultar_esclavo, tipo, shard, params, timeout, trace_id)
+
+    wait(futuros.values(), timeout=max(0.0, DEADLINE_CONSULTA - (time.monotonic() - inicio)))
+    cronometro.marcar("fanout")
+
+    resultados_por_tipo = {}
+    versiones_usadas = []
+    replicas_usadas = []
+    esclavos_pendientes = []
+    esclavos_fallidos = []
+    # Recorrer en el orden de tipos_requeridos para que los empates sean estables
+    for (tipo, shard), futuro in futuros.items():
+        nombre = grupos[tipo][shard].tipo
+        resultados_por_tipo.setdefault(tipo, [])
+        if not futuro.done():
+            # No bloquear la respuesta: el hilo termina por su cuenta al vencer su timeout
+            futuro.cancel()
+            esclavos_pendientes.append(nombre)
+            registrar_fallo_esclavo(nombre, pendiente=True)
+            print(f"Esclavo {nombre} no respondió dentro del plazo de {DEADLINE_CONSULTA}s")
+            continue
+        try:
+            replica_version, resultados = futuro.result()
+            versiones_usadas.append((tipo, replica_version))
+            replicas_usadas.append(f"{nombre}={replica_version[0]}")
+            resultados_por_tipo[tipo].append(resultados)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            esclavos_fallidos.append(nombre)
+            registrar_fallo_esclavo(nombre, pendiente=False)
+            print(f"Error consultando al esclavo {nombre}: {e}")
+
+    resultados_totales = combinar_tipos(resultados_por_tipo, limite, desplazamiento)
+
+    parcial = bool(esclavos_pendientes or esclavos_fallidos)
+    if not parcial:
+        # Solo se guardan respuestas completas, junto a las versiones con que se armaron
+        cache.guardar(clave, (tuple(versiones_usadas), resultados_totales))
+    cronometro.marcar("combinar")
+
+    response = jsonify(resultados_totales)
+    cronometro.marcar("serializar")
+    registrar_metricas(cronometro, "query", parcial=parcial, fallos=1)
+    response.headers["X-Cache"] = "MISS"
+    response.headers[trazas.CABECERA_TRAZA] = trace_id
+    # Informar resultados parciales sin cambiar el formato del cuerpo
+    response.headers["X-Resultado-Parcial"] = "true" if parcial else "false"
+    # Réplica que respondió por cada tipo (o shard)
+    response.headers["X-Replicas"] = ",".join(replicas_usadas)
+    if esclavos_pendientes:
+        response.headers["X-Esclavos-Pendientes"] = ",".join(esclavos_pendientes)
+    if esclavos_fallidos:
+        response.headers["X-Esclavos-Fallidos"] = ",".join(esclavos_fallidos)
+    return response
+
+@app.route("/query/batch", methods=["POST"])
+def query_batch():
+    """
+    Muchas consultas en una petición: {"consultas": [{"titulo": ..., "edad": ...}, ...],
+    "tipo_doc": ..., "limit": ..., "offset": ...}. Cada shard recibe un solo
+    /query/batch con las consultas que no están en cache, y la respuesta es
+    la lista de resultados de cada consulta, iguales a los de /query.
+    """
+    cronometro = trazas.Cronometro()
+    trace_id = trazas.trace_id_de(request.headers.get(trazas.CABECERA_TRAZA))
+    cuerpo = request.get_json(silent=True)
+    consultas, limite, desplazamiento, error = leer_lote(cuerpo, MAX_LOTE)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    tipo_doc = cuerpo.get("tipo_doc") or ""
+    if not isinstance(tipo_doc, str):
+        return jsonify({"error": "tipo_doc debe ser texto"}), 400
+    tipos_requeridos = tipos_de(tipo_doc)
+
+    # Primero el cache (compartido con /query); las consultas repetidas se piden una vez
+    claves = [clave_cache(titulo, edad, tipos_requeridos, limite, desplazamiento) for titulo, edad in consultas]
+    respuestas = [en_cache_vigente(clave) for clave in claves]
+    faltantes = {}
+    for numero, clave in enumerate(claves):
+        if respuestas[numero] is None and clave not in faltantes:
+            faltantes[clave] = numero
+    aciertos = sum(1 for resultados in respuestas if resultados is not None)
+    cronometro.marcar("cache")
+
+    esclavos_pendientes = []
+    esclavos_fallidos = []
+    replicas_usadas = []
+    if faltantes:
+        pedidas = list(faltantes.values())
+        cuerpo_esclavo = {"consultas": [{"titulo": consultas[n][0], "edad": consultas[n][1]} for n in pedidas]}
+        if limite is not None:
+            cuerpo_esclavo["limit"] = desplazamiento + limite
+
+        inicio = time.monotonic()
+        futuros = {}
+        for tipo in tipos_requeridos:
+            if esclavos.get(tipo):
+                for shard in range(len(grupos[tipo])):
+                    futuros[(tipo, shard)] = executor.submit(consultar_lote_esclavo, tipo, shard,
+                                                             cuerpo_esclavo, DEADLINE_LOTE, trace_id)
+        wait(futuros.values(), timeout=max(0.0, DEADLINE_LOTE - (time.monotonic() - inicio)))
+        cronometro.marcar("fanout")
+
+        por_consulta = [{} for _ in pedidas]
+        versiones_usadas = []
+        for (tipo, shard), futuro in futuros.items():
+            nombre = grupos[tipo][shard].tipo
+            for resultados_por_tipo in por_consulta:
+                resultados_por_tipo.setdefault(tipo, [])
+            if not futuro.done():
+                futuro.cancel()
+                esclavos_pendientes.append(nombre)
+                registrar_fallo_esclavo(nombre, pendiente=True)
+                print(f"Esclavo {nombre} no respondió el lote dentro del plazo de {DEADLINE_LOTE}s")
+                continue
             try:
-                params = {"titulo": consulta_titulo}
-                if edad is not None:
-                    params["edad"] = edad
-                response = requests.get(url, params=params, timeout=10)
-                if response.status_code == 200:
-                    resultados = response.json()
-                    for item in resultados:
-                        doc = item["documento"]
-                        doc["score"] = item["score"]
-                        doc["coincidencias_titulo"] = item["coincidencias_titulo"]
-                        doc["puntaje_categoria"] = item["puntaje_categoria"]
-                        doc["tipo"] = tipo
-                        resultados_totales.append(doc)
-            except requests.exceptions.RequestException as e:
-                print(f"Error consultando al esclavo {tipo}: {e}")
-
-    # ORDENAR por score de mayor a menor
-    resultados_totales.sort(key=lambda doc: doc["score"], reverse=True)
-
-    return jsonify(resultados_totales)
+                replica_version, resultados_lote = futuro.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                esclavos_fallidos.append(nombre)
+                registrar_fallo_esclavo(nombre, pendiente=False)
+                print(f"Error consultando el lote al esclavo {nombre}: {e}")
+                continue
+            versiones_usadas.append((tipo, replica_version))
+            replicas_usadas.append(f"{nombre}={replica_version[0]}")
+            for resultados_por_tipo, resultados in zip(por_consulta, resultados_lote):
+                resultados_por_tipo[tipo].append(resultados)
+
+        parcial = bool(esclavos_pendientes or esclavos_fallidos)
+        for (clave, numero), resultados_por_tipo in zip(faltantes.items(), por_consulta):
+            respuestas[numero] = combinar_tipos(resultados_por_tipo, limite, desplazamiento)
+            if not parcial:
+                cache.guardar(clave, (tuple(versiones_usadas), respuestas[numero]))
+        for numero, clave in enumerate(claves):
+            if respuestas[numero] is None:
+                respuestas[numero] = respuestas[faltantes[clave]]
+        cronometro.marcar("combinar")
+
+    response = jsonify(respuestas)
+    cronometro.marcar("serializar")
+    registrar_metricas(cronometro, "batch", parcial=bool(esclavos_pendientes or esclavos_fallidos),
+                       aciertos=aciertos, fallos=len(consultas) - aciertos)
+    response.headers["X-Resultado-Parcial"] = "true" if esclavos_pendientes or esclavos_fallidos else "false"
+    response.headers["X-Cache-Aciertos"] = str(aciertos)
+    response.headers[trazas.CABECERA_TRAZA] = trace_id
+    response.headers["X-Replicas"] = ",".join(replicas_usadas)
+    if esclavos_pendientes:
+        response.headers["X-Esclavos-Pendientes"] = ",".join(esclavos_pendientes)
+    if esclavos_fallidos:
+        response.headers["X-Esclavos-Fallidos"] = ",".join(esclavos_fallidos)
+    return response
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(cache.estadisticas())
+
+@app.route("/pool/stats", methods=["GET"])
+def pool_stats():
+    return jsonify({grupo.tipo: [replica.pool.estadisticas() for replica in grupo.replicas]
+                    for shards in grupos.values() for grupo in shards})
+
+@app.route("/replicas/stats", methods=["GET"])
+def replicas_stats():
+    return jsonify({grupo.tipo: grupo.estadisticas() for shards in grupos.values() for grupo in shards})
+
+def medidores():
+    """Valores sueltos para /metrics: estado del cache y del envío de logs"""
+    datos_cache = cache.estadisticas()
+    envio = enviador_logs.estadisticas()
+    return {
+        "cache_entradas": ("gauge", datos_cache["entradas"]),
+        "cache_invalidaciones_total": ("counter", datos_cache["invalidaciones"]),
+        "logs_en_cola": ("gauge", envio["en_cola"]),
+        "logs_descartados_total": ("counter", envio["descartados"]),
+        "logs_desbordados_total": ("counter", envio["desbordados"]),
+        "logs_lotes_envenenados_total": ("counter", envio["lotes_envenenados"]),
+        "logs_interruptor_abierto": ("gauge", int(envio["interruptor"] == "abierto"))
+    }
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Percentiles p50/p95/p99 por etapa y por esclavo, en formato de Prometheus o con ?formato=json"""
+    if request.args.get("formato") == "json":
+        return jsonify(resumen(metricas.a_dict()))
+    return Response(formato_prometheus(metricas.a_dict(), "maestro", medidores()),
+                    mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
-    app.run(port=5000)
+    iniciar_vigilancia_versiones()
+    # Apagado limpio también con SIGTERM, así los atexit envían los logs pendientes
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    app.run(port=PUERTO_MAESTRO, threaded=True)
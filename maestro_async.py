@@ -0,0 +1,295 @@
+import asyncio
+import json
+import time
+import aiohttp
+from aiohttp import web
+import maestro
+from maestro import esclavos, grupos, cache
+from utils import replicas_async, trazas
+from utils.lotes import leer_lote
+from utils.metricas import formato_prometheus, resumen
+
+# Mismo maestro que maestro.py (configuración, cache, réplicas y mezcla de
+# resultados), pero el fan-out a los esclavos es no bloqueante: miles de
+# consultas pueden estar en vuelo sobre un solo hilo de eventos.
+
+def entero(valor, defecto=None):
+    # Igual que request.args.get(..., type=int) de Flask: si no es un entero se usa el defecto
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+def respuesta_json(datos, status=200, headers=None):
+    # Se serializa con el proveedor JSON de Flask para que el cuerpo sea idéntico al de maestro.py
+    cuerpo = maestro.app.json.dumps(datos, separators=(",", ":")) + "\n"
+    headers = dict(headers or {}, **{"Content-Type": maestro.app.json.mimetype})
+    return web.Response(body=cuerpo.encode("utf-8"), status=status, headers=headers)
+
+async def consultar_esclavo(sesion, tipo, shard, params, timeout, trace_id):
+    """Como maestro.consultar_esclavo, sin bloquear un hilo mientras espera"""
+    replica, respuesta = await replicas_async.get(grupos[tipo][shard], sesion, "/query", params=params,
+                                                  timeout=timeout, headers={trazas.CABECERA_TRAZA: trace_id})
+    if respuesta.status >= 400:
+        raise aiohttp.ClientError(f"{replica.nombre} respondió {respuesta.status}")
+    version = respuesta.headers.get("X-Version-Datos")
+    maestro.registrar_version(tipo, replica.nombre, version)
+    resultados = maestro.aplanar(tipo, respuesta.datos)
+    maestro.metricas.observar("llamada_esclavo_segundos", respuesta.duracion, esclavo=grupos[tipo][shard].tipo,
+                              replica=replica.nombre)
+    maestro.registrar_llamada(trace_id, replica.nombre, params["titulo"], respuesta.duracion,
+                              respuesta.headers.get("Server-Timing"), respuesta.bytes,
+                              resultados[0]["score"] if resultados else 0)
+    return (replica.nombre, version), resultados
+
+async def consultar_lote_esclavo(sesion, tipo, shard, cuerpo, timeout, trace_id):
+    """Como maestro.consultar_lote_esclavo, sin bloquear un hilo mientras espera"""
+    replica, respuesta = await replicas_async.post_lote(grupos[tipo][shard], sesion, "/query/batch", json=cuerpo,
+                                                        timeout=timeout, headers={trazas.CABECERA_TRAZA: trace_id})
+    if respuesta.status >= 400:
+        raise aiohttp.ClientError(f"{replica.nombre} respondió {respuesta.status}")
+    listas = respuesta.datos
+    if not isinstance(listas, list) or len(listas) != len(cuerpo["consultas"]):
+        # Sin una lista por consulta no se sabe a cuál corresponde cada una: el esclavo cuenta como fallido
+        raise ValueError(f"la réplica {replica.nombre} devolvió {len(listas) if isinstance(listas, list) else 0} "
+                         f"listas de resultados para {len(cuerpo['consultas'])} consultas")
+    version = respuesta.headers.get("X-Version-Datos")
+    maestro.registrar_version(tipo, replica.nombre, version)
+    resultados = [maestro.aplanar(tipo, items) for items in listas]
+    maestro.metricas.observar("llamada_esclavo_segundos", respuesta.duracion, esclavo=grupos[tipo][shard].tipo,
+                              replica=replica.nombre, endpoint="batch")
+    maestro.registrar_llamada(trace_id, replica.nombre, f"(lote de {len(resultados)} consultas)",
+                              respuesta.duracion, respuesta.headers.get("Server-Timing"), respuesta.bytes)
+    return (replica.nombre, version), resultados
+
+async def home(request):
+    return web.Response(text="Servidor maestro en funcionamiento. Usa /query para consultas.",
+                        content_type="text/html")
+
+async def query(request):
+    cronometro = trazas.Cronometro()
+    trace_id = trazas.trace_id_de(request.headers.get(trazas.CABECERA_TRAZA))
+    consulta_titulo = request.query.get("titulo", "")
+    edad = entero(request.query.get("edad"))
+    tipos = request.query.get("tipo_doc", "")
+    limite = entero(request.query.get("limit"))
+    desplazamiento = entero(request.query.get("offset"), 0)
+    if (limite is not None and limite < 0) or desplazamiento < 0:
+        return respuesta_json({"error": "limit y offset deben ser enteros no negativos"}, 400)
+
+    tipos_requeridos = maestro.tipos_de(tipos)
+    clave = maestro.clave_cache(consulta_titulo, edad, tipos_requeridos, limite, desplazamiento)
+    resultados_totales = maestro.en_cache_vigente(clave)
+    cronometro.marcar("cache")
+    if resultados_totales is not None:
+        response = respuesta_json(resultados_totales, headers={"X-Resultado-Parcial": "false", "X-Cache": "HIT",
+                                                               trazas.CABECERA_TRAZA: trace_id})
+        cronometro.marcar("serializar")
+        maestro.registrar_metricas(cronometro, "query", aciertos=1)
+        return response
+
+    params = {"titulo": consulta_titulo}
+    if edad is not None:
+        params["edad"] = str(edad)
+    if limite is not None:
+        # Cada esclavo solo necesita su top-(offset + limit) para armar la página
+        params["limit"] = str(desplazamiento + limite)
+
+    sesion = request.app["sesion"]
+    inicio = time.monotonic()
+    tareas = {}
+    for tipo in tipos_requeridos:
+        esclavo = esclavos.get(tipo)
+        if esclavo:
+            timeout = min(float(esclavo.get("timeout", maestro.TIMEOUT_ESCLAVO)), maestro.DEADLINE_CONSULTA)
+            for shard in range(len(grupos[tipo])):
+                tareas[(tipo, shard)] = asyncio.ensure_future(
+                    consultar_esclavo(sesion, tipo, shard, params, timeout, trace_id))
+    if tareas:
+        await asyncio.wait(tareas.values(),
+                           timeout=max(0.0, maestro.DEADLINE_CONSULTA - (time.monotonic() - inicio)))
+    cronometro.marcar("fanout")
+
+    resultados_por_tipo = {}
+    versiones_usadas = []
+    replicas_usadas = []
+    esclavos_pendientes = []
+    esclavos_fallidos = []
+    for (tipo, shard), tarea in tareas.items():
+        nombre = grupos[tipo][shard].tipo
+        resultados_por_tipo.setdefault(tipo, [])
+        if not tarea.done():
+            # Se cancela la petición: no queda nada corriendo después de responder
+            tarea.cancel()
+            esclavos_pendientes.append(nombre)
+            maestro.registrar_fallo_esclavo(nombre, pendiente=True)
+            print(f"Esclavo {nombre} no respondió dentro del plazo de {maestro.DEADLINE_CONSULTA}s")
+            continue
+        try:
+            replica_version, resultados = tarea.result()
+            versiones_usadas.append((tipo, replica_version))
+            replicas_usadas.append(f"{nombre}={replica_version[0]}")
+            resultados_por_tipo[tipo].append(resultados)
+        except (*replicas_async.ERRORES_RED, ValueError) as e:
+            esclavos_fallidos.append(nombre)
+            maestro.registrar_fallo_esclavo(nombre, pendiente=False)
+            print(f"Error consultando al esclavo {nombre}: {e!r}")
+
+    resultados_totales = maestro.combinar_tipos(resultados_por_tipo, limite, desplazamiento)
+    parcial = bool(esclavos_pendientes or esclavos_fallidos)
+    if not parcial:
+        cache.guardar(clave, (tuple(versiones_usadas), resultados_totales))
+    cronometro.marcar("combinar")
+
+    headers = {
+        "X-Cache": "MISS",
+        trazas.CABECERA_TRAZA: trace_id,
+        "X-Resultado-Parcial": "true" if parcial else "false",
+        "X-Replicas": ",".join(replicas_usadas)
+    }
+    if esclavos_pendientes:
+        headers["X-Esclavos-Pendientes"] = ",".join(esclavos_pendientes)
+    if esclavos_fallidos:
+        headers["X-Esclavos-Fallidos"] = ",".join(esclavos_fallidos)
+    response = respuesta_json(resultados_totales, headers=headers)
+    cronometro.marcar("serializar")
+    maestro.registrar_metricas(cronometro, "query", parcial=parcial, fallos=1)
+    return response
+
+async def query_batch(request):
+    """Como maestro.query_batch: un solo /query/batch por shard con las consultas que no están en cache"""
+    cronometro = trazas.Cronometro()
+    trace_id = trazas.trace_id_de(request.headers.get(trazas.CABECERA_TRAZA))
+    # Igual que request.get_json(silent=True) de Flask
+    cuerpo = None
+    if request.content_type == "application/json":
+        try:
+            cuerpo = json.loads(await request.text())
+        except ValueError:
+            pass
+    consultas, limite, desplazamiento, error = leer_lote(cuerpo, maestro.MAX_LOTE)
+    if error:
+        return respuesta_json({"error": error[0]}, error[1])
+    tipo_doc = cuerpo.get("tipo_doc") or ""
+    if not isinstance(tipo_doc, str):
+        return respuesta_json({"error": "tipo_doc debe ser texto"}, 400)
+    tipos_requeridos = maestro.tipos_de(tipo_doc)
+
+    # Primero el cache (compartido con /query); las consultas repetidas se piden una vez
+    claves = [maestro.clave_cache(titulo, edad, tipos_requeridos, limite, desplazamiento)
+              for titulo, edad in consultas]
+    respuestas = [maestro.en_cache_vigente(clave) for clave in claves]
+    faltantes = {}
+    for numero, clave in enumerate(claves):
+        if respuestas[numero] is None and clave not in faltantes:
+            faltantes[clave] = numero
+    aciertos = sum(1 for resultados in respuestas if resultados is not None)
+    cronometro.marcar("cache")
+
+    esclavos_pendientes = []
+    esclavos_fallidos = []
+    replicas_usadas = []
+    if faltantes:
+        pedidas = list(faltantes.values())
+        cuerpo_esclavo = {"consultas": [{"titulo": consultas[n][0], "edad": consultas[n][1]} for n in pedidas]}
+        if limite is not None:
+            cuerpo_esclavo["limit"] = desplazamiento + limite
+
+        sesion = request.app["sesion"]
+        inicio = time.monotonic()
+        tareas = {}
+        for tipo in tipos_requeridos:
+            if esclavos.get(tipo):
+                for shard in range(len(grupos[tipo])):
+                    tareas[(tipo, shard)] = asyncio.ensure_future(consultar_lote_esclavo(
+                        sesion, tipo, shard, cuerpo_esclavo, maestro.DEADLINE_LOTE, trace_id))
+        if tareas:
+            await asyncio.wait(tareas.values(),
+                               timeout=max(0.0, maestro.DEADLINE_LOTE - (time.monotonic() - inicio)))
+        cronometro.marcar("fanout")
+
+        por_consulta = [{} for _ in pedidas]
+        versiones_usadas = []
+        for (tipo, shard), tarea in tareas.items():
+            nombre = grupos[tipo][shard].tipo
+            for resultados_por_tipo in por_consulta:
+                resultados_por_tipo.setdefault(tipo, [])
+            if not tarea.done():
+                tarea.cancel()
+                esclavos_pendientes.append(nombre)
+                maestro.registrar_fallo_esclavo(nombre, pendiente=True)
+                print(f"Esclavo {nombre} no respondió el lote dentro del plazo de {maestro.DEADLINE_LOTE}s")
+                continue
+            try:
+                replica_version, resultados_lote = tarea.result()
+            except (*replicas_async.ERRORES_RED, ValueError) as e:
+                esclavos_fallidos.append(nombre)
+                maestro.registrar_fallo_esclavo(nombre, pendiente=False)
+                print(f"Error consultando el lote al esclavo {nombre}: {e!r}")
+                continue
+            versiones_usadas.append((tipo, replica_version))
+            replicas_usadas.append(f"{nombre}={replica_version[0]}")
+            for resultados_por_tipo, resultados in zip(por_consulta, resultados_lote):
+                resultados_por_tipo[tipo].append(resultados)
+
+        parcial = bool(esclavos_pendientes or esclavos_fallidos)
+        for (clave, numero), resultados_por_tipo in zip(faltantes.items(), por_consulta):
+            respuestas[numero] = maestro.combinar_tipos(resultados_por_tipo, limite, desplazamiento)
+            if not parcial:
+                cache.guardar(clave, (tuple(versiones_usadas), respuestas[numero]))
+        for numero, clave in enumerate(claves):
+            if respuestas[numero] is None:
+                respuestas[numero] = respuestas[faltantes[clave]]
+        cronometro.marcar("combinar")
+
+    parcial = bool(esclavos_pendientes or esclavos_fallidos)
+    headers = {
+        "X-Resultado-Parcial": "true" if parcial else "false",
+        "X-Cache-Aciertos": str(aciertos),
+        trazas.CABECERA_TRAZA: trace_id,
+        "X-Replicas": ",".join(replicas_usadas)
+    }
+    if esclavos_pendientes:
+        headers["X-Esclavos-Pendientes"] = ",".join(esclavos_pendientes)
+    if esclavos_fallidos:
+        headers["X-Esclavos-Fallidos"] = ",".join(esclavos_fallidos)
+    response = respuesta_json(respuestas, headers=headers)
+    cronometro.marcar("serializar")
+    maestro.registrar_metricas(cronometro, "batch", parcial=parcial, aciertos=aciertos,
+                               fallos=len(consultas) - aciertos)
+    return response
+
+async def cache_stats(request):
+    return respuesta_json(cache.estadisticas())
+
+async def replicas_stats(request):
+    return respuesta_json({grupo.tipo: grupo.estadisticas() for shards in grupos.values() for grupo in shards})
+
+async def metrics(request):
+    if request.query.get("formato") == "json":
+        return respuesta_json(resumen(maestro.metricas.a_dict()))
+    texto = formato_prometheus(maestro.metricas.a_dict(), "maestro", maestro.medidores())
+    return web.Response(body=texto.encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4"})
+
+async def sesion_esclavos(app):
+    # Conexiones keep-alive hacia los esclavos; con POOL_BLOQUEAR el tamaño del pool es un límite por réplica
+    conector = aiohttp.TCPConnector(limit=0, limit_per_host=maestro.POOL_TAMANIO if maestro.POOL_BLOQUEAR else 0)
+    async with aiohttp.ClientSession(connector=conector) as sesion:
+        app["sesion"] = sesion
+        yield
+
+def crear_app():
+    app = web.Application()
+    app.cleanup_ctx.append(sesion_esclavos)
+    app.router.add_get("/", home)
+    app.router.add_get("/query", query)
+    app.router.add_post("/query/batch", query_batch)
+    app.router.add_get("/cache/stats", cache_stats)
+    app.router.add_get("/replicas/stats", replicas_stats)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+if __name__ == "__main__":
+    # Los chequeos de /health siguen en su hilo, igual que en maestro.py
+    maestro.iniciar_vigilancia_versiones()
+    web.run_app(crear_app(), port=maestro.PUERTO_MAESTRO, access_log=None)
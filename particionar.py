@@ -0,0 +1,37 @@
+import argparse
+import json
+import os
+from utils.particion import METODOS_PARTICION, particionar
+
+def main():
+    parser = argparse.ArgumentParser(description="Divide una colección JSON en archivos de shards para esclavo.py")
+    parser.add_argument("archivo", help="colección original, p. ej. esclavos/libros.json")
+    parser.add_argument("shards", type=int, help="cantidad de shards")
+    parser.add_argument("--metodo", choices=METODOS_PARTICION, default="hash",
+                        help="hash del id del documento o rangos contiguos de posiciones")
+    parser.add_argument("--destino", default=None, help="directorio de salida (por defecto el de la colección)")
+    args = parser.parse_args()
+
+    with open(args.archivo, 'r', encoding='utf-8') as f:
+        documentos = json.load(f)
+
+    destino = args.destino or os.path.dirname(args.archivo)
+    os.makedirs(destino or ".", exist_ok=True)
+    base = os.path.splitext(os.path.basename(args.archivo))[0]
+
+    try:
+        shards = particionar(documentos, args.shards, args.metodo)
+    except ValueError as e:
+        parser.error(str(e))
+    for numero, documentos_shard in enumerate(shards):
+        ruta = os.path.join(destino, f"{base}.shard{numero}-de-{args.shards}.json")
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(documentos_shard, f, ensure_ascii=False, indent=2)
+        print(f"Shard {numero}: {len(documentos_shard)} documentos -> {ruta}")
+
+    print(f"Colección de {len(documentos)} documentos dividida en {args.shards} shards ({args.metodo}).")
+    print("Inicie un esclavo por shard con ARCHIVO_DATOS, SHARD_ID, NUM_SHARDS y METODO_PARTICION, y declare los")
+    print('shards del tipo en config/esclavos_config.json con "shards": [{"host": ..., "port": ...}, ...]')
+
+if __name__ == "__main__":
+    main()
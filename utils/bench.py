@@ -0,0 +1,119 @@
+import datetime
+import os
+import platform
+import subprocess
+import timeit
+import numpy as np
+from utils import ranking
+
+# Versión del formato de los resultados; comparar() no mezcla versiones distintas
+VERSION_RESULTADOS = 1
+
+def metadatos():
+    """Commit, intérprete y máquina de la corrida, para saber qué se está comparando"""
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=raiz, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "version": VERSION_RESULTADOS,
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "maquina": platform.node(),
+        "cpus": os.cpu_count()
+    }
+
+def medir(funcion, operaciones=1, repeticiones=5):
+    """
+    Nanosegundos por operación de `funcion` (que hace `operaciones`
+    operaciones por llamada). Como timeit: se calibra la cantidad de llamadas
+    para que cada repetición dure al menos 0,2 s y se informa la mediana y el
+    mínimo de las repeticiones.
+    """
+    cronometro = timeit.Timer(funcion)
+    llamadas, _ = cronometro.autorange()
+    tiempos = np.array(cronometro.repeat(repeat=repeticiones, number=llamadas)) / (llamadas * operaciones) * 1e9
+    return {"ns_por_op": round(float(np.median(tiempos)), 1), "ns_por_op_min": round(float(tiempos.min()), 1),
+            "llamadas": llamadas * repeticiones}
+
+def microbenchmarks(documentos, consultas, rangos, intereses, limite=10, max_lineal=100_000, repeticiones=5):
+    """
+    normalizar, calcular_puntaje y aplicar_ranking (recorrido lineal y con
+    índice invertido) sobre `documentos`. Cada medición recorre la misma
+    mezcla de `consultas`, así los números son comparables entre commits.
+    """
+    resultados = {}
+    cantidad = len(documentos)
+    muestra = documentos[:1000]
+    titulos = [doc["titulo"] for doc in muestra]
+    ascii_ = [titulo for titulo in titulos if titulo.isascii()] or ["Origen del codigo"]
+    con_tildes = [titulo for titulo in titulos if not titulo.isascii()] or ["Código del programación"]
+    resultados["normalizar/ascii"] = medir(lambda: [ranking.normalizar(t) for t in ascii_], len(ascii_), repeticiones)
+    resultados["normalizar/tildes"] = medir(lambda: [ranking.normalizar(t) for t in con_tildes], len(con_tildes),
+                                            repeticiones)
+
+    palabras_clave = ranking.extraer_palabras_clave(consultas[0]["titulo"])
+    grupo_etario = ranking.determinar_grupo_etario(consultas[0].get("edad", ranking.EDAD_POR_DEFECTO), rangos)
+    resultados["calcular_puntaje"] = medir(
+        lambda: [ranking.calcular_puntaje(doc, palabras_clave, grupo_etario, intereses) for doc in muestra],
+        len(muestra), repeticiones)
+
+    def rankear(indice, limite_consulta):
+        for consulta in consultas:
+            ranking.aplicar_ranking(documentos, consulta["titulo"], consulta.get("edad"), rangos, intereses,
+                                    indice=indice, limite=limite_consulta)
+
+    if cantidad <= max_lineal:
+        resultados[f"aplicar_ranking/lineal/top{limite}/{cantidad}"] = medir(
+            lambda: rankear(None, limite), len(consultas), repeticiones)
+
+    inicio = timeit.default_timer()
+    indice = ranking.construir_indice(documentos)
+    resultados[f"construir_indice/{cantidad}"] = {
+        "ns_por_op": round((timeit.default_timer() - inicio) * 1e9 / max(cantidad, 1), 1), "llamadas": 1}
+    resultados[f"aplicar_ranking/indice/top{limite}/{cantidad}"] = medir(
+        lambda: rankear(indice, limite), len(consultas), repeticiones)
+    resultados[f"aplicar_ranking/indice/todo/{cantidad}"] = medir(
+        lambda: rankear(indice, None), len(consultas), repeticiones)
+    return resultados
+
+# Métricas con dirección conocida; las demás (conteos, llamadas, el máximo,
+# que es una sola muestra y varía mucho) son informativas
+MAYOR_ES_MEJOR = ("throughput",)
+MENOR_ES_MEJOR = ("ns_por_op", "latencia_p", "latencia_media", "tasa_errores")
+
+def _direccion(metrica):
+    if metrica.startswith(MAYOR_ES_MEJOR):
+        return 1
+    if metrica.startswith(MENOR_ES_MEJOR):
+        return -1
+    return 0
+
+def comparar(base, nuevo, tolerancia=0.10):
+    """
+    Compara dos resultados del mismo tipo medición por medición. Devuelve una
+    lista de (medición, métrica, valor base, valor nuevo, cambio relativo,
+    es_regresion); es regresión si empeora más que `tolerancia` (0.10 = 10%).
+    """
+    if base["metadatos"]["version"] != nuevo["metadatos"]["version"] or base["tipo"] != nuevo["tipo"]:
+        raise ValueError("Los resultados no son comparables (distinto tipo o versión de formato)")
+    filas = []
+    for nombre, metricas in nuevo["resultados"].items():
+        anteriores = base["resultados"].get(nombre)
+        if anteriores is None:
+            continue
+        for metrica, valor in metricas.items():
+            direccion = _direccion(metrica)
+            anterior = anteriores.get(metrica)
+            if not direccion or not isinstance(valor, (int, float)) or not isinstance(anterior, (int, float)):
+                continue
+            if anterior == 0:
+                cambio = 0.0 if valor == 0 else float("inf")
+            else:
+                cambio = (valor - anterior) / anterior
+            filas.append((nombre, metrica, anterior, valor, cambio, -direccion * cambio > tolerancia))
+    return filas
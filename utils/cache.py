@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+
+class CacheLRU:
+    """
+    Cache acotado con expulsión LRU y expiración por TTL.
+    Es seguro para usar desde varios hilos y lleva contadores de
+    aciertos, fallos, expulsiones, expiraciones e invalidaciones.
+    """
+    def __init__(self, capacidad=1024, ttl=60.0):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.entradas = OrderedDict()  # clave -> (expira, valor)
+        self.lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expiraciones = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado o None si no existe o ya expiró"""
+        ahora = time.monotonic()
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            expira, valor = entrada
+            if expira <= ahora:
+                del self.entradas[clave]
+                self.expiraciones += 1
+                self.fallos += 1
+                return None
+            self.entradas.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor):
+        if self.capacidad <= 0:
+            return
+        with self.lock:
+            self.entradas[clave] = (time.monotonic() + self.ttl, valor)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.capacidad:
+                self.entradas.popitem(last=False)
+                self.expulsiones += 1
+
+    def invalidar(self, predicado=None):
+        """Elimina las entradas cuya clave cumple el predicado (o todas si no se indica)"""
+        with self.lock:
+            if predicado is None:
+                claves = list(self.entradas)
+            else:
+                claves = [clave for clave in self.entradas if predicado(clave)]
+            for clave in claves:
+                del self.entradas[clave]
+            self.invalidaciones += len(claves)
+            return len(claves)
+
+    def estadisticas(self):
+        with self.lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "capacidad": self.capacidad,
+                "ttl": self.ttl,
+                "entradas": len(self.entradas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "expulsiones": self.expulsiones,
+                "expiraciones": self.expiraciones,
+                "invalidaciones": self.invalidaciones
+            }
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import aiohttp
+import numpy as np
+import Pyro5.api
+import Pyro5.errors
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class EntornoLocal:
+    """
+    Sistema completo en procesos locales para pruebas de carga: servidor de
+    nombres Pyro5, log_sv.py, un esclavo por colección y el maestro. Todo usa
+    puertos libres y un directorio de trabajo propio (logs.csv, salida de cada
+    proceso, el esclavos_config.json generado, el desborde de logs y las
+    métricas de los workers), así no choca con un sistema que ya esté
+    corriendo. Se usa como context manager.
+    """
+    def __init__(self, colecciones, directorio, maestro="maestro.py", workers=1, espera=300.0):
+        self.colecciones = colecciones  # tipo -> ruta del JSON
+        # Absoluto: los hijos corren con cwd=RAIZ
+        self.directorio = os.path.abspath(directorio)
+        self.maestro = maestro
+        self.workers = workers
+        self.espera = espera
+        self.procesos = []
+        self.puerto_ns = puerto_libre()
+        self.puerto_maestro = puerto_libre()
+        self.url_maestro = f"http://127.0.0.1:{self.puerto_maestro}"
+        # Los hijos heredan el entorno (p. ej. CACHE_TAMANIO=0) y buscan el servidor de nombres propio.
+        # El desborde va aparte: sus archivos los reclama cualquier proceso que comparta el directorio.
+        self.entorno = dict(os.environ, PYRO_NS_HOST="127.0.0.1", PYRO_NS_PORT=str(self.puerto_ns),
+                            PYTHONUNBUFFERED="1", LOG_DESBORDE_DIR=os.path.join(self.directorio, "desborde"))
+
+    def _lanzar(self, nombre, argumentos, **variables):
+        salida = open(os.path.join(self.directorio, f"{nombre}.log"), 'w', encoding='utf-8')
+        proceso = subprocess.Popen([sys.executable, *argumentos], cwd=RAIZ, stdout=salida,
+                                   stderr=subprocess.STDOUT, env=dict(self.entorno, **variables))
+        self.procesos.append((nombre, proceso, salida))
+        return proceso
+
+    def _esperar(self, nombre, proceso, listo):
+        limite = time.monotonic() + self.espera
+        while time.monotonic() < limite:
+            if proceso.poll() is not None:
+                raise RuntimeError(f"{nombre} terminó al iniciar; ver {self.directorio}/{nombre}.log")
+            try:
+                if listo():
+                    return
+            except (requests.RequestException, Pyro5.errors.PyroError, OSError):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{nombre} no quedó listo en {self.espera}s; ver {self.directorio}/{nombre}.log")
+
+    def iniciar(self):
+        os.makedirs(self.directorio, exist_ok=True)
+        try:
+            self._iniciar()
+        except BaseException:
+            self.detener()
+            raise
+
+    def _iniciar(self):
+        ns = self._lanzar("nameserver", ["-m", "Pyro5.nameserver", "-n", "127.0.0.1", "-p", str(self.puerto_ns)])
+        self._esperar("nameserver", ns, lambda: Pyro5.api.locate_ns("127.0.0.1", self.puerto_ns) is not None)
+        log_sv = self._lanzar("log_sv", ["log_sv.py"], LOG_ARCHIVO=os.path.join(self.directorio, "logs.csv"),
+                              LOG_DIR_SEGMENTOS="")
+        self._esperar("log_sv", log_sv,
+                      lambda: Pyro5.api.locate_ns("127.0.0.1", self.puerto_ns).lookup("centralizado.logger"))
+
+        config = {}
+        esclavos = []
+        for tipo, ruta in self.colecciones.items():
+            puerto = puerto_libre()
+            config[tipo] = {"host": "127.0.0.1", "port": puerto, "archivo": ruta}
+            # Un directorio de métricas por esclavo: /metrics combina todo lo que encuentra en él
+            proceso = self._lanzar(f"esclavo-{tipo}", ["esclavo.py"], ARCHIVO_DATOS=os.path.abspath(ruta),
+                                   PUERTO=str(puerto), WORKERS=str(self.workers),
+                                   METRICAS_DIR=os.path.join(self.directorio, "metricas", tipo))
+            esclavos.append((f"esclavo-{tipo}", proceso, f"http://127.0.0.1:{puerto}/health"))
+        # Los esclavos cargan sus colecciones en paralelo
+        for nombre, proceso, url in esclavos:
+            self._esperar(nombre, proceso, lambda: requests.get(url, timeout=1).ok)
+
+        ruta_config = os.path.join(self.directorio, "esclavos_config.json")
+        with open(ruta_config, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+        maestro = self._lanzar("maestro", [self.maestro], ESCLAVOS_CONFIG=ruta_config,
+                               PUERTO_MAESTRO=str(self.puerto_maestro))
+        self._esperar("maestro", maestro, lambda: requests.get(self.url_maestro + "/", timeout=1).ok)
+
+    def detener(self):
+        # En orden inverso: el maestro y los esclavos vacían sus logs antes de que baje log_sv
+        for nombre, proceso, salida in reversed(self.procesos):
+            if proceso.poll() is None:
+                proceso.send_signal(signal.SIGTERM)
+                try:
+                    proceso.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    print(f"{nombre} no terminó con SIGTERM; se fuerza")
+                    proceso.kill()
+                    proceso.wait()
+            salida.close()
+        self.procesos = []
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *excepcion):
+        self.detener()
+
+async def _consultar(sesion, url, consulta, muestras, inicio, calentamiento, programada=None):
+    # En lazo abierto la latencia se mide desde el instante programado: si el
+    # sistema se atrasa, la espera del cliente también cuenta (sin omisión coordinada)
+    desde = programada if programada is not None else time.perf_counter()
+    try:
+        async with sesion.get(url, params=consulta) as response:
+            await response.read()
+            status, cache = response.status, response.headers.get("X-Cache")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        status, cache = None, None
+    fin = time.perf_counter()
+    if desde - inicio >= calentamiento:
+        muestras.append((fin - desde, status, cache))
+
+def _parametros(consulta, limite):
+    parametros = {clave: str(valor) for clave, valor in consulta.items()}
+    if limite is not None:
+        parametros["limit"] = str(limite)
+    return parametros
+
+async def lazo_cerrado(url, consultas, concurrencia, duracion, calentamiento=0.0, limite=10, timeout=10.0):
+    """
+    `concurrencia` clientes que mandan la siguiente consulta apenas reciben
+    la respuesta anterior, durante `calentamiento + duracion` segundos.
+    Devuelve las muestras (latencia, status, X-Cache) posteriores al calentamiento.
+    """
+    muestras = []
+    inicio = time.perf_counter()
+    fin = inicio + calentamiento + duracion
+    conector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=conector, timeout=aiohttp.ClientTimeout(total=timeout)) as sesion:
+        async def cliente(numero):
+            posicion = numero
+            while time.perf_counter() < fin:
+                consulta = _parametros(consultas[posicion % len(consultas)], limite)
+                await _consultar(sesion, url, consulta, muestras, inicio, calentamiento)
+                posicion += concurrencia
+        await asyncio.gather(*(cliente(numero) for numero in range(concurrencia)))
+    return muestras
+
+async def lazo_abierto(url, consultas, tasa, duracion, calentamiento=0.0, limite=10, timeout=10.0, semilla=0):
+    """
+    Llegadas de Poisson a `tasa` consultas por segundo, independientes de lo
+    que tarden las respuestas (como el tráfico real). Devuelve las muestras
+    de las consultas programadas después del calentamiento.
+    """
+    muestras = []
+    generador = np.random.default_rng(semilla)
+    total = calentamiento + duracion
+    llegadas = np.cumsum(generador.exponential(1.0 / tasa, size=int(total * tasa * 1.2) + 10))
+    llegadas = llegadas[llegadas < total]
+    conector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=conector, timeout=aiohttp.ClientTimeout(total=timeout)) as sesion:
+        inicio = time.perf_counter()
+        tareas = []
+        for numero, llegada in enumerate(llegadas.tolist()):
+            espera = inicio + llegada - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            consulta = _parametros(consultas[numero % len(consultas)], limite)
+            tareas.append(asyncio.ensure_future(
+                _consultar(sesion, url, consulta, muestras, inicio, calentamiento, programada=inicio + llegada)))
+        await asyncio.gather(*tareas)
+    return muestras
+
+def resumir(muestras, duracion):
+    """Throughput, errores, aciertos de cache y percentiles de latencia (ms) de una corrida"""
+    latencias = np.array([latencia for latencia, status, _ in muestras if status == 200]) * 1000
+    errores = sum(1 for _, status, _ in muestras if status != 200)
+    aciertos = sum(1 for _, status, cache in muestras if status == 200 and cache == "HIT")
+    resumen = {
+        "peticiones": len(muestras),
+        "errores": errores,
+        "tasa_errores": round(errores / len(muestras), 6) if muestras else 0.0,
+        "throughput": round(len(latencias) / duracion, 3),
+        "tasa_aciertos_cache": round(aciertos / len(latencias), 4) if len(latencias) else 0.0
+    }
+    if len(latencias):
+        p50, p90, p99 = np.percentile(latencias, [50, 90, 99]).tolist()
+        resumen.update({"latencia_p50_ms": round(p50, 3), "latencia_p90_ms": round(p90, 3),
+                        "latencia_p99_ms": round(p99, 3), "latencia_media_ms": round(float(latencias.mean()), 3),
+                        "latencia_max_ms": round(float(latencias.max()), 3)})
+    return resumen
+
+def etapas_maestro(url_maestro):
+    """p50/p99 por etapa según el /metrics del maestro, para ver dónde se fue el tiempo"""
+    try:
+        metricas = requests.get(url_maestro + "/metrics", params={"formato": "json"}, timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return {}
+    etapas = {}
+    for serie in metricas["histogramas"]:
+        if serie["nombre"] == "etapa_segundos" and serie["etiquetas"].get("endpoint") == "query":
+            etapas[serie["etiquetas"]["etapa"]] = {
+                "p50_ms": round(serie["p50"] * 1000, 3) if serie["p50"] is not None else None,
+                "p99_ms": round(serie["p99"] * 1000, 3) if serie["p99"] is not None else None
+            }
+    return etapas
@@ -0,0 +1,101 @@
+import json
+import os
+from collections import Counter, namedtuple
+import numpy as np
+
+# Palabras de los títulos (de más a menos frecuente) y categorías de una colección
+Vocabulario = namedtuple("Vocabulario", ["palabras", "categorias"])
+
+# Los títulos de las colecciones de ejemplo son "<Palabra> del <palabra>"
+CONECTOR = "del"
+# Exponente de la ley de Zipf con que se eligen las palabras: pocas muy
+# frecuentes (posting lists largas) y muchas raras, como en un catálogo real
+EXPONENTE_ZIPF = 1.1
+BLOQUE = 100_000
+
+def cargar_vocabulario(rutas):
+    """Vocabulario de títulos y categorías tomado de colecciones JSON existentes"""
+    frecuencias = Counter()
+    categorias = []
+    for ruta in rutas:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            for doc in json.load(f):
+                frecuencias.update(palabra.lower() for palabra in doc.get("titulo", "").split()
+                                   if palabra.lower() != CONECTOR)
+                if doc.get("categoria") and doc["categoria"] not in categorias:
+                    categorias.append(doc["categoria"])
+    # Empates por orden alfabético, para que el vocabulario no dependa del orden de los archivos
+    palabras = [palabra for palabra, _ in sorted(frecuencias.items(), key=lambda par: (-par[1], par[0]))]
+    return Vocabulario(palabras, sorted(categorias))
+
+def ampliar(vocabulario, terminos):
+    """
+    Lleva el vocabulario de títulos a `terminos` palabras derivando variantes
+    numeradas de las originales ("origen", "origen2", ...). Con catálogos
+    grandes y pocas palabras todas las consultas coinciden con una fracción
+    enorme de los documentos; más términos dan posting lists más realistas.
+    """
+    palabras = list(vocabulario.palabras)
+    variante = 2
+    while len(palabras) < terminos:
+        palabras.extend(f"{palabra}{variante}" for palabra in vocabulario.palabras[:terminos - len(palabras)])
+        variante += 1
+    return Vocabulario(palabras[:max(terminos, 1)], vocabulario.categorias)
+
+def _probabilidades_zipf(cantidad):
+    pesos = 1.0 / np.arange(1, cantidad + 1) ** EXPONENTE_ZIPF
+    return pesos / pesos.sum()
+
+def generar_documentos(vocabulario, cantidad, semilla=0, bloque=BLOQUE):
+    """
+    Genera `cantidad` documentos {"titulo", "categoria"} en listas de a
+    `bloque`. La misma semilla produce siempre el mismo catálogo.
+    """
+    generador = np.random.default_rng(semilla)
+    probabilidades = _probabilidades_zipf(len(vocabulario.palabras))
+    palabras = vocabulario.palabras
+    capitalizadas = [palabra.capitalize() for palabra in palabras]
+    categorias = vocabulario.categorias
+    for inicio in range(0, cantidad, bloque):
+        tamanio = min(bloque, cantidad - inicio)
+        primeras = generador.choice(len(palabras), size=tamanio, p=probabilidades)
+        segundas = generador.choice(len(palabras), size=tamanio, p=probabilidades)
+        categoria_de = generador.integers(0, len(categorias), size=tamanio)
+        yield [
+            {"titulo": f"{capitalizadas[a]} {CONECTOR} {palabras[b]}", "categoria": categorias[c]}
+            for a, b, c in zip(primeras.tolist(), segundas.tolist(), categoria_de.tolist())
+        ]
+
+def escribir_catalogo(ruta, vocabulario, cantidad, semilla=0):
+    """
+    Escribe un catálogo sintético como colección JSON para esclavo.py, por
+    bloques (no arma la lista completa en memoria). La escritura es atómica.
+    """
+    temporal = ruta + ".tmp"
+    escritos = 0
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for documentos in generar_documentos(vocabulario, cantidad, semilla):
+            for doc in documentos:
+                f.write(",\n" if escritos else "\n")
+                f.write(json.dumps(doc, ensure_ascii=False))
+                escritos += 1
+        f.write("\n]\n")
+    os.replace(temporal, ruta)
+    return {"documentos": escritos, "terminos": len(vocabulario.palabras), "bytes": os.path.getsize(ruta)}
+
+def generar_consultas(vocabulario, cantidad, semilla=0, edad_ausente=0.2):
+    """
+    Consultas {"titulo", "edad"} con una o dos palabras elegidas con la misma
+    distribución que los títulos; en una fracción `edad_ausente` no va la edad.
+    """
+    generador = np.random.default_rng(semilla)
+    probabilidades = _probabilidades_zipf(len(vocabulario.palabras))
+    consultas = []
+    for _ in range(cantidad):
+        palabras = generador.choice(len(vocabulario.palabras), size=int(generador.integers(1, 3)), p=probabilidades)
+        consulta = {"titulo": " ".join(vocabulario.palabras[p] for p in palabras.tolist())}
+        if generador.random() >= edad_ausente:
+            consulta["edad"] = int(generador.integers(10, 91))
+        consultas.append(consulta)
+    return consultas
@@ -0,0 +1,72 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+class PoolEsclavo:
+    """
+    Cliente HTTP con conexiones persistentes (keep-alive) hacia un esclavo.
+    `tamanio` es la cantidad de conexiones que se mantienen abiertas para
+    reutilizar; con `bloquear=True` además es el máximo de conexiones
+    simultáneas y las peticiones extra esperan a que se libere una.
+    """
+    def __init__(self, host, port, tamanio=10, bloquear=False):
+        self.base_url = f"http://{host}:{port}"
+        self.tamanio = tamanio
+        self.bloquear = bloquear
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=tamanio,
+                                   pool_block=bloquear, max_retries=0)
+        self.session.mount("http://", self.adapter)
+        self.lock = threading.Lock()
+        self.peticiones = 0
+        self.errores = 0
+
+    def get(self, ruta, **kwargs):
+        return self.peticion("GET", ruta, **kwargs)
+
+    def post(self, ruta, **kwargs):
+        return self.peticion("POST", ruta, **kwargs)
+
+    def peticion(self, metodo, ruta, **kwargs):
+        with self.lock:
+            self.peticiones += 1
+        try:
+            return self.session.request(metodo, self.base_url + ruta, **kwargs)
+        except requests.exceptions.RequestException:
+            with self.lock:
+                self.errores += 1
+            raise
+
+    def estadisticas(self):
+        """Conexiones abiertas vs peticiones servidas según los pools de urllib3"""
+        conexiones = 0
+        peticiones_http = 0
+        inactivas = 0
+        pools = self.adapter.poolmanager.pools
+        for clave in list(pools.keys()):
+            pool = pools.get(clave)
+            if pool is None:
+                continue
+            conexiones += pool.num_connections
+            peticiones_http += pool.num_requests
+            # Tras close()/clear() urllib3 deja pool.pool en None: no quedan ociosas
+            cola = pool.pool
+            if cola is None:
+                continue
+            # La cola guarda None en los huecos libres; el resto son conexiones ociosas
+            inactivas += sum(1 for conexion in list(cola.queue) if conexion is not None)
+        with self.lock:
+            peticiones, errores = self.peticiones, self.errores
+        return {
+            "url": self.base_url,
+            "tamanio": self.tamanio,
+            "bloquear": self.bloquear,
+            "peticiones": peticiones,
+            "errores": errores,
+            "conexiones_creadas": conexiones,
+            "conexiones_reutilizadas": max(0, peticiones_http - conexiones),
+            "conexiones_inactivas": inactivas
+        }
+
+    def cerrar(self):
+        self.session.close()
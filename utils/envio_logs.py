@@ -0,0 +1,462 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+import Pyro5.api
+import Pyro5.core
+import Pyro5.errors
+
+POLITICAS = ("descartar_nuevos", "descartar_antiguos")
+
+# URIs PYRONAME: ya resueltas a PYRO:host:puerto, compartidas por todos los
+# hilos y enviadores del proceso: reconectar no vuelve a pasar por el
+# servidor de nombres salvo que la URI resuelta deje de responder
+_uris_resueltas = {}
+_lock_uris = threading.Lock()
+
+def resolver(uri):
+    if not uri.startswith("PYRONAME:"):
+        return uri
+    with _lock_uris:
+        resuelta = _uris_resueltas.get(uri)
+    if resuelta is None:
+        resuelta = str(Pyro5.core.resolve(uri))
+        with _lock_uris:
+            _uris_resueltas[uri] = resuelta
+    return resuelta
+
+def olvidar(uri):
+    """Descarta la resolución guardada (p. ej. log_sv.py reinició en otro puerto)"""
+    with _lock_uris:
+        _uris_resueltas.pop(uri, None)
+
+class Interruptor:
+    """
+    Circuit breaker del envío de logs. Cerrado: se envía normalmente. Tras
+    `fallos_apertura` errores seguidos se abre y no se intenta nada hasta que
+    pasa la espera; entonces queda semiabierto y el próximo envío es la
+    prueba: si sale bien se cierra, si falla se vuelve a abrir con el doble de
+    espera (hasta `espera_maxima`, con un poco de azar para que los esclavos
+    no reintenten todos a la vez).
+    """
+    def __init__(self, fallos_apertura=3, espera_inicial=1.0, espera_maxima=60.0):
+        self.fallos_apertura = fallos_apertura
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.estado = "cerrado"
+        self.fallos_seguidos = 0
+        self.espera = espera_inicial
+        self.reintento_en = 0.0
+        self.aperturas = 0
+        self.lock = threading.Lock()
+
+    def permite(self):
+        """Indica si se puede intentar un envío; al vencer la espera pasa a semiabierto"""
+        with self.lock:
+            if self.estado == "abierto" and time.monotonic() >= self.reintento_en:
+                self.estado = "semiabierto"
+            return self.estado != "abierto"
+
+    def abierto(self):
+        with self.lock:
+            return self.estado == "abierto"
+
+    def segundos_para_reintento(self):
+        with self.lock:
+            return max(0.0, self.reintento_en - time.monotonic()) if self.estado == "abierto" else 0.0
+
+    def registrar_exito(self):
+        with self.lock:
+            if self.estado != "cerrado":
+                print("Servidor de logs disponible de nuevo")
+            self.estado = "cerrado"
+            self.fallos_seguidos = 0
+            self.espera = self.espera_inicial
+
+    def registrar_fallo(self, error):
+        with self.lock:
+            self.fallos_seguidos += 1
+            if self.estado == "semiabierto":
+                self.espera = min(self.espera * 2, self.espera_maxima)
+            elif self.estado != "cerrado" or self.fallos_seguidos < self.fallos_apertura:
+                return
+            self.estado = "abierto"
+            self.aperturas += 1
+            espera = self.espera * random.uniform(0.8, 1.0)
+            self.reintento_en = time.monotonic() + espera
+        print(f"Envío de logs suspendido por {espera:.1f}s tras {self.fallos_seguidos} errores seguidos ({error})")
+
+class ArchivoDesborde:
+    """
+    Registros que no se pudieron enviar, un JSON por línea en
+    `directorio/<pid>.jsonl` (un archivo por proceso, así los workers no se
+    pisan). Cualquier proceso que comparta el directorio reenvía los suyos y
+    los de procesos que ya no existen, por ejemplo tras un reinicio.
+    """
+    def __init__(self, directorio, max_bytes=64 * 1024 * 1024):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, pid, reenvio=False):
+        return os.path.join(self.directorio, f"{pid}.reenvio.jsonl" if reenvio else f"{pid}.jsonl")
+
+    def bytes_ocupados(self):
+        total = 0
+        for archivo in os.listdir(self.directorio):
+            try:
+                total += os.path.getsize(os.path.join(self.directorio, archivo))
+            except OSError:
+                pass
+        return total
+
+    def guardar(self, registros):
+        """Agrega los registros al archivo del proceso; devuelve cuántos guardó (0 si no hay espacio)"""
+        lineas = "".join(json.dumps(registro, ensure_ascii=False) + "\n" for registro in registros)
+        with self.lock:
+            if self.bytes_ocupados() + len(lineas.encode("utf-8")) > self.max_bytes:
+                return 0
+            with open(self._ruta(os.getpid()), 'a', encoding='utf-8') as f:
+                f.write(lineas)
+        return len(registros)
+
+    def _reclamables(self):
+        for archivo in sorted(os.listdir(self.directorio)):
+            pid = archivo.split(".", 1)[0]
+            if not archivo.endswith(".jsonl") or not pid.isdigit():
+                continue
+            if int(pid) == os.getpid():
+                if not archivo.endswith(".reenvio.jsonl"):
+                    yield os.path.join(self.directorio, archivo)
+                continue
+            try:
+                os.kill(int(pid), 0)  # el dueño sigue vivo: sus registros los reenvía él
+            except ProcessLookupError:
+                yield os.path.join(self.directorio, archivo)
+            except OSError:
+                continue
+
+    def hay_pendientes(self):
+        with self.lock:
+            return os.path.exists(self._ruta(os.getpid(), reenvio=True)) or any(True for _ in self._reclamables())
+
+    def tomar(self):
+        """
+        Reclama un archivo pendiente (renombrándolo, así otro proceso no lo
+        toma también) y devuelve sus registros; None si no hay nada que
+        reenviar. El archivo reclamado queda en disco hasta que se llame a
+        `dejar_pendientes` con lo que falte reenviar, así una caída a mitad
+        del reenvío no pierde registros (a lo sumo se reenvían dos veces).
+        """
+        with self.lock:
+            destino = self._ruta(os.getpid(), reenvio=True)
+            # Un reenvío propio que quedó a medias se retoma antes de reclamar otro
+            candidatos = [destino] if os.path.exists(destino) else self._reclamables()
+            for ruta in candidatos:
+                try:
+                    os.rename(ruta, destino)
+                except OSError:
+                    continue  # lo reclamó otro proceso
+                registros = []
+                with open(destino, 'r', encoding='utf-8') as f:
+                    for linea in f:
+                        try:
+                            registros.append(json.loads(linea))
+                        except ValueError:
+                            continue  # línea cortada por una caída a mitad de escritura
+                return registros
+            return None
+
+    def dejar_pendientes(self, registros):
+        """Reemplaza el archivo reclamado por los registros que faltan reenviar (lo borra si no queda ninguno)"""
+        with self.lock:
+            destino = self._ruta(os.getpid(), reenvio=True)
+            if not registros:
+                if os.path.exists(destino):
+                    os.remove(destino)
+                return
+            # Nunca crece: no hace falta revisar max_bytes
+            temporal = destino + ".tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                f.write("".join(json.dumps(registro, ensure_ascii=False) + "\n" for registro in registros))
+            os.replace(temporal, destino)
+
+class EnviadorLogs:
+    """
+    Envía los logs al servidor centralizado fuera del camino de la consulta.
+    Los registros se dejan en una cola acotada y un hilo de fondo los manda
+    en lotes con `registro_lote`. Si la cola se llena se aplica la política
+    configurada: `descartar_nuevos` ignora el registro entrante y
+    `descartar_antiguos` saca el más viejo para hacerle espacio. Nunca se
+    bloquea al que llama. Con `metricas` (utils/metricas.py) se mide cuánto
+    tarda cada envío de un lote.
+
+    Si el servidor de logs (o el de nombres) no responde, el Interruptor deja
+    de intentar por un tiempo creciente y, con `desborde`, lo que llega
+    mientras tanto se guarda en disco y se reenvía cuando vuelve. Un lote que
+    el servidor rechaza con un error propio (no de red), o que no se puede
+    serializar, es "envenenado": se descarta y se cuenta en vez de
+    reintentarlo para siempre.
+    """
+    def __init__(self, uri="PYRONAME:centralizado.logger", capacidad=10000,
+                 tamanio_lote=100, intervalo=1.0, politica="descartar_nuevos", metricas=None,
+                 desborde=None, max_desborde=64 * 1024 * 1024, fallos_apertura=3, espera_maxima=60.0):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de descarte desconocida: {politica}")
+        self.uri = uri
+        self.tamanio_lote = tamanio_lote
+        self.intervalo = intervalo
+        self.politica = politica
+        self.metricas = metricas
+        self.interruptor = Interruptor(fallos_apertura, intervalo, espera_maxima)
+        self.desborde = ArchivoDesborde(desborde, max_desborde) if desborde else None
+        self.cola = queue.Queue(maxsize=capacidad)
+        self.lock = threading.Lock()
+        self.hilo = None
+        self.pid = None
+        self.detener = threading.Event()
+        self.pendiente = []  # lote que falló y se reintentará
+        self.encolados = 0
+        self.enviados = 0
+        self.lotes_enviados = 0
+        self.descartados = 0
+        self.errores_envio = 0
+        self.desbordados = 0
+        self.reenviados = 0
+        self.lotes_envenenados = 0
+        self.reinicios_hilo = 0
+        atexit.register(self.cerrar)
+
+    def _hilo_activo(self):
+        # Un hilo que terminó después de cerrar() no se reinicia
+        return (self.hilo is not None and self.pid == os.getpid()
+                and (self.hilo.is_alive() or self.detener.is_set()))
+
+    def _asegurar_hilo(self):
+        # El hilo se crea en el primer envío, de nuevo tras un fork y si terminó por un error inesperado
+        if self._hilo_activo():
+            return
+        with self.lock:
+            if not self._hilo_activo():
+                if self.hilo is not None and self.pid == os.getpid():
+                    self.reinicios_hilo += 1
+                    print("El hilo de envío de logs había terminado; se reinicia")
+                self.pid = os.getpid()
+                self.detener.clear()
+                self.hilo = threading.Thread(target=self._ciclo, name="envio-logs", daemon=True)
+                self.hilo.start()
+
+    def enviar(self, registro):
+        """Encola un registro; devuelve False si fue descartado"""
+        self._asegurar_hilo()
+        try:
+            self.cola.put_nowait(registro)
+        except queue.Full:
+            if self.politica == "descartar_nuevos":
+                with self.lock:
+                    self.descartados += 1
+                return False
+            try:
+                self.cola.get_nowait()
+                with self.lock:
+                    self.descartados += 1
+            except queue.Empty:
+                pass
+            try:
+                self.cola.put_nowait(registro)
+            except queue.Full:
+                with self.lock:
+                    self.descartados += 1
+                return False
+        with self.lock:
+            self.encolados += 1
+        return True
+
+    def _tomar_lote(self, espera):
+        lote = []
+        limite = time.monotonic() + espera
+        while len(lote) < self.tamanio_lote:
+            restante = limite - time.monotonic()
+            try:
+                if restante <= 0:
+                    lote.append(self.cola.get_nowait())
+                else:
+                    lote.append(self.cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _desbordar(self):
+        """Pasa el lote pendiente y lo que haya en la cola al archivo de desborde"""
+        if self.desborde is None:
+            return
+        while True:
+            lote = self.pendiente or self._tomar_lote(0)
+            if not lote:
+                return
+            try:
+                guardados = self.desborde.guardar(lote)
+            except OSError as e:
+                print(f"No se pudieron guardar logs en {self.desborde.directorio}: {e}")
+                guardados = 0
+            with self.lock:
+                self.desbordados += guardados
+                self.descartados += len(lote) - guardados
+            self.pendiente = []
+
+    def _enviar_lote(self, proxy, lote):
+        inicio = time.perf_counter()
+        proxy.registro_lote(lote)
+        if self.metricas is not None:
+            self.metricas.observar("envio_logs_segundos", time.perf_counter() - inicio)
+        with self.lock:
+            self.enviados += len(lote)
+            self.lotes_enviados += 1
+
+    def _descartar_envenenado(self, lote, error):
+        with self.lock:
+            self.lotes_envenenados += 1
+            self.descartados += len(lote)
+        print(f"Lote de {len(lote)} logs rechazado, se descarta: {error!r}")
+
+    def _reenviar_desborde(self, proxy):
+        """Reenvía un archivo de desborde; si falla a mitad, en el archivo queda solo lo que falta"""
+        registros = self.desborde.tomar() if self.desborde is not None else None
+        if registros is None:
+            return
+        reenviados = 0
+        for inicio in range(0, len(registros), self.tamanio_lote):
+            lote = registros[inicio:inicio + self.tamanio_lote]
+            try:
+                self._enviar_lote(proxy, lote)
+            except Pyro5.errors.SerializeError as e:
+                # Error del cliente (subclase de PyroError): no es una caída del servidor
+                self._descartar_envenenado(lote, e)
+                continue
+            except (Pyro5.errors.PyroError, OSError):
+                self.desborde.dejar_pendientes(registros[inicio:])
+                raise
+            except Exception as e:
+                self._descartar_envenenado(lote, e)
+                continue
+            reenviados += len(lote)
+            with self.lock:
+                self.reenviados += len(lote)
+        self.desborde.dejar_pendientes([])
+        if not registros:
+            return
+        print(f"Reenviados {reenviados} logs guardados durante la caída del servidor de logs")
+
+    def _ciclo(self):
+        proxy = None
+        while not self.detener.is_set():
+            if not self.interruptor.permite():
+                # Abierto: no se intenta enviar; lo que llega va al disco en vez de llenar la cola
+                self._desbordar()
+                self.detener.wait(min(self.intervalo, self.interruptor.segundos_para_reintento()))
+                continue
+            if not self.pendiente:
+                self.pendiente = self._tomar_lote(self.intervalo)
+            if not self.pendiente and (self.desborde is None or not self.desborde.hay_pendientes()):
+                continue
+            try:
+                if proxy is None:
+                    proxy = Pyro5.api.Proxy(resolver(self.uri))
+                if self.pendiente:
+                    self._enviar_lote(proxy, self.pendiente)
+                    self.pendiente = []
+                self._reenviar_desborde(proxy)
+                self.interruptor.registrar_exito()
+            except Pyro5.errors.SerializeError as e:
+                # El lote no se pudo serializar: reintentarlo fallaría igual y no dice nada del servidor
+                self._descartar_envenenado(self.pendiente, e)
+                self.pendiente = []
+            except (Pyro5.errors.PyroError, OSError) as e:
+                # Se reintenta el mismo lote en el próximo ciclo; mientras tanto la
+                # cola sigue recibiendo registros y descarta según la política
+                with self.lock:
+                    self.errores_envio += 1
+                print(f"Error al enviar lote de logs: {e}")
+                olvidar(self.uri)
+                if proxy is not None:
+                    proxy._pyroRelease()
+                    proxy = None
+                self.interruptor.registrar_fallo(e)
+                if not self.interruptor.abierto():
+                    self.detener.wait(self.intervalo)
+            except Exception as e:
+                # El servidor respondió con una excepción propia (Pyro la relanza con
+                # su tipo original): reintentar el mismo lote fallaría igual
+                self._descartar_envenenado(self.pendiente, e)
+                self.pendiente = []
+        if proxy is not None:
+            proxy._pyroRelease()
+
+    def vaciar(self, timeout=5.0):
+        """Envía lo que quede en la cola desde el hilo que llama"""
+        if self.interruptor.abierto():
+            # No vale la pena esperar al servidor caído: se guarda para reenviarlo después
+            self._desbordar()
+            return
+        limite = time.monotonic() + timeout
+        proxy = None
+        try:
+            while time.monotonic() < limite:
+                lote = self.pendiente or self._tomar_lote(0)
+                if not lote:
+                    break
+                self.pendiente = lote
+                if proxy is None:
+                    proxy = Pyro5.api.Proxy(resolver(self.uri))
+                try:
+                    self._enviar_lote(proxy, lote)
+                except Pyro5.errors.SerializeError as e:
+                    self._descartar_envenenado(lote, e)
+                except (Pyro5.errors.PyroError, OSError):
+                    raise
+                except Exception as e:
+                    self._descartar_envenenado(lote, e)
+                self.pendiente = []
+        except (Pyro5.errors.PyroError, OSError) as e:
+            print(f"No se pudieron enviar los logs pendientes: {e}")
+            olvidar(self.uri)
+            self._desbordar()
+        finally:
+            if proxy is not None:
+                proxy._pyroRelease()
+
+    def cerrar(self):
+        if self.hilo is not None and self.pid == os.getpid():
+            self.detener.set()
+            self.hilo.join(timeout=self.intervalo + 1)
+            if self.hilo.is_alive():
+                # Sigue dentro de una llamada a Pyro: vaciar() competiría con el hilo por
+                # self.pendiente. Lo que queda va al disco (el lote en vuelo puede repetirse)
+                self._desbordar()
+                return
+        self.vaciar()
+
+    def estadisticas(self):
+        with self.lock:
+            datos = {
+                "politica": self.politica,
+                "capacidad": self.cola.maxsize,
+                "en_cola": self.cola.qsize(),
+                "encolados": self.encolados,
+                "enviados": self.enviados,
+                "lotes_enviados": self.lotes_enviados,
+                "descartados": self.descartados,
+                "errores_envio": self.errores_envio,
+                "desbordados": self.desbordados,
+                "reenviados": self.reenviados,
+                "lotes_envenenados": self.lotes_envenenados,
+                "reinicios_hilo": self.reinicios_hilo
+            }
+        with self.interruptor.lock:
+            datos["interruptor"] = self.interruptor.estado
+            datos["aperturas"] = self.interruptor.aperturas
+        return datos
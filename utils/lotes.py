@@ -0,0 +1,22 @@
+def leer_lote(cuerpo, max_lote):
+    """
+    Valida el cuerpo de /query/batch: {"consultas": [{"titulo": ..., "edad": ...}, ...],
+    "limit": ..., "offset": ...}. Devuelve (consultas, limite, desplazamiento, error)
+    """
+    if not isinstance(cuerpo, dict) or not isinstance(cuerpo.get("consultas"), list):
+        return None, None, 0, ("Se esperaba un objeto con la lista 'consultas'", 400)
+    consultas = []
+    for consulta in cuerpo["consultas"]:
+        if not isinstance(consulta, dict):
+            return None, None, 0, ("Cada consulta debe ser un objeto con 'titulo' y opcionalmente 'edad'", 400)
+        titulo, edad = consulta.get("titulo", ""), consulta.get("edad")
+        if not isinstance(titulo, str) or (edad is not None and (not isinstance(edad, int) or isinstance(edad, bool))):
+            return None, None, 0, ("'titulo' debe ser texto y 'edad' un entero", 400)
+        consultas.append((titulo, edad))
+    if len(consultas) > max_lote:
+        return None, None, 0, (f"El lote supera el máximo de {max_lote} consultas", 413)
+    limite, desplazamiento = cuerpo.get("limit"), cuerpo.get("offset", 0)
+    if (limite is not None and (not isinstance(limite, int) or limite < 0)) \
+            or not isinstance(desplazamiento, int) or desplazamiento < 0:
+        return None, None, 0, ("limit y offset deben ser enteros no negativos", 400)
+    return consultas, limite, desplazamiento, None
@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+from utils.sketch import SketchLatencia
+
+CUANTILES = (0.5, 0.95, 0.99)
+
+class Histograma:
+    """
+    Latencias de una etapa: conteo y suma desde el arranque, y un sketch de
+    la ventana reciente para los percentiles. La ventana rota cada
+    `ventana` segundos y los percentiles salen de la actual más la anterior,
+    así reflejan el último minuto o dos y no todo lo ocurrido desde el inicio.
+    """
+    def __init__(self, alfa=0.01, ventana=60.0):
+        self.alfa = alfa
+        self.ventana = ventana
+        self.conteo = 0
+        self.suma = 0.0
+        self.actual = SketchLatencia(alfa)
+        self.anterior = SketchLatencia(alfa)
+        self.inicio_ventana = time.monotonic()
+
+    def _rotar(self, ahora):
+        transcurrido = ahora - self.inicio_ventana
+        if transcurrido < self.ventana:
+            return
+        # Si pasaron dos ventanas sin datos la anterior también quedó vieja
+        self.anterior = self.actual if transcurrido < 2 * self.ventana else SketchLatencia(self.alfa)
+        self.actual = SketchLatencia(self.alfa)
+        self.inicio_ventana = ahora
+
+    def observar(self, valor, ahora):
+        self._rotar(ahora)
+        self.actual.agregar(valor)
+        self.conteo += 1
+        self.suma += valor
+
+    def reciente(self, ahora):
+        self._rotar(ahora)
+        return SketchLatencia(self.alfa).combinar(self.anterior).combinar(self.actual)
+
+class Metricas:
+    """
+    Histogramas de latencia y contadores en memoria del proceso, pensados
+    para el camino de cada consulta: observar un valor es un logaritmo y un
+    incremento de bucket bajo un lock. Cada serie se identifica por nombre
+    y etiquetas (p. ej. observar("etapa_segundos", 0.002, etapa="rank")).
+    """
+    def __init__(self, alfa=0.01, ventana=60.0):
+        self.alfa = alfa
+        self.ventana = ventana
+        self.histogramas = {}  # (nombre, etiquetas) -> Histograma
+        self.contadores = {}  # (nombre, etiquetas) -> cantidad
+        self.lock = threading.Lock()
+
+    def observar(self, nombre, segundos, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        ahora = time.monotonic()
+        with self.lock:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                histograma = self.histogramas[clave] = Histograma(self.alfa, self.ventana)
+            histograma.observar(segundos, ahora)
+
+    def observar_etapas(self, nombre, etapas, **etiquetas):
+        """Una observación por etapa de un Cronometro (utils/trazas.py)"""
+        for etapa, duracion in etapas.items():
+            self.observar(nombre, duracion, etapa=etapa, **etiquetas)
+
+    def contar(self, nombre, cantidad=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self.lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + cantidad
+
+    def a_dict(self):
+        """Foto serializable (JSON) con los sketches recientes; se puede combinar con la de otros procesos"""
+        ahora = time.monotonic()
+        with self.lock:
+            return {
+                "histogramas": [
+                    {"nombre": nombre, "etiquetas": dict(etiquetas), "conteo": histograma.conteo,
+                     "suma": histograma.suma, "sketch": histograma.reciente(ahora).a_dict()}
+                    for (nombre, etiquetas), histograma in self.histogramas.items()
+                ],
+                "contadores": [
+                    {"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+                    for (nombre, etiquetas), valor in self.contadores.items()
+                ]
+            }
+
+def combinar(fotos):
+    """Suma las fotos de varios procesos: contadores y conteos se suman, los sketches se combinan"""
+    histogramas = {}
+    contadores = {}
+    for foto in fotos:
+        for serie in foto["histogramas"]:
+            clave = (serie["nombre"], tuple(sorted(serie["etiquetas"].items())))
+            sketch = SketchLatencia.desde_dict(serie["sketch"])
+            if clave in histogramas:
+                acumulada = histogramas[clave]
+                acumulada["conteo"] += serie["conteo"]
+                acumulada["suma"] += serie["suma"]
+                acumulada["sketch"].combinar(sketch)
+            else:
+                histogramas[clave] = dict(serie, sketch=sketch)
+        for serie in foto["contadores"]:
+            clave = (serie["nombre"], tuple(sorted(serie["etiquetas"].items())))
+            contadores[clave] = contadores.get(clave, 0) + serie["valor"]
+    return {
+        "histogramas": [dict(serie, sketch=serie["sketch"].a_dict()) for serie in histogramas.values()],
+        "contadores": [{"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+                       for (nombre, etiquetas), valor in contadores.items()]
+    }
+
+def resumen(foto):
+    """Vista JSON: por serie conteo, promedio, máximo y p50/p95/p99 de la ventana reciente"""
+    histogramas = []
+    for serie in foto["histogramas"]:
+        sketch = SketchLatencia.desde_dict(serie["sketch"])
+        datos = {"nombre": serie["nombre"], "etiquetas": serie["etiquetas"], "conteo": serie["conteo"],
+                 "promedio": serie["suma"] / serie["conteo"] if serie["conteo"] else None,
+                 "maximo_reciente": sketch.maximo}
+        for q in CUANTILES:
+            datos[f"p{round(q * 100)}"] = sketch.cuantil(q)
+        histogramas.append(datos)
+    return {"histogramas": histogramas, "contadores": foto["contadores"]}
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etiquetas(etiquetas, **extra):
+    pares = dict(etiquetas, **extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in sorted(pares.items())) + "}"
+
+def formato_prometheus(foto, prefijo, medidores=None):
+    """
+    Texto de exposición de Prometheus. Los histogramas salen como summary
+    (cuantiles 0.5/0.95/0.99 de la ventana reciente, _sum y _count desde el
+    arranque). `medidores` agrega valores sueltos {nombre: (tipo, valor)}.
+    """
+    lineas = []
+    tipos_vistos = set()
+
+    def tipo(nombre, clase):
+        if nombre not in tipos_vistos:
+            tipos_vistos.add(nombre)
+            lineas.append(f"# TYPE {nombre} {clase}")
+
+    for serie in sorted(foto["histogramas"], key=lambda s: (s["nombre"], sorted(s["etiquetas"].items()))):
+        nombre = f"{prefijo}_{serie['nombre']}"
+        tipo(nombre, "summary")
+        sketch = SketchLatencia.desde_dict(serie["sketch"])
+        for q in CUANTILES:
+            valor = sketch.cuantil(q)
+            lineas.append(f"{nombre}{_etiquetas(serie['etiquetas'], quantile=q)} {'NaN' if valor is None else repr(valor)}")
+        lineas.append(f"{nombre}_sum{_etiquetas(serie['etiquetas'])} {serie['suma']!r}")
+        lineas.append(f"{nombre}_count{_etiquetas(serie['etiquetas'])} {serie['conteo']}")
+    for serie in sorted(foto["contadores"], key=lambda s: (s["nombre"], sorted(s["etiquetas"].items()))):
+        nombre = f"{prefijo}_{serie['nombre']}_total"
+        tipo(nombre, "counter")
+        lineas.append(f"{nombre}{_etiquetas(serie['etiquetas'])} {serie['valor']}")
+    for nombre, (clase, valor) in sorted((medidores or {}).items()):
+        tipo(f"{prefijo}_{nombre}", clase)
+        lineas.append(f"{prefijo}_{nombre} {valor}")
+    return "\n".join(lineas) + "\n"
+
+class PublicadorMetricas:
+    """
+    Con varios workers cada proceso tiene sus propias métricas. Cada worker
+    deja su foto en `directorio/<pid>.json` cada `intervalo` segundos y el
+    que atiende /metrics combina la suya (al día) con las de los demás
+    workers vivos.
+    """
+    def __init__(self, metricas, directorio, intervalo=1.0):
+        self.metricas = metricas
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.detener = threading.Event()
+
+    def _ruta(self, pid):
+        return os.path.join(self.directorio, f"{pid}.json")
+
+    def publicar(self):
+        ruta = self._ruta(os.getpid())
+        with open(ruta + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.metricas.a_dict(), f)
+        os.replace(ruta + ".tmp", ruta)
+
+    def _ciclo(self):
+        while not self.detener.wait(self.intervalo):
+            try:
+                self.publicar()
+            except OSError as e:
+                print(f"Error al publicar métricas: {e}")
+
+    def iniciar(self):
+        # Se llama dentro de cada worker, después del fork
+        self.detener.clear()
+        threading.Thread(target=self._ciclo, name="metricas", daemon=True).start()
+
+    def cerrar(self):
+        self.detener.set()
+        try:
+            os.remove(self._ruta(os.getpid()))
+        except OSError:
+            pass
+
+    def foto_combinada(self):
+        fotos = [self.metricas.a_dict()]
+        for archivo in os.listdir(self.directorio):
+            nombre, extension = os.path.splitext(archivo)
+            if extension != ".json" or not nombre.isdigit() or int(nombre) == os.getpid():
+                continue
+            try:
+                os.kill(int(nombre), 0)  # solo workers vivos
+                with open(os.path.join(self.directorio, archivo), 'r', encoding='utf-8') as f:
+                    fotos.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return combinar(fotos)
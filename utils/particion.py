@@ -0,0 +1,44 @@
+import math
+import zlib
+
+METODOS_PARTICION = ("hash", "rango")
+
+def id_valido(doc_id):
+    return isinstance(doc_id, int) and not isinstance(doc_id, bool)
+
+def asignar_ids(documentos):
+    """
+    Agrega a cada documento un "id" con su posición en la colección si no lo
+    tiene. El maestro desempata por ese id al mezclar shards, así que para
+    que el orden global sea el mismo que con la colección sin particionar los
+    ids tienen que ser enteros crecientes según la posición: si no lo son se
+    lanza ValueError en vez de producir shards que se mezclarían mal.
+    """
+    anterior = None
+    for posicion, doc in enumerate(documentos):
+        doc_id = doc.setdefault("id", posicion)
+        if not id_valido(doc_id) or (anterior is not None and doc_id <= anterior):
+            raise ValueError(f"El documento en la posición {posicion} tiene id {doc_id!r}: para particionar, "
+                             "los ids deben ser enteros crecientes según la posición en la colección "
+                             "(quítelos para usar la posición o renumérelos)")
+        anterior = doc_id
+    return documentos
+
+def shard_de(doc_id, posicion, num_shards, metodo="hash", total=None):
+    """Número de shard de un documento"""
+    if metodo == "hash":
+        # crc32 es estable entre procesos (a diferencia de hash())
+        return zlib.crc32(str(doc_id).encode("utf-8")) % num_shards
+    if metodo == "rango":
+        return min(posicion // math.ceil(total / num_shards), num_shards - 1)
+    raise ValueError(f"Método de partición desconocido: {metodo}")
+
+def particionar(documentos, num_shards, metodo="hash"):
+    """Reparte los documentos en `num_shards` listas conservando el orden original en cada una"""
+    if num_shards < 1:
+        raise ValueError("La cantidad de shards debe ser al menos 1")
+    shards = [[] for _ in range(num_shards)]
+    total = len(documentos)
+    for posicion, doc in enumerate(asignar_ids(documentos)):
+        shards[shard_de(doc["id"], posicion, num_shards, metodo, total)].append(doc)
+    return shards
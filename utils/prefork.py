@@ -0,0 +1,266 @@
+import gc
+import mmap
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from werkzeug.serving import make_server
+
+LATIDO = struct.Struct("d")
+
+class ContadorPeticiones:
+    """Middleware WSGI que cuenta las peticiones en curso para cerrar sin cortarlas"""
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.en_curso = 0
+        self.atendidas = 0
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.en_curso += 1
+        try:
+            return self.app(environ, start_response)
+        finally:
+            with self.lock:
+                self.en_curso -= 1
+                self.atendidas += 1
+
+class Supervisor:
+    """
+    Sirve una aplicación WSGI con varios procesos worker que comparten el
+    socket de escucha. Los datos se cargan una vez en el supervisor antes de
+    crear los workers con fork, así todos leen la misma copia del índice
+    (copy-on-write, o las mismas páginas si es un snapshot mapeado).
+
+    Cada worker publica un latido en memoria compartida. El supervisor
+    reinicia los workers que terminan o dejan de latir (con espera creciente
+    si fallan apenas arrancan), y con SIGHUP vuelve a cargar los datos y
+    reemplaza los workers de a uno, sin dejar de atender.
+    """
+    def __init__(self, app, host, port, workers=2, al_recargar=None, al_iniciar_worker=None,
+                 al_terminar_worker=None, timeout_latido=30.0, intervalo_latido=1.0,
+                 espera_cierre=10.0, espera_reinicio_max=30.0):
+        if workers < 1:
+            raise ValueError("Se necesita al menos un worker")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.al_recargar = al_recargar
+        self.al_iniciar_worker = al_iniciar_worker
+        self.al_terminar_worker = al_terminar_worker
+        self.timeout_latido = timeout_latido
+        self.intervalo_latido = intervalo_latido
+        self.espera_cierre = espera_cierre
+        self.espera_reinicio_max = espera_reinicio_max
+        # Dos casilleros por worker: durante una recarga conviven el viejo y su reemplazo
+        self.latidos = mmap.mmap(-1, LATIDO.size * workers * 2)
+        self.procesos = {}  # pid -> (casillero, momento de inicio)
+        self.terminando = {}  # pid -> plazo para matarlo si no terminó solo
+        self.fallos_seguidos = 0
+        self.proximo_inicio = 0.0
+        self.reinicios = 0
+        self.detener = False
+        self.recargar = False
+        self.socket = None
+
+    def _escuchar(self):
+        familia = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(familia, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(socket.SOMAXCONN)
+        sock.set_inheritable(True)
+        return sock
+
+    def _casillero_libre(self):
+        ocupados = {casillero for casillero, _ in self.procesos.values()}
+        return next(c for c in range(self.workers * 2) if c not in ocupados)
+
+    def _latido(self, casillero):
+        return LATIDO.unpack_from(self.latidos, casillero * LATIDO.size)[0]
+
+    def _iniciar_worker(self):
+        casillero = self._casillero_libre()
+        inicio = time.monotonic()
+        LATIDO.pack_into(self.latidos, casillero * LATIDO.size, inicio)
+        pid = os.fork()
+        if pid == 0:
+            codigo = 1
+            try:
+                self._ejecutar_worker(casillero)
+                codigo = 0
+            except BaseException as e:
+                print(f"Worker {os.getpid()} terminó con error: {e}")
+            finally:
+                # No volver al código del supervisor ni ejecutar sus atexit
+                os._exit(codigo)
+        self.procesos[pid] = (casillero, inicio)
+        print(f"Worker {pid} iniciado (casillero {casillero})")
+        return pid
+
+    def _ejecutar_worker(self, casillero):
+        for senial in (signal.SIGINT, signal.SIGHUP):
+            signal.signal(senial, signal.SIG_IGN)  # los maneja el supervisor
+        contador = ContadorPeticiones(self.app)
+        servidor = make_server(self.host, self.port, contador, threaded=True, fd=self.socket.fileno())
+        fin = threading.Event()
+
+        def terminar(senial, frame):
+            # shutdown() espera a serve_forever, que corre en este mismo hilo
+            fin.set()
+            threading.Thread(target=servidor.shutdown, daemon=True).start()
+
+        def latir():
+            while not fin.wait(self.intervalo_latido):
+                LATIDO.pack_into(self.latidos, casillero * LATIDO.size, time.monotonic())
+
+        signal.signal(signal.SIGTERM, terminar)
+        threading.Thread(target=latir, name="latido", daemon=True).start()
+        if self.al_iniciar_worker:
+            self.al_iniciar_worker()
+        # Primer latido: el supervisor sabe que el worker ya acepta conexiones
+        LATIDO.pack_into(self.latidos, casillero * LATIDO.size, time.monotonic())
+        try:
+            servidor.serve_forever()
+        finally:
+            fin.set()
+            # Dejar terminar las peticiones en curso antes de salir
+            limite = time.monotonic() + self.espera_cierre
+            while contador.en_curso and time.monotonic() < limite:
+                time.sleep(0.05)
+            if self.al_terminar_worker:
+                self.al_terminar_worker()
+            print(f"Worker {os.getpid()} detenido tras {contador.atendidas} peticiones")
+
+    def _terminar_worker(self, pid, motivo=None, senial=signal.SIGTERM):
+        if motivo:
+            print(f"Deteniendo worker {pid}: {motivo}")
+        try:
+            os.kill(pid, senial)
+        except ProcessLookupError:
+            return
+        self.terminando.setdefault(pid, time.monotonic() + self.espera_cierre)
+
+    def _recoger(self):
+        """Registra los workers que terminaron; devuelve cuántos terminaron sin que se les pidiera"""
+        inesperados = 0
+        while True:
+            try:
+                pid, estado = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            casillero, inicio = self.procesos.pop(pid, (None, None))
+            if self.terminando.pop(pid, None) is not None or inicio is None:
+                continue
+            inesperados += 1
+            vivio = time.monotonic() - inicio
+            print(f"Worker {pid} terminó inesperadamente (estado {estado}) tras {vivio:.1f}s")
+            # Si muere apenas arranca (p. ej. un error al iniciar) no reiniciarlo en bucle
+            self.fallos_seguidos = self.fallos_seguidos + 1 if vivio < self.timeout_latido else 0
+            if self.fallos_seguidos:
+                espera = min(self.espera_reinicio_max, 0.5 * 2 ** (self.fallos_seguidos - 1))
+                self.proximo_inicio = time.monotonic() + espera
+        return inesperados
+
+    def _vigilar_latidos(self):
+        ahora = time.monotonic()
+        for pid, (casillero, _) in list(self.procesos.items()):
+            if pid in self.terminando:
+                continue
+            sin_latir = ahora - self._latido(casillero)
+            if sin_latir > self.timeout_latido:
+                self.reinicios += 1
+                self._terminar_worker(pid, f"sin latido hace {sin_latir:.1f}s", signal.SIGKILL)
+        for pid, plazo in list(self.terminando.items()):
+            if ahora > plazo and pid in self.procesos:
+                self._terminar_worker(pid, "no terminó dentro del plazo", signal.SIGKILL)
+                self.terminando[pid] = ahora + self.espera_cierre
+
+    def _esperar_listo(self, pid, plazo):
+        casillero, inicio = self.procesos[pid]
+        limite = time.monotonic() + plazo
+        while time.monotonic() < limite:
+            if self._latido(casillero) > inicio:
+                return True
+            self.reinicios += self._recoger()
+            if pid not in self.procesos:
+                return False
+            time.sleep(0.05)
+        return False
+
+    def _activos(self):
+        return [pid for pid in self.procesos if pid not in self.terminando]
+
+    def _recargar_datos(self):
+        """Carga los datos de nuevo y reemplaza los workers de a uno"""
+        print("Recargando datos y reemplazando workers...")
+        if self.al_recargar:
+            try:
+                self.al_recargar()
+            except Exception as e:
+                print(f"Error al recargar datos, se mantienen los workers actuales: {e}")
+                return
+        gc.freeze()
+        for viejo in self._activos():
+            nuevo = self._iniciar_worker()
+            # El viejo se detiene recién cuando el nuevo ya está aceptando conexiones
+            if not self._esperar_listo(nuevo, self.timeout_latido):
+                print("El worker nuevo no arrancó; se conservan los workers restantes")
+                return
+            self._terminar_worker(viejo, "reemplazado por recarga")
+
+    def _manejar_senial(self, senial, frame):
+        if senial == signal.SIGHUP:
+            self.recargar = True
+        else:
+            self.detener = True
+
+    def ejecutar(self):
+        self.socket = self._escuchar()
+        for senial in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(senial, self._manejar_senial)
+        # Lo cargado hasta acá no cambia más: sacarlo del recolector evita que
+        # los workers toquen (y copien) esas páginas al recorrer los objetos
+        gc.freeze()
+        print(f"Supervisor {os.getpid()} escuchando en {self.host}:{self.port} con {self.workers} workers")
+        try:
+            for _ in range(self.workers):
+                self._iniciar_worker()
+            while not self.detener:
+                self.reinicios += self._recoger()
+                if self.recargar:
+                    self.recargar = False
+                    self._recargar_datos()
+                self._vigilar_latidos()
+                faltan = self.workers - len(self._activos())
+                if faltan > 0 and time.monotonic() >= self.proximo_inicio:
+                    for _ in range(faltan):
+                        self._iniciar_worker()
+                time.sleep(0.2)
+        finally:
+            self.cerrar()
+
+    def cerrar(self):
+        print("Deteniendo workers...")
+        for pid in list(self.procesos):
+            self._terminar_worker(pid)
+        limite = time.monotonic() + self.espera_cierre
+        while self.procesos and time.monotonic() < limite:
+            self._recoger()
+            time.sleep(0.05)
+        for pid in list(self.procesos):
+            self._terminar_worker(pid, "no terminó dentro del plazo", signal.SIGKILL)
+        while self.procesos:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.procesos.pop(pid, None)
+        if self.socket is not None:
+            self.socket.close()
@@ -1,9 +1,18 @@
-
+import array
+import bisect
+import heapq
+import itertools
 import json
 import re
 import unicodedata
+import numpy as np
+
+# Edad usada por los esclavos cuando la consulta no la indica
+EDAD_POR_DEFECTO = 30
 
 def normalizar(texto):
+    if texto.isascii():
+        return texto.lower()  # sin tildes que quitar
     return ''.join(
         c for c in unicodedata.normalize('NFD', texto)
         if unicodedata.category(c) != 'Mn'
@@ -22,6 +31,514 @@ def determinar_grupo_etario(edad, rangos):
             return grupo
     return None
 
+def extraer_palabras_clave(consulta_titulo):
+    return [normalizar(p) for p in re.split(r"[\s+]", consulta_titulo) if p.strip()]
+
+# Un solo encoder: json.dumps con opciones arma uno nuevo en cada llamada
+_codificar_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+# Elementos por tramo de un ArregloPorTramos (potencia de 2) y partes de un MapaPorTramos
+BITS_TRAMO = 16
+TAMANIO_TRAMO = 1 << BITS_TRAMO
+PARTES_MAPA = 256
+# ColumnaDocumentos: los documentos cambiados se agregan a un bloque hasta que
+# supera este tamaño, y la columna se compacta cuando los bytes de documentos
+# reemplazados o eliminados superan esta fracción del total
+TAMANIO_BLOQUE_CAMBIOS = 1 << 20
+FRACCION_COMPACTACION = 0.5
+
+class ArregloPorTramos:
+    """
+    Arreglo de enteros (como array.array) partido en tramos de TAMANIO_TRAMO
+    elementos. copiar() comparte los tramos y cada uno se copia recién la
+    primera vez que se modifica, así un cambio por /admin copia un tramo y no
+    la columna entera.
+    """
+    def __init__(self, tipo, valores=()):
+        self.tipo = tipo
+        self.tramos = []
+        self.propios = set()  # tramos que no comparte con otra copia y se pueden modificar
+        self.largo = 0
+        self.extend(valores)
+
+    def __len__(self):
+        return self.largo
+
+    def __getitem__(self, posicion):
+        if posicion < 0:
+            posicion += self.largo
+        if not 0 <= posicion < self.largo:
+            raise IndexError(posicion)
+        return self.tramos[posicion >> BITS_TRAMO][posicion & (TAMANIO_TRAMO - 1)]
+
+    def _tramo_propio(self, numero):
+        if numero not in self.propios:
+            self.tramos[numero] = array.array(self.tipo, self.tramos[numero])
+            self.propios.add(numero)
+        return self.tramos[numero]
+
+    def __setitem__(self, posicion, valor):
+        if not 0 <= posicion < self.largo:
+            raise IndexError(posicion)
+        self._tramo_propio(posicion >> BITS_TRAMO)[posicion & (TAMANIO_TRAMO - 1)] = valor
+
+    def append(self, valor):
+        if self.largo % TAMANIO_TRAMO == 0:
+            self.propios.add(len(self.tramos))
+            self.tramos.append(array.array(self.tipo))
+        self._tramo_propio(len(self.tramos) - 1).append(valor)
+        self.largo += 1
+
+    def extend(self, valores):
+        if isinstance(valores, memoryview) and valores.format == self.tipo:
+            datos = array.array(self.tipo)
+            datos.frombytes(valores.cast("B"))
+        elif isinstance(valores, array.array) and valores.typecode == self.tipo:
+            datos = valores
+        else:
+            datos = array.array(self.tipo, valores)
+        inicio = 0
+        if self.largo % TAMANIO_TRAMO and len(datos):
+            # Completar el último tramo antes de abrir otros
+            inicio = TAMANIO_TRAMO - self.largo % TAMANIO_TRAMO
+            self._tramo_propio(len(self.tramos) - 1).extend(datos[:inicio])
+        for desde in range(inicio, len(datos), TAMANIO_TRAMO):
+            self.propios.add(len(self.tramos))
+            self.tramos.append(datos[desde:desde + TAMANIO_TRAMO])
+        self.largo += len(datos)
+
+    def __iter__(self):
+        for tramo in self.tramos:
+            yield from tramo
+
+    def __array__(self, dtype=None, copy=None):
+        # Para np.asarray; arma un arreglo contiguo (una copia)
+        if not self.tramos:
+            return np.empty(0, dtype=dtype or np.dtype(self.tipo))
+        plano = np.concatenate([np.frombuffer(tramo, dtype=self.tipo) for tramo in self.tramos])
+        return plano if dtype is None else plano.astype(dtype, copy=False)
+
+    def tomar(self, posiciones):
+        """arreglo[posiciones] como arreglo NumPy; `posiciones` debe estar ordenado"""
+        if not len(posiciones):
+            return np.empty(0, dtype=self.tipo)
+        if len(self.tramos) == 1:
+            return np.frombuffer(self.tramos[0], dtype=self.tipo)[posiciones]
+        cortes = np.searchsorted(posiciones >> BITS_TRAMO, np.arange(1, len(self.tramos)))
+        partes = np.split(posiciones & (TAMANIO_TRAMO - 1), cortes)
+        return np.concatenate([np.frombuffer(tramo, dtype=self.tipo)[parte]
+                               for tramo, parte in zip(self.tramos, partes) if len(parte)])
+
+    def copiar(self):
+        copia = ArregloPorTramos(self.tipo)
+        copia.tramos = list(self.tramos)
+        copia.largo = self.largo
+        # Desde ahora los tramos son compartidos: ninguna de las dos copias los modifica en el lugar
+        self.propios = set()
+        return copia
+
+def tomar(arreglo, posiciones):
+    """arreglo[posiciones] para un ArregloPorTramos o cualquier arreglo que NumPy pueda ver sin copiar"""
+    if isinstance(arreglo, ArregloPorTramos):
+        return arreglo.tomar(posiciones)
+    return np.asarray(arreglo)[posiciones]
+
+class MapaPorTramos:
+    """
+    Dict partido en PARTES_MAPA dicts según el hash de la clave. copiar()
+    comparte las partes y una parte se copia recién al modificarla.
+    """
+    def __init__(self, datos=None):
+        self.partes = [{} for _ in range(PARTES_MAPA)]
+        self.propias = set(range(PARTES_MAPA))
+        self.largo = 0
+        for clave, valor in (datos or {}).items():
+            self[clave] = valor
+
+    def _parte(self, clave):
+        return hash(clave) % PARTES_MAPA
+
+    def __len__(self):
+        return self.largo
+
+    def get(self, clave, defecto=None):
+        return self.partes[self._parte(clave)].get(clave, defecto)
+
+    def __getitem__(self, clave):
+        return self.partes[self._parte(clave)][clave]
+
+    def __contains__(self, clave):
+        return clave in self.partes[self._parte(clave)]
+
+    def _parte_propia(self, clave):
+        numero = self._parte(clave)
+        if numero not in self.propias:
+            self.partes[numero] = dict(self.partes[numero])
+            self.propias.add(numero)
+        return self.partes[numero]
+
+    def __setitem__(self, clave, valor):
+        parte = self._parte_propia(clave)
+        self.largo += clave not in parte
+        parte[clave] = valor
+
+    def __delitem__(self, clave):
+        del self._parte_propia(clave)[clave]
+        self.largo -= 1
+
+    def __iter__(self):
+        for parte in self.partes:
+            yield from parte
+
+    def items(self):
+        for parte in self.partes:
+            yield from parte.items()
+
+    def copiar(self):
+        copia = MapaPorTramos.__new__(MapaPorTramos)
+        copia.partes = list(self.partes)
+        copia.propias = set()
+        copia.largo = self.largo
+        self.propias = set()
+        return copia
+
+class ColumnaDocumentos:
+    """
+    Documentos guardados como JSON compacto en bloques de bytes, con el
+    bloque y el rango de cada uno en arreglos. Ocupa una fracción de lo que
+    ocupan los dicts, el recolector de basura no tiene que recorrerlos, y un
+    documento se decodifica recién cuando se devuelve en una respuesta.
+    Las posiciones eliminadas quedan vacías (None). Los arreglos son
+    ArregloPorTramos, así copiar() no depende de la cantidad de documentos.
+    Los bytes de un documento reemplazado o eliminado quedan muertos en su
+    bloque; compactar() reescribe solo los vivos.
+    """
+    def __init__(self, documentos=()):
+        self.bloques = []
+        self.bloque_de = ArregloPorTramos("i")
+        self.inicio_de = ArregloPorTramos("Q")
+        self.fin_de = ArregloPorTramos("Q")
+        self.abierto = None  # último bloque, al que se agregan los documentos cambiados
+        self.bytes_totales = 0
+        self.bytes_muertos = 0
+        self._agregar_bloque(documentos)
+
+    def _agregar_bloque(self, documentos):
+        partes = [_codificar_json(doc).encode("utf-8") for doc in documentos]
+        if not partes:
+            return
+        numero = len(self.bloques)
+        inicios = array.array("Q")
+        fines = array.array("Q")
+        inicio = 0
+        for parte in partes:
+            inicios.append(inicio)
+            inicio += len(parte)
+            fines.append(inicio)
+        self.bloque_de.extend(array.array("i", [numero]) * len(partes))
+        self.inicio_de.extend(inicios)
+        self.fin_de.extend(fines)
+        self.bloques.append(b"".join(partes))
+        self.bytes_totales += inicio
+
+    @classmethod
+    def desde_blob(cls, blob, offsets):
+        """Columna sobre un blob ya serializado (p. ej. el de un snapshot) y sus offsets de inicio + final"""
+        columna = cls()
+        columna.bloques.append(bytes(blob))
+        columna.bloque_de = ArregloPorTramos("i", bytes(4 * (len(offsets) - 1)))
+        columna.inicio_de = ArregloPorTramos("Q", offsets[:-1])
+        columna.fin_de = ArregloPorTramos("Q", offsets[1:])
+        columna.bytes_totales = len(columna.bloques[0])
+        return columna
+
+    def __len__(self):
+        return len(self.bloque_de)
+
+    def __getitem__(self, posicion):
+        numero = self.bloque_de[posicion]
+        if numero < 0:
+            return None
+        return json.loads(self.bloques[numero][self.inicio_de[posicion]:self.fin_de[posicion]])
+
+    def __setitem__(self, posicion, doc):
+        if self.bloque_de[posicion] >= 0:
+            self.bytes_muertos += self.fin_de[posicion] - self.inicio_de[posicion]
+        if doc is None:
+            self.bloque_de[posicion] = -1
+            return
+        # Los documentos cambiados se agregan al final del bloque abierto: los
+        # bytes que ya tiene no se modifican, así otra copia puede seguir leyéndolos
+        parte = _codificar_json(doc).encode("utf-8")
+        if self.abierto is None or len(self.abierto) >= TAMANIO_BLOQUE_CAMBIOS:
+            self.abierto = bytearray()
+            self.bloques.append(self.abierto)
+        self.bloque_de[posicion] = len(self.bloques) - 1
+        self.inicio_de[posicion] = len(self.abierto)
+        self.abierto += parte
+        self.fin_de[posicion] = len(self.abierto)
+        self.bytes_totales += len(parte)
+
+    def __iter__(self):
+        for posicion in range(len(self)):
+            yield self[posicion]
+
+    def append(self, doc):
+        self.bloque_de.append(-1)
+        self.inicio_de.append(0)
+        self.fin_de.append(0)
+        self[len(self) - 1] = doc
+
+    def copiar(self):
+        """Copia que comparte los bloques y los tramos de los arreglos"""
+        copia = ColumnaDocumentos()
+        copia.bloques = list(self.bloques)
+        copia.bloque_de = self.bloque_de.copiar()
+        copia.inicio_de = self.inicio_de.copiar()
+        copia.fin_de = self.fin_de.copiar()
+        # Solo la copia sigue agregando al bloque abierto
+        copia.abierto = self.abierto
+        self.abierto = None
+        copia.bytes_totales = self.bytes_totales
+        copia.bytes_muertos = self.bytes_muertos
+        return copia
+
+    def conviene_compactar(self):
+        return self.bytes_muertos > FRACCION_COMPACTACION * self.bytes_totales
+
+    def compactar(self):
+        """
+        Reescribe los documentos vivos en un solo bloque. Cuesta O(N), pero
+        como se hace recién cuando la mitad de los bytes está muerta, el costo
+        repartido entre los cambios que la provocaron es constante.
+        """
+        vistas = [memoryview(bloque) for bloque in self.bloques]
+        partes = []
+        try:
+            bloque_de = array.array("i")
+            inicios = array.array("Q")
+            fines = array.array("Q")
+            inicio = 0
+            for numero, desde, hasta in zip(self.bloque_de, self.inicio_de, self.fin_de):
+                if numero < 0:
+                    bloque_de.append(-1)
+                    inicios.append(0)
+                    fines.append(0)
+                    continue
+                partes.append(vistas[numero][desde:hasta])
+                bloque_de.append(0)
+                inicios.append(inicio)
+                inicio += hasta - desde
+                fines.append(inicio)
+            blob = b"".join(partes)
+        finally:
+            # Un bytearray con vistas abiertas no puede crecer
+            del partes
+            for vista in vistas:
+                vista.release()
+        self.bloques = [blob]
+        self.bloque_de = ArregloPorTramos("i", bloque_de)
+        self.inicio_de = ArregloPorTramos("Q", inicios)
+        self.fin_de = ArregloPorTramos("Q", fines)
+        self.abierto = None
+        self.bytes_totales = len(blob)
+        self.bytes_muertos = 0
+
+class IndiceInvertido:
+    """
+    Índice de búsqueda construido una sola vez al cargar los documentos.
+    Los títulos quedan como un mapa token -> posiciones (posting list) y las
+    categorías como ids enteros, con la lista de posiciones de cada una, de
+    modo que una consulta solo toca los documentos que comparten algún
+    término con ella. Todo se guarda en arreglos compactos (`array`) y los
+    documentos en una ColumnaDocumentos: solo se arma el dict de las filas
+    que se devuelven.
+    """
+    def __init__(self, documentos):
+        documentos = documentos if isinstance(documentos, list) else list(documentos)
+        self.documentos = ColumnaDocumentos(documentos)
+        postings = {}
+        self.categorias = []
+        categoria_de = []
+        docs_por_categoria = []
+        ids_categoria = {}
+
+        for posicion, doc in enumerate(documentos):
+            for token in set(normalizar(doc.get("titulo", "")).split()):
+                postings.setdefault(token, []).append(posicion)
+
+            categoria = normalizar(doc.get("categoria", ""))
+            id_categoria = ids_categoria.get(categoria)
+            if id_categoria is None:
+                id_categoria = ids_categoria[categoria] = len(self.categorias)
+                self.categorias.append(categoria)
+                docs_por_categoria.append([])
+            categoria_de.append(id_categoria)
+            docs_por_categoria[id_categoria].append(posicion)
+
+        self.postings = MapaPorTramos({token: array.array("I", posiciones) for token, posiciones in postings.items()})
+        self.categoria_de = ArregloPorTramos("i", categoria_de)
+        self.docs_por_categoria = [array.array("I", posiciones) for posiciones in docs_por_categoria]
+
+    def __len__(self):
+        return len(self.documentos)
+
+    def documento(self, posicion):
+        return self.documentos[posicion]
+
+    def contar_coincidencias(self, palabras_clave):
+        """
+        Documentos con algún término como arreglos numéricos: (posiciones
+        ordenadas, coincidencias). Una palabra repetida suma cada vez.
+        """
+        listas = [self.postings.get(palabra) for palabra in palabras_clave]
+        listas = [np.asarray(posiciones) for posiciones in listas if posiciones is not None and len(posiciones)]
+        if not listas:
+            vacio = np.empty(0, dtype=np.int64)
+            return vacio, vacio
+        return np.unique(np.concatenate(listas), return_counts=True)
+
+    def iterar_ordenado(self, palabras_clave, grupo_etario, intereses, fin=None):
+        """
+        Recorre los documentos de mayor a menor score, desempatando por posición
+        (el mismo orden que un sort estable sobre la lista original).
+        Produce tuplas (score, posicion, coincidencias, puntaje_categoria).
+        Con `fin` solo se garantizan los `fin` primeros.
+        """
+        posiciones, coincidencias = self.contar_coincidencias(palabras_clave)
+        puntajes = [
+            intereses.get(categoria, {}).get(grupo_etario, 0) if grupo_etario else 0
+            for categoria in self.categorias
+        ]
+
+        # Documentos con coincidencias en el título: los scores se calculan
+        # como arreglo y solo se ordenan los `fin` mejores
+        categorias = tomar(self.categoria_de, posiciones)
+        scores = coincidencias * 10 + np.asarray(puntajes)[categorias]
+        elegidos = seleccionar_mejores(scores, fin)
+        candidatos = [
+            (-(cantidad * 10 + puntajes[id_categoria]), posicion, cantidad, puntajes[id_categoria])
+            for posicion, cantidad, id_categoria in zip(posiciones[elegidos].tolist(),
+                                                        coincidencias[elegidos].tolist(),
+                                                        categorias[elegidos].tolist())
+        ]
+
+        # El resto solo depende de su categoría y ya está ordenado por posición
+        con_coincidencias = bytearray(len(self.categoria_de))
+        np.frombuffer(con_coincidencias, dtype=np.uint8)[posiciones] = 1
+        flujos = [candidatos]
+        for id_categoria, posiciones_categoria in enumerate(self.docs_por_categoria):
+            flujos.append(_sin_coincidencias(posiciones_categoria, con_coincidencias, puntajes[id_categoria]))
+
+        for menos_score, posicion, coincidencias, puntaje_categoria in heapq.merge(*flujos):
+            yield -menos_score, posicion, coincidencias, puntaje_categoria
+
+    def _copiar(self):
+        """
+        Copia superficial: las posting lists, las partes del mapa de términos y
+        los tramos de los arreglos se comparten hasta que se modifican
+        """
+        copia = IndiceInvertido.__new__(IndiceInvertido)
+        copia.documentos = self.documentos.copiar()
+        copia.postings = self.postings.copiar()
+        copia.categorias = list(self.categorias)
+        copia.categoria_de = self.categoria_de.copiar()
+        copia.docs_por_categoria = list(self.docs_por_categoria)
+        return copia
+
+    def con_cambios(self, agregar=(), reemplazar=None, eliminar=()):
+        """
+        Devuelve un índice nuevo con los cambios aplicados sin tocar este, que
+        puede seguir atendiendo consultas mientras tanto. Solo se copian las
+        posting lists de los términos y categorías afectados.
+        `reemplazar` es {posicion: documento}, `eliminar` una lista de
+        posiciones y `agregar` documentos nuevos que van al final. Las
+        posiciones eliminadas quedan vacías (None) para no correr las demás.
+        Devuelve el índice nuevo y las posiciones de los documentos agregados.
+        """
+        reemplazar = reemplazar or {}
+        nuevo = self._copiar()
+        ids_categoria = {categoria: id_categoria for id_categoria, categoria in enumerate(nuevo.categorias)}
+        terminos_copiados = set()
+        categorias_copiadas = set()
+
+        def posiciones_termino(token):
+            if token not in terminos_copiados:
+                nuevo.postings[token] = array.array("I", nuevo.postings.get(token, ()))
+                terminos_copiados.add(token)
+            return nuevo.postings[token]
+
+        def posiciones_categoria(id_categoria):
+            if id_categoria not in categorias_copiadas:
+                nuevo.docs_por_categoria[id_categoria] = array.array("I", nuevo.docs_por_categoria[id_categoria])
+                categorias_copiadas.add(id_categoria)
+            return nuevo.docs_por_categoria[id_categoria]
+
+        def quitar(posicion):
+            doc = nuevo.documentos[posicion]
+            if doc is None:
+                return
+            for token in set(normalizar(doc.get("titulo", "")).split()):
+                posiciones = posiciones_termino(token)
+                del posiciones[bisect.bisect_left(posiciones, posicion)]
+                if not posiciones:
+                    del nuevo.postings[token]
+                    terminos_copiados.discard(token)
+            posiciones = posiciones_categoria(nuevo.categoria_de[posicion])
+            del posiciones[bisect.bisect_left(posiciones, posicion)]
+            nuevo.documentos[posicion] = None
+            nuevo.categoria_de[posicion] = -1
+
+        def poner(posicion, doc):
+            for token in set(normalizar(doc.get("titulo", "")).split()):
+                bisect.insort(posiciones_termino(token), posicion)
+            categoria = normalizar(doc.get("categoria", ""))
+            id_categoria = ids_categoria.get(categoria)
+            if id_categoria is None:
+                id_categoria = ids_categoria[categoria] = len(nuevo.categorias)
+                nuevo.categorias.append(categoria)
+                nuevo.docs_por_categoria.append(array.array("I"))
+                categorias_copiadas.add(id_categoria)
+            bisect.insort(posiciones_categoria(id_categoria), posicion)
+            nuevo.documentos[posicion] = doc
+            nuevo.categoria_de[posicion] = id_categoria
+
+        for posicion in list(eliminar) + list(reemplazar):
+            quitar(posicion)
+        for posicion, doc in reemplazar.items():
+            poner(posicion, doc)
+        agregadas = []
+        for doc in agregar:
+            posicion = len(nuevo.documentos)
+            nuevo.documentos.append(None)
+            nuevo.categoria_de.append(-1)
+            poner(posicion, doc)
+            agregadas.append(posicion)
+        if nuevo.documentos.conviene_compactar():
+            nuevo.documentos.compactar()
+        return nuevo, agregadas
+
+def _sin_coincidencias(posiciones, con_coincidencias, puntaje_categoria):
+    for posicion in posiciones:
+        if not con_coincidencias[posicion]:
+            yield -puntaje_categoria, posicion, 0, puntaje_categoria
+
+def seleccionar_mejores(scores, fin=None):
+    """
+    Índices de los `fin` mayores scores (todos si no hay `fin`), de mayor a
+    menor; en empate va primero el índice menor, como en un sort estable
+    """
+    if fin is None or fin >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    if fin <= 0:
+        return np.empty(0, dtype=np.intp)
+    umbral = np.partition(scores, len(scores) - fin)[len(scores) - fin]
+    candidatos = np.flatnonzero(scores >= umbral)
+    return candidatos[np.argsort(-scores[candidatos], kind="stable")][:fin]
+
+def construir_indice(documentos):
+    return IndiceInvertido(documentos)
+
 def calcular_puntaje(documento, palabras_clave, grupo_etario, intereses):
     titulo = normalizar(documento.get("titulo", ""))
     titulo_palabras = titulo.split()
@@ -38,9 +555,29 @@ def calcular_puntaje(documento, palabras_clave, grupo_etario, intereses):
         "puntaje_categoria": puntaje_categoria
     }
 
-def aplicar_ranking(documentos, consulta_titulo, edad, rangos, intereses):
-    palabras_clave = [normalizar(p) for p in re.split(r"[\s+]", consulta_titulo) if p.strip()]
+def aplicar_ranking(documentos, consulta_titulo, edad, rangos, intereses, indice=None,
+                    limite=None, desplazamiento=0):
+    """
+    Devuelve los documentos ordenados por score (desc) y, en empate, por su
+    posición en la colección. Con `limite` solo se seleccionan los
+    `desplazamiento + limite` primeros en vez de ordenar todo el catálogo.
+    """
+    palabras_clave = extraer_palabras_clave(consulta_titulo)
     grupo_etario = determinar_grupo_etario(edad, rangos) if edad is not None else None
+    fin = desplazamiento + limite if limite is not None else None
+
+    if indice is not None:
+        ordenados = indice.iterar_ordenado(palabras_clave, grupo_etario, intereses, fin=fin)
+        return [
+            {
+                "documento": indice.documento(posicion),
+                "score": score,
+                "coincidencias_titulo": coincidencias,
+                "puntaje_categoria": puntaje_categoria
+            }
+            for score, posicion, coincidencias, puntaje_categoria
+            in itertools.islice(ordenados, desplazamiento, fin)
+        ]
 
     resultados = []
     for doc in documentos:
@@ -58,5 +595,10 @@ def aplicar_ranking(documentos, consulta_titulo, edad, rangos, intereses):
             }
         resultados.append(resultado)
 
+    if fin is not None:
+        # Selección parcial con heap; el índice de enumerate desempata como el sort estable
+        mejores = heapq.nsmallest(fin, enumerate(resultados), key=lambda par: (-par[1]["score"], par[0]))
+        return [resultado for _, resultado in mejores[desplazamiento:]]
+
     resultados.sort(key=lambda x: x["score"], reverse=True)
-    return resultados
+    return resultados[desplazamiento:]
@@ -0,0 +1,152 @@
+import threading
+import weakref
+import numpy as np
+from utils import ranking
+
+# Consultas cuyas coincidencias se cuentan juntas; acota la memoria por bloque
+CONSULTAS_BLOQUE = 256
+
+class MatrizLote:
+    """
+    Vista NumPy de un IndiceInvertido para puntuar muchas consultas juntas.
+    La matriz de incidencia documento x término se usa por columnas (la
+    columna de un término es su posting list) y por cada vector de puntajes
+    de categoría se guarda el orden de los documentos sin coincidencias, que
+    solo depende de ese vector. Los documentos eliminados por /admin no están.
+    """
+    def __init__(self, indice):
+        categoria_de = np.asarray(indice.categoria_de)
+        self.posiciones = np.flatnonzero(categoria_de >= 0)
+        self.categoria_de = np.where(categoria_de >= 0, categoria_de, 0).astype(np.intp)
+        self.total = len(categoria_de)
+        self.ordenes = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.posiciones)
+
+    def orden(self, pesos_categoria):
+        """Posiciones ordenadas por puntaje de categoría (desc) y posición: el ranking sin coincidencias"""
+        clave = (pesos_categoria.dtype.str, pesos_categoria.tobytes())
+        with self.lock:
+            orden = self.ordenes.get(clave)
+        if orden is None:
+            pesos = pesos_categoria[self.categoria_de[self.posiciones]]
+            orden = self.posiciones[np.argsort(-pesos, kind="stable")]
+            with self.lock:
+                self.ordenes[clave] = orden
+        return orden
+
+_matrices = weakref.WeakKeyDictionary()
+_lock_matrices = threading.Lock()
+
+def matriz_de(indice):
+    """La matriz se arma una vez por índice; un cambio por /admin crea otro índice y otra matriz"""
+    with _lock_matrices:
+        matriz = _matrices.get(indice)
+        if matriz is None:
+            matriz = _matrices[indice] = MatrizLote(indice)
+        return matriz
+
+def puntajes_por_categoria(indice, grupo_etario, intereses):
+    # Igual que en IndiceInvertido.iterar_ordenado: sin grupo etario no hay puntaje de categoría
+    return [
+        intereses.get(categoria, {}).get(grupo_etario, 0) if grupo_etario else 0
+        for categoria in indice.categorias
+    ]
+
+def _contar_coincidencias(indice, total, palabras_bloque):
+    """
+    Coincidencias de todas las consultas del bloque a la vez. Devuelve
+    (consulta, posición, coincidencias) ordenados por consulta y posición.
+    Una palabra repetida en la consulta suma tantas veces como aparece.
+    """
+    postings = {}
+    consultas, posiciones = [], []
+    for numero, palabras in enumerate(palabras_bloque):
+        for palabra in palabras:
+            if palabra not in postings:
+                lista = indice.postings.get(palabra)
+                postings[palabra] = np.asarray(lista, dtype=np.int64) if lista is not None else None
+            lista = postings[palabra]
+            if lista is not None and len(lista):
+                posiciones.append(lista)
+                consultas.append(np.full(len(lista), numero, dtype=np.int64))
+    if not posiciones:
+        vacio = np.empty(0, dtype=np.int64)
+        return vacio, vacio, vacio
+    claves, coincidencias = np.unique(np.concatenate(consultas) * total + np.concatenate(posiciones),
+                                      return_counts=True)
+    return claves // total, claves % total, coincidencias
+
+def aplicar_ranking_lote(consultas, rangos, intereses, indice, limite=None, desplazamiento=0):
+    """
+    Versión por lotes de ranking.aplicar_ranking: `consultas` es una lista de
+    pares (titulo, edad) y se devuelve la lista de resultados de cada una,
+    idéntica a la de una consulta individual con el mismo limite/offset.
+
+    Las coincidencias de un bloque de consultas se cuentan juntas sobre las
+    posting lists y el puntaje de categoría sale de un vector por grupo
+    etario armado desde `intereses`. Los documentos sin coincidencias salen
+    del orden precalculado de ese vector. Los resultados se arman con
+    aritmética de Python para que valores y tipos sean los de la consulta
+    individual.
+    """
+    if not consultas:
+        return []
+    matriz = matriz_de(indice)
+    if len(matriz) == 0:
+        return [[] for _ in consultas]
+    fin = desplazamiento + limite if limite is not None else len(matriz)
+    fin = min(fin, len(matriz))
+
+    palabras = [ranking.extraer_palabras_clave(titulo) for titulo, _ in consultas]
+    grupos = [ranking.determinar_grupo_etario(edad, rangos) if edad is not None else None for _, edad in consultas]
+
+    # Un vector de puntajes por categoría para cada grupo etario del lote
+    por_grupo = {}
+    for grupo in grupos:
+        if grupo not in por_grupo:
+            puntajes = puntajes_por_categoria(indice, grupo, intereses)
+            tipo = np.int64 if all(isinstance(p, int) for p in puntajes) else np.float64
+            pesos = np.array(puntajes, dtype=tipo)
+            por_grupo[grupo] = (puntajes, pesos, matriz.orden(pesos))
+
+    resultados = []
+    for inicio in range(0, len(consultas), CONSULTAS_BLOQUE):
+        bloque = range(inicio, min(inicio + CONSULTAS_BLOQUE, len(consultas)))
+        numeros, posiciones, coincidencias = _contar_coincidencias(indice, matriz.total, [palabras[n] for n in bloque])
+        limites = np.searchsorted(numeros, np.arange(len(bloque) + 1))
+
+        for fila, numero in enumerate(bloque):
+            puntajes, pesos, orden = por_grupo[grupos[numero]]
+            desde, hasta = limites[fila], limites[fila + 1]
+            con_coincidencias = posiciones[desde:hasta]
+            cantidades = coincidencias[desde:hasta]
+            scores = cantidades.astype(pesos.dtype) * 10 + pesos[matriz.categoria_de[con_coincidencias]]
+
+            # Sin coincidencias alcanza con los primeros del orden por categoría
+            # que no estén entre los documentos con coincidencias
+            sin_coincidencias = orden[:fin + len(con_coincidencias)]
+            if len(con_coincidencias):
+                sin_coincidencias = sin_coincidencias[~np.isin(sin_coincidencias, con_coincidencias,
+                                                               assume_unique=True)]
+            sin_coincidencias = sin_coincidencias[:fin]
+
+            todas = np.concatenate((con_coincidencias, sin_coincidencias))
+            todos_scores = np.concatenate((scores, pesos[matriz.categoria_de[sin_coincidencias]]))
+            elegidas = np.lexsort((todas, -todos_scores))[desplazamiento:fin]
+
+            pagina = []
+            for elegida in elegidas.tolist():
+                posicion = int(todas[elegida])
+                cantidad = int(cantidades[elegida]) if elegida < len(con_coincidencias) else 0
+                puntaje_categoria = puntajes[matriz.categoria_de[posicion]]
+                pagina.append({
+                    "documento": indice.documento(posicion),
+                    "score": cantidad * 10 + puntaje_categoria,
+                    "coincidencias_titulo": cantidad,
+                    "puntaje_categoria": puntaje_categoria
+                })
+            resultados.append(pagina)
+    return resultados
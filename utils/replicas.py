@@ -0,0 +1,290 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from utils.conexiones import PoolEsclavo
+
+POLITICAS_BALANCEO = ("menos_pendientes", "dos_opciones")
+
+# Cantidad de latencias recientes que se usan para el p95 de cada réplica
+VENTANA_LATENCIAS = 200
+
+class Replica:
+    """
+    Una réplica de un esclavo: su pool de conexiones, las peticiones en curso
+    y las latencias recientes. Queda expulsada por `expulsion` segundos si
+    /health falla o si acumula `fallos_expulsion` errores seguidos. Un /health
+    que vuelve a responder solo readmite a las que expulsó el propio chequeo:
+    una réplica que falla en /query y responde bien /health cumple su expulsión.
+    """
+    def __init__(self, host, port, tamanio_pool=10, bloquear=False, expulsion=10.0, fallos_expulsion=3):
+        self.nombre = f"{host}:{port}"
+        self.pool = PoolEsclavo(host, port, tamanio=tamanio_pool, bloquear=bloquear)
+        self.expulsion = expulsion
+        self.fallos_expulsion = fallos_expulsion
+        self.lock = threading.Lock()
+        self.en_curso = 0
+        self.latencias = deque(maxlen=VENTANA_LATENCIAS)
+        self.latencia_media = None  # promedio móvil exponencial
+        self.p95_cache = None
+        self.fallos_seguidos = 0
+        self.expulsada_hasta = 0.0
+        self.expulsada_por_salud = False
+        self.expulsiones = 0
+        self.peticiones = 0
+        self.errores = 0
+
+    def disponible(self, ahora=None):
+        return (ahora or time.monotonic()) >= self.expulsada_hasta
+
+    def expulsar(self, motivo, por_salud=False):
+        with self.lock:
+            ya_expulsada = not self.disponible()
+            self.expulsada_hasta = time.monotonic() + self.expulsion
+            # Una expulsión por errores en las consultas no la levanta el chequeo de /health
+            self.expulsada_por_salud = por_salud and (not ya_expulsada or self.expulsada_por_salud)
+            if not ya_expulsada:
+                self.expulsiones += 1
+        if not ya_expulsada:
+            print(f"Réplica {self.nombre} expulsada por {self.expulsion}s: {motivo}")
+
+    def readmitir(self):
+        """/health volvió a responder: termina la expulsión si la había decidido el chequeo"""
+        with self.lock:
+            if self.expulsada_por_salud:
+                self.expulsada_por_salud = False
+                self.expulsada_hasta = 0.0
+
+    def costo(self):
+        """Costo estimado de mandarle una petición más (latencia media por pendientes)"""
+        media = self.latencia_media if self.latencia_media is not None else 0.0
+        return media * (self.en_curso + 1)
+
+    def p95(self):
+        with self.lock:
+            if self.p95_cache is None and len(self.latencias) >= 20:
+                ordenadas = sorted(self.latencias)
+                self.p95_cache = ordenadas[int(0.95 * (len(ordenadas) - 1))]
+            return self.p95_cache
+
+    def get(self, ruta, **kwargs):
+        return self.peticion("GET", ruta, **kwargs)
+
+    def peticion(self, metodo, ruta, medir=True, **kwargs):
+        """Con `medir=False` la latencia no entra en el p95 ni en la media (p. ej. lotes)"""
+        self.comenzar()
+        inicio = time.monotonic()
+        try:
+            response = self.pool.peticion(metodo, ruta, **kwargs)
+            if response.status_code >= 500:
+                # Los 4xx son errores de la petición, no de la réplica
+                response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.registrar_fallo(e)
+            raise
+        finally:
+            self.terminar()
+        # Ida y vuelta completa, con el cuerpo ya leído (response.elapsed termina en las cabeceras)
+        response.duracion = time.monotonic() - inicio
+        self.registrar_exito(response.duracion, medir)
+        return response
+
+    # Contabilidad de una petición, compartida con el cliente asíncrono (utils/replicas_async.py)
+    def comenzar(self):
+        with self.lock:
+            self.en_curso += 1
+            self.peticiones += 1
+
+    def terminar(self):
+        with self.lock:
+            self.en_curso -= 1
+
+    def registrar_fallo(self, error):
+        with self.lock:
+            self.errores += 1
+            self.fallos_seguidos += 1
+            expulsar = self.fallos_seguidos >= self.fallos_expulsion
+        if expulsar:
+            self.expulsar(f"{self.fallos_expulsion} errores seguidos ({error})")
+
+    def registrar_exito(self, latencia, medir=True):
+        with self.lock:
+            self.fallos_seguidos = 0
+            if not medir:
+                return
+            self.latencias.append(latencia)
+            self.p95_cache = None
+            if self.latencia_media is None:
+                self.latencia_media = latencia
+            else:
+                self.latencia_media = 0.8 * self.latencia_media + 0.2 * latencia
+
+    def estadisticas(self):
+        datos = self.pool.estadisticas()
+        p95 = self.p95()
+        with self.lock:
+            datos.update({
+                "disponible": self.disponible(),
+                "en_curso": self.en_curso,
+                "latencia_media": self.latencia_media,
+                "latencia_p95": p95,
+                "expulsiones": self.expulsiones
+            })
+        return datos
+
+class GrupoReplicas:
+    """
+    Réplicas de un mismo tipo de documento. Cada petición va a una réplica
+    elegida según la política de balanceo:
+      - menos_pendientes: la que tiene menos peticiones en curso.
+      - dos_opciones: de dos réplicas al azar, la de menor latencia media
+        ponderada por sus pendientes.
+    Con hedging, si la primera réplica tarda más que su p95 reciente se
+    manda la misma petición a una segunda y se usa la primera respuesta.
+    """
+    def __init__(self, tipo, replicas, politica="menos_pendientes", hedging=True, hedge_minimo=0.01, executor=None):
+        if politica not in POLITICAS_BALANCEO:
+            raise ValueError(f"Política de balanceo desconocida: {politica}")
+        self.tipo = tipo
+        self.replicas = replicas
+        self.politica = politica
+        self.hedging = hedging and len(replicas) > 1
+        self.hedge_minimo = hedge_minimo
+        self.executor = executor
+        self.lock = threading.Lock()
+        self.hedges = 0
+        self.hedges_ganados = 0
+        self.reintentos = 0
+
+    def elegir(self, excluir=()):
+        """Réplica para la próxima petición; si todas están expulsadas se usa igual alguna"""
+        ahora = time.monotonic()
+        candidatas = [r for r in self.replicas if r not in excluir and r.disponible(ahora)]
+        if not candidatas:
+            candidatas = [r for r in self.replicas if r not in excluir]
+        if not candidatas:
+            return None
+        if self.politica == "dos_opciones" and len(candidatas) > 2:
+            candidatas = random.sample(candidatas, 2)
+            return min(candidatas, key=Replica.costo)
+        # Empates al azar para repartir la carga entre réplicas ociosas
+        return min(candidatas, key=lambda r: (r.en_curso, r.costo(), random.random()))
+
+    def get(self, ruta, timeout=None, **kwargs):
+        """Hace la petición y devuelve (réplica que respondió, respuesta)"""
+        primera = self.elegir()
+        if not self.hedging or self.executor is None:
+            return self._con_reintento(primera, ruta, timeout, **kwargs)
+
+        inicio = time.monotonic()
+        futuros = {self.executor.submit(primera.get, ruta, timeout=timeout, **kwargs): primera}
+        espera = max(primera.p95() or timeout or 0.0, self.hedge_minimo)
+        if timeout is not None:
+            espera = min(espera, timeout)
+        hechos, _ = wait(futuros, timeout=espera)
+        error = None
+        if not hechos or next(iter(hechos)).exception() is not None:
+            # Lenta o con error: se manda la misma petición a otra réplica
+            segunda = self.elegir(excluir=(primera,))
+            restante = None if timeout is None else timeout - (time.monotonic() - inicio)
+            if segunda is not None and (restante is None or restante > self.hedge_minimo):
+                with self.lock:
+                    if hechos:
+                        self.reintentos += 1
+                    else:
+                        self.hedges += 1
+                futuros[self.executor.submit(segunda.get, ruta, timeout=restante, **kwargs)] = segunda
+
+        pendientes = set(futuros)
+        while pendientes:
+            restante = None if timeout is None else max(0.0, timeout - (time.monotonic() - inicio))
+            hechos, pendientes = wait(pendientes, timeout=restante, return_when=FIRST_COMPLETED)
+            if not hechos:
+                break
+            for futuro in hechos:
+                if futuro.exception() is not None:
+                    error = futuro.exception()
+                    continue
+                replica = futuros[futuro]
+                if replica is not primera:
+                    with self.lock:
+                        self.hedges_ganados += 1
+                return replica, futuro.result()
+        # Las peticiones que siguen en vuelo terminan solas al vencer su timeout
+        raise error or requests.exceptions.Timeout(f"Ninguna réplica de {self.tipo} respondió a tiempo")
+
+    def post_lote(self, ruta, timeout=None, **kwargs):
+        """
+        Petición POST de un lote de consultas: sin hedging (duplicaría todo el
+        lote) y sin medir su latencia, que no es comparable con la de /query
+        """
+        return self._con_reintento(self.elegir(), ruta, timeout, metodo="POST", medir=False, **kwargs)
+
+    def _con_reintento(self, replica, ruta, timeout, metodo="GET", **kwargs):
+        # Sin hedging: si la réplica falla se reintenta una vez en otra
+        try:
+            return replica, replica.peticion(metodo, ruta, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            otra = self.elegir(excluir=(replica,))
+            if otra is None:
+                raise
+            with self.lock:
+                self.reintentos += 1
+            return otra, otra.peticion(metodo, ruta, timeout=timeout, **kwargs)
+
+    def verificar_salud(self, timeout=1.0):
+        """Consulta /health de cada réplica; expulsa las que fallan y devuelve {réplica: versión}"""
+        versiones = {}
+        for replica in self.replicas:
+            try:
+                response = replica.pool.get("/health", timeout=timeout)
+                response.raise_for_status()
+                datos = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                replica.expulsar(f"/health falló ({e})", por_salud=True)
+                continue
+            replica.readmitir()
+            versiones[replica] = datos.get("version_datos")
+        return versiones
+
+    def estadisticas(self):
+        with self.lock:
+            datos = {"politica": self.politica, "hedging": self.hedging, "hedges": self.hedges,
+                     "hedges_ganados": self.hedges_ganados, "reintentos": self.reintentos}
+        datos["replicas"] = [replica.estadisticas() for replica in self.replicas]
+        return datos
+
+    def cerrar(self):
+        for replica in self.replicas:
+            replica.pool.cerrar()
+
+def crear_grupos(esclavos, tamanio=10, bloquear=False, politica="menos_pendientes", hedging=True,
+                 hedge_minimo=0.01, expulsion=10.0, fallos_expulsion=3, max_hilos=32):
+    """
+    Por cada tipo de esclavos_config.json, la lista de sus shards, cada uno
+    como un GrupoReplicas. Un tipo puede tener "host"/"port" (una réplica),
+    una lista "replicas" de {"host", "port"}, o una lista "shards" cuyos
+    elementos tienen a su vez "host"/"port" o "replicas". El bloque "pool" y
+    "balanceo" del tipo aplican a todas sus réplicas.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="hedge") if hedging else None
+    grupos = {}
+    for tipo, esclavo in esclavos.items():
+        config_pool = esclavo.get("pool", {})
+        shards = esclavo.get("shards") or [esclavo]
+        grupos[tipo] = []
+        for numero, shard in enumerate(shards):
+            direcciones = shard.get("replicas") or [{"host": shard["host"], "port": shard["port"]}]
+            replicas = [
+                Replica(direccion["host"], direccion["port"],
+                        tamanio_pool=int(config_pool.get("tamanio", tamanio)),
+                        bloquear=bool(config_pool.get("bloquear", bloquear)),
+                        expulsion=expulsion, fallos_expulsion=fallos_expulsion)
+                for direccion in direcciones
+            ]
+            nombre = f"{tipo}#{numero}" if len(shards) > 1 else tipo
+            grupos[tipo].append(GrupoReplicas(nombre, replicas, politica=esclavo.get("balanceo", politica),
+                                              hedging=hedging, hedge_minimo=hedge_minimo, executor=executor))
+    return grupos
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+from collections import namedtuple
+import aiohttp
+
+# Errores de red o de la réplica (5xx); los demás son de la petición
+ERRORES_RED = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# `bytes` es el largo del cuerpo y `duracion` la ida y vuelta con el cuerpo ya leído
+Respuesta = namedtuple("Respuesta", ["status", "headers", "datos", "bytes", "duracion"])
+
+async def peticion(sesion, replica, metodo, ruta, timeout=None, medir=True, **kwargs):
+    """
+    Petición no bloqueante a una réplica. Usa la misma contabilidad que
+    Replica.peticion (pendientes, latencias, expulsión por errores), así el
+    balanceo y el hedging ven el mismo estado que en el maestro con hilos.
+    El cuerpo JSON se lee completo dentro del plazo.
+    """
+    replica.comenzar()
+    inicio = time.monotonic()
+    try:
+        async with sesion.request(metodo, replica.pool.base_url + ruta,
+                                  timeout=aiohttp.ClientTimeout(total=timeout), **kwargs) as response:
+            if response.status >= 500:
+                # Los 4xx son errores de la petición, no de la réplica
+                response.raise_for_status()
+            cuerpo = await response.read()
+            datos = json.loads(cuerpo) if response.status < 400 else None
+            status, headers = response.status, response.headers
+    except ERRORES_RED as e:
+        replica.registrar_fallo(e)
+        raise
+    finally:
+        replica.terminar()
+    duracion = time.monotonic() - inicio
+    replica.registrar_exito(duracion, medir)
+    return Respuesta(status, headers, datos, len(cuerpo), duracion)
+
+async def get(grupo, sesion, ruta, timeout=None, **kwargs):
+    """
+    Versión asíncrona de GrupoReplicas.get: misma elección de réplica,
+    hedging tras el p95 de la primera y reintento en otra si falla.
+    Devuelve (réplica que respondió, respuesta); la petición que pierde se cancela.
+    """
+    primera = grupo.elegir()
+    if not grupo.hedging:
+        try:
+            return primera, await peticion(sesion, primera, "GET", ruta, timeout=timeout, **kwargs)
+        except ERRORES_RED:
+            otra = grupo.elegir(excluir=(primera,))
+            if otra is None:
+                raise
+            with grupo.lock:
+                grupo.reintentos += 1
+            return otra, await peticion(sesion, otra, "GET", ruta, timeout=timeout, **kwargs)
+
+    inicio = time.monotonic()
+    tareas = {asyncio.ensure_future(peticion(sesion, primera, "GET", ruta, timeout=timeout, **kwargs)): primera}
+    espera = max(primera.p95() or timeout or 0.0, grupo.hedge_minimo)
+    if timeout is not None:
+        espera = min(espera, timeout)
+    hechas, _ = await asyncio.wait(tareas, timeout=espera)
+    if not hechas or next(iter(hechas)).exception() is not None:
+        # Lenta o con error: se manda la misma petición a otra réplica
+        segunda = grupo.elegir(excluir=(primera,))
+        restante = None if timeout is None else timeout - (time.monotonic() - inicio)
+        if segunda is not None and (restante is None or restante > grupo.hedge_minimo):
+            with grupo.lock:
+                if hechas:
+                    grupo.reintentos += 1
+                else:
+                    grupo.hedges += 1
+            tareas[asyncio.ensure_future(peticion(sesion, segunda, "GET", ruta, timeout=restante, **kwargs))] = segunda
+
+    pendientes = set(tareas)
+    error = None
+    try:
+        while pendientes:
+            restante = None if timeout is None else max(0.0, timeout - (time.monotonic() - inicio))
+            hechas, pendientes = await asyncio.wait(pendientes, timeout=restante,
+                                                    return_when=asyncio.FIRST_COMPLETED)
+            if not hechas:
+                break
+            for tarea in hechas:
+                if tarea.exception() is not None:
+                    error = tarea.exception()
+                    continue
+                replica = tareas[tarea]
+                if replica is not primera:
+                    with grupo.lock:
+                        grupo.hedges_ganados += 1
+                return replica, tarea.result()
+    finally:
+        for tarea in pendientes:
+            tarea.cancel()
+    raise error or asyncio.TimeoutError(f"Ninguna réplica de {grupo.tipo} respondió a tiempo")
+
+async def post_lote(grupo, sesion, ruta, timeout=None, **kwargs):
+    """
+    Versión asíncrona de GrupoReplicas.post_lote: sin hedging (duplicaría
+    todo el lote), sin medir su latencia y con un reintento en otra réplica
+    """
+    primera = grupo.elegir()
+    try:
+        return primera, await peticion(sesion, primera, "POST", ruta, timeout=timeout, medir=False, **kwargs)
+    except ERRORES_RED:
+        otra = grupo.elegir(excluir=(primera,))
+        if otra is None:
+            raise
+        with grupo.lock:
+            grupo.reintentos += 1
+        return otra, await peticion(sesion, otra, "POST", ruta, timeout=timeout, medir=False, **kwargs)
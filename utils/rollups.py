@@ -0,0 +1,303 @@
+import datetime
+import math
+import threading
+from collections import OrderedDict
+from utils.sketch import SketchLatencia
+
+# Dimensiones por las que se agrupa cada minuto; "total" tiene una sola clave "".
+# "destino" agrupa las llamadas que registra el maestro por réplica llamada.
+DIMENSIONES = ("total", "maquina", "rango_etario", "query", "destino")
+# Los registros del maestro (uno por llamada a un esclavo) no son consultas
+# atendidas: solo cuentan por destino, así no se mezclan con los de un
+# esclavo que corre en la misma máquina
+DIMENSIONES_CONSULTA = ("total", "maquina", "rango_etario", "query")
+DIMENSIONES_MAESTRO = ("destino",)
+
+# Clave donde se juntan las consultas distintas que exceden el máximo por minuto
+CLAVE_OTRAS = "(otras)"
+
+# Estimación de memoria usada para el límite total (medida con tracemalloc en
+# CPython 3.11): lo fijo de una EstadisticaRollup con sus dos sketches y su
+# clave, y cada bucket ocupado de un sketch
+BYTES_CLAVE = 1000
+BYTES_BUCKET = 64
+
+def minuto_de(timestamp):
+    """Minuto ISO ("YYYY-MM-DDTHH:MM") de un timestamp ISO"""
+    return str(timestamp)[:16]
+
+def numero_o_none(registro, campo):
+    """Valor numérico finito del campo; None si falta o no es un número finito (NaN, inf)"""
+    try:
+        valor = float(registro[campo])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return valor if math.isfinite(valor) else None
+
+def latencia_de(registro):
+    """Latencia de red medida por el maestro en una llamada a un esclavo; None si el registro no la trae"""
+    return numero_o_none(registro, "latencia_red")
+
+class EstadisticaRollup:
+    """Conteo, sumas, extremos y sketches de una clave dentro de un minuto"""
+    def __init__(self, alfa=0.01):
+        self.conteo = 0
+        self.suma_score = 0.0
+        self.min_score = None
+        self.max_score = None
+        self.tamanio_kb = 0.0
+        self.tipo_maquina = None
+        self.tiempo = SketchLatencia(alfa)
+        self.latencia = SketchLatencia(alfa)
+
+    def agregar(self, tiempo_fin, score, latencia, tipo_maquina=None, bytes_respuesta=None):
+        self.conteo += 1
+        self.suma_score += score
+        self.min_score = score if self.min_score is None else min(self.min_score, score)
+        self.max_score = score if self.max_score is None else max(self.max_score, score)
+        if bytes_respuesta is not None:
+            self.tamanio_kb += bytes_respuesta / 1024
+        self.tiempo.agregar(tiempo_fin)
+        if latencia is not None and latencia >= 0:
+            self.latencia.agregar(latencia)
+        if tipo_maquina is not None:
+            self.tipo_maquina = tipo_maquina
+
+    def buckets(self):
+        return len(self.tiempo.buckets) + len(self.latencia.buckets)
+
+    def bytes_estimados(self):
+        return BYTES_CLAVE + self.buckets() * BYTES_BUCKET
+
+    def combinar(self, otra):
+        self.conteo += otra.conteo
+        self.suma_score += otra.suma_score
+        if otra.min_score is not None:
+            self.min_score = otra.min_score if self.min_score is None else min(self.min_score, otra.min_score)
+            self.max_score = otra.max_score if self.max_score is None else max(self.max_score, otra.max_score)
+        self.tamanio_kb += otra.tamanio_kb
+        self.tipo_maquina = self.tipo_maquina or otra.tipo_maquina
+        self.tiempo.combinar(otra.tiempo)
+        self.latencia.combinar(otra.latencia)
+        return self
+
+    def a_dict(self, con_sketches=True):
+        datos = {
+            "conteo": self.conteo,
+            "suma_score": self.suma_score,
+            "min_score": self.min_score,
+            "max_score": self.max_score,
+            "tamanio_kb": self.tamanio_kb,
+            "tipo_maquina": self.tipo_maquina,
+            "suma_tiempo": self.tiempo.suma,
+            "min_tiempo": self.tiempo.minimo,
+            "max_tiempo": self.tiempo.maximo,
+            "p50_tiempo": self.tiempo.cuantil(0.5),
+            "p95_tiempo": self.tiempo.cuantil(0.95),
+            "p99_tiempo": self.tiempo.cuantil(0.99),
+            "conteo_latencia": self.latencia.conteo,
+            "suma_latencia": self.latencia.suma,
+            "p95_latencia": self.latencia.cuantil(0.95)
+        }
+        if con_sketches:
+            datos["sketch_tiempo"] = self.tiempo.a_dict()
+            datos["sketch_latencia"] = self.latencia.a_dict()
+        return datos
+
+    @classmethod
+    def desde_dict(cls, datos):
+        estadistica = cls()
+        estadistica.conteo = datos["conteo"]
+        estadistica.suma_score = datos["suma_score"]
+        estadistica.min_score = datos["min_score"]
+        estadistica.max_score = datos["max_score"]
+        estadistica.tamanio_kb = datos["tamanio_kb"]
+        estadistica.tipo_maquina = datos.get("tipo_maquina")
+        estadistica.tiempo = SketchLatencia.desde_dict(datos["sketch_tiempo"])
+        estadistica.latencia = SketchLatencia.desde_dict(datos["sketch_latencia"])
+        return estadistica
+
+class RollupsPorMinuto:
+    """
+    Agregados por minuto que se actualizan a medida que llegan los registros.
+    Cada minuto guarda una EstadisticaRollup por clave en cada dimensión.
+    Se conservan los últimos `retencion_minutos` minutos y a lo sumo
+    `max_queries` consultas distintas por minuto (el resto va a "(otras)").
+    La dimensión "query", que es la que más claves tiene, solo se guarda en
+    los últimos `minutos_query` minutos; en los anteriores queda en None y
+    esas consultas siguen contadas en las demás dimensiones. Si la memoria
+    estimada de todos los minutos pasa de `max_bytes`, primero se quita la
+    dimensión "query" de los minutos más viejos y después se descartan
+    minutos enteros, nunca el último.
+    """
+    def __init__(self, retencion_minutos=1440, max_queries=1000, alfa=0.01, minutos_query=30,
+                 max_bytes=128 * 1024 * 1024):
+        self.retencion = datetime.timedelta(minutes=retencion_minutos)
+        self.max_queries = max_queries
+        self.alfa = alfa
+        self.minutos_query = datetime.timedelta(minutes=minutos_query)
+        self.max_bytes = max_bytes
+        self.minutos = OrderedDict()  # minuto -> {dimension: {clave: EstadisticaRollup} o None}
+        self.lock = threading.Lock()
+        self.registros = 0
+        self.descartados = 0
+        self.bytes = 0  # memoria estimada de todas las EstadisticaRollup guardadas
+        self.minutos_recortados = 0  # descartados antes de tiempo por max_bytes
+
+    def agregar(self, registros):
+        """Suma una lista de registros (diccionarios con los campos del log)"""
+        with self.lock:
+            for registro in registros:
+                try:
+                    minuto = minuto_de(registro["timestamp_ini"])
+                    # El minuto se vuelve a parsear al aplicar la retención y los
+                    # sketches no admiten NaN ni infinitos: se validan acá
+                    datetime.datetime.fromisoformat(minuto)
+                    tiempo_fin = float(registro["tiempo_fin"])
+                    score = float(registro["score"])
+                    if not (math.isfinite(tiempo_fin) and math.isfinite(score)):
+                        raise ValueError("tiempo_fin o score no es un número finito")
+                except (KeyError, TypeError, ValueError):
+                    self.descartados += 1
+                    continue
+                dimensiones = self._minuto(minuto)
+                if dimensiones is None:
+                    self.descartados += 1
+                    continue
+                latencia = latencia_de(registro)
+                bytes_respuesta = numero_o_none(registro, "bytes_respuesta")
+                query = str(registro.get("query", ""))
+                por_query = dimensiones["query"]
+                if por_query is not None and query not in por_query and (
+                        len(por_query) >= self.max_queries or self.bytes >= self.max_bytes):
+                    query = CLAVE_OTRAS
+                claves = (("total", "", None),
+                          ("maquina", str(registro.get("maquina", "")), registro.get("tipo_maquina")),
+                          ("rango_etario", str(registro.get("rango_etario", "")), None),
+                          ("query", query, None),
+                          ("destino", str(registro.get("destino", "")), registro.get("tipo_maquina")))
+                maestro = registro.get("tipo_maquina") == "maestro"
+                for dimension, clave, tipo_maquina in claves:
+                    if dimension not in (DIMENSIONES_MAESTRO if maestro else DIMENSIONES_CONSULTA):
+                        continue
+                    if dimensiones[dimension] is None:
+                        continue  # minuto viejo: ya no guarda la dimensión "query"
+                    estadistica = dimensiones[dimension].get(clave)
+                    if estadistica is None:
+                        estadistica = dimensiones[dimension][clave] = EstadisticaRollup(self.alfa)
+                        self.bytes += BYTES_CLAVE
+                    antes = estadistica.buckets()
+                    estadistica.agregar(tiempo_fin, score, latencia, tipo_maquina, bytes_respuesta)
+                    self.bytes += (estadistica.buckets() - antes) * BYTES_BUCKET
+                self.registros += 1
+            if self.bytes > self.max_bytes:
+                self._acotar()
+
+    def _minuto(self, minuto):
+        # Se llama con self.lock tomado
+        dimensiones = self.minutos.get(minuto)
+        if dimensiones is not None:
+            return dimensiones
+        if self.minutos and minuto < self._limite_retencion(max(minuto, next(reversed(self.minutos)))):
+            return None  # llegó tarde, su minuto ya se descartó
+        dimensiones = {dimension: {} for dimension in DIMENSIONES}
+        self.minutos[minuto] = dimensiones
+        if next(reversed(self.minutos)) != minuto:
+            # Registro atrasado: reordenar para que el orden siga siendo cronológico
+            self.minutos = OrderedDict(sorted(self.minutos.items()))
+        ultimo = next(reversed(self.minutos))
+        limite = self._limite_retencion(ultimo)
+        while self.minutos and next(iter(self.minutos)) < limite:
+            self._liberar(self.minutos.popitem(last=False)[1])
+        # Solo al abrir un minuto nuevo: recorre a lo sumo `retencion_minutos` entradas
+        limite_query = minuto_de((datetime.datetime.fromisoformat(ultimo) - self.minutos_query).isoformat())
+        for viejo, dimensiones_viejas in self.minutos.items():
+            if viejo >= limite_query:
+                break
+            self._quitar_queries(dimensiones_viejas)
+        return self.minutos.get(minuto)
+
+    def _liberar(self, dimensiones):
+        for dimension in DIMENSIONES:
+            for estadistica in (dimensiones[dimension] or {}).values():
+                self.bytes -= estadistica.bytes_estimados()
+
+    def _quitar_queries(self, dimensiones):
+        if dimensiones["query"] is not None:
+            for estadistica in dimensiones["query"].values():
+                self.bytes -= estadistica.bytes_estimados()
+            dimensiones["query"] = None
+
+    def _acotar(self):
+        # Se llama con self.lock tomado cuando la memoria estimada pasa de max_bytes.
+        # Primero se descartan los minutos viejos (que ya no tienen "query")...
+        while (self.bytes > self.max_bytes and len(self.minutos) > 1
+               and self.minutos[next(iter(self.minutos))]["query"] is None):
+            self._recortar_primero()
+        # ...después las queries de los recientes y, si no alcanza, los minutos enteros
+        ultimo = next(reversed(self.minutos))
+        for minuto, dimensiones in self.minutos.items():
+            if self.bytes <= self.max_bytes or minuto == ultimo:
+                break
+            self._quitar_queries(dimensiones)
+        while self.bytes > self.max_bytes and len(self.minutos) > 1:
+            self._recortar_primero()
+
+    def _recortar_primero(self):
+        self._liberar(self.minutos.popitem(last=False)[1])
+        self.minutos_recortados += 1
+
+    def _limite_retencion(self, ultimo):
+        return minuto_de((datetime.datetime.fromisoformat(ultimo) - self.retencion).isoformat())
+
+    def consultar(self, desde=None, hasta=None, dimension="total", con_sketches=True):
+        """
+        Lista de {minuto, clave, ...estadísticas} de una dimensión para los
+        minutos en [desde, hasta). Los límites son timestamps ISO.
+        """
+        if dimension not in DIMENSIONES:
+            raise ValueError(f"Dimensión desconocida: {dimension}")
+        desde = minuto_de(desde) if desde is not None else None
+        hasta = minuto_de(hasta) if hasta is not None else None
+        resultado = []
+        with self.lock:
+            for minuto, dimensiones in self.minutos.items():
+                if (desde is not None and minuto < desde) or (hasta is not None and minuto >= hasta):
+                    continue
+                for clave, estadistica in (dimensiones[dimension] or {}).items():
+                    fila = estadistica.a_dict(con_sketches)
+                    fila["minuto"] = minuto
+                    fila["clave"] = clave
+                    resultado.append(fila)
+        return resultado
+
+    def combinar(self, minutos, dimension="total", ultimo=None):
+        """Combina los últimos `minutos` minutos (hasta `ultimo` inclusive) por clave de la dimensión"""
+        with self.lock:
+            if not self.minutos:
+                return {}
+            ultimo = minuto_de(ultimo) if ultimo is not None else next(reversed(self.minutos))
+            inicio = minuto_de((datetime.datetime.fromisoformat(ultimo)
+                                - datetime.timedelta(minutes=minutos - 1)).isoformat())
+            combinadas = {}
+            for minuto, dimensiones in self.minutos.items():
+                if minuto < inicio or minuto > ultimo:
+                    continue
+                for clave, estadistica in (dimensiones[dimension] or {}).items():
+                    if clave not in combinadas:
+                        combinadas[clave] = EstadisticaRollup(self.alfa)
+                    combinadas[clave].combinar(estadistica)
+            return combinadas
+
+    def estadisticas(self):
+        with self.lock:
+            return {
+                "minutos": len(self.minutos),
+                "primer_minuto": next(iter(self.minutos), None),
+                "ultimo_minuto": next(reversed(self.minutos), None),
+                "registros": self.registros,
+                "descartados": self.descartados,
+                "bytes_estimados": self.bytes,
+                "max_bytes": self.max_bytes,
+                "minutos_recortados": self.minutos_recortados
+            }
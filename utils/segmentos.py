@@ -0,0 +1,90 @@
+import datetime
+import gzip
+import json
+import os
+import shutil
+
+ARCHIVO_MANIFEST = "manifest.json"
+
+def nombre_segmento(momento, parte=0):
+    """
+    Nombre del segmento de la hora `momento`; las partes extra vienen de
+    rotar por tamaño. El orden alfabético de los nombres es el cronológico.
+    """
+    return momento.strftime("logs-%Y%m%d-%H") + f"-{parte:02d}.csv"
+
+def inicio_de_hora(momento):
+    return momento.replace(minute=0, second=0, microsecond=0)
+
+def leer_manifest(directorio):
+    ruta = os.path.join(directorio, ARCHIVO_MANIFEST)
+    if not os.path.exists(ruta):
+        return {"version": 1, "segmentos": []}
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def guardar_manifest(directorio, manifest):
+    """Escribe el manifest de forma atómica (archivo temporal + rename)"""
+    ruta = os.path.join(directorio, ARCHIVO_MANIFEST)
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+def se_solapa(segmento, desde=None, hasta=None):
+    """
+    Indica si un segmento puede tener registros con timestamp_ini en [desde, hasta).
+    Los límites son timestamps ISO; un segmento sin registros nunca se lee.
+    """
+    if not segmento.get("filas"):
+        return False
+    if desde is not None and segmento["fin"] < desde:
+        return False
+    if hasta is not None and segmento["inicio"] >= hasta:
+        return False
+    return True
+
+def segmentos_en_rango(directorio, desde=None, hasta=None):
+    """Rutas de los segmentos que se solapan con la ventana, en orden cronológico"""
+    if isinstance(desde, datetime.datetime):
+        desde = desde.isoformat()
+    if isinstance(hasta, datetime.datetime):
+        hasta = hasta.isoformat()
+    manifest = leer_manifest(directorio)
+    return [
+        os.path.join(directorio, segmento["archivo"])
+        for segmento in manifest["segmentos"]
+        if se_solapa(segmento, desde, hasta)
+    ]
+
+def abrir_segmento(ruta, modo='rb'):
+    """Abre un segmento, comprimido o no; si se comprimió mientras tanto usa el .gz"""
+    if ruta.endswith(".gz"):
+        return gzip.open(ruta, modo)
+    try:
+        return open(ruta, modo)
+    except FileNotFoundError:
+        return gzip.open(ruta + ".gz", modo)
+
+def estado_segmento(ruta):
+    """
+    Ruta vigente y os.stat de un segmento; si se comprimió después de
+    listarlo devuelve los del .gz
+    """
+    if not ruta.endswith(".gz"):
+        try:
+            return ruta, os.stat(ruta)
+        except FileNotFoundError:
+            ruta += ".gz"
+    return ruta, os.stat(ruta)
+
+def comprimir_segmento(ruta):
+    """Comprime un segmento cerrado y borra el original; devuelve la nueva ruta"""
+    destino = ruta + ".gz"
+    with open(ruta, 'rb') as origen, gzip.open(destino + ".tmp", 'wb') as comprimido:
+        shutil.copyfileobj(origen, comprimido)
+    os.replace(destino + ".tmp", destino)
+    os.remove(ruta)
+    return destino
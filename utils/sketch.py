@@ -0,0 +1,101 @@
+import math
+
+class SketchLatencia:
+    """
+    Sketch de cuantiles con error relativo acotado (estilo DDSketch).
+    Cada valor positivo cae en el bucket ceil(log_gamma(valor)), así que
+    cualquier cuantil se estima con error relativo <= `alfa`. Dos sketches
+    con el mismo `alfa` se combinan sumando sus buckets, lo que permite
+    agregar por minuto y luego mezclar minutos, máquinas o servidores.
+    """
+    MINIMO_POSITIVO = 1e-9
+
+    def __init__(self, alfa=0.01):
+        self.alfa = alfa
+        self.gamma = (1 + alfa) / (1 - alfa)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.ceros = 0
+        self.conteo = 0
+        self.suma = 0.0
+        self.minimo = None
+        self.maximo = None
+
+    def agregar(self, valor, veces=1):
+        valor = float(valor)
+        if valor <= self.MINIMO_POSITIVO:
+            self.ceros += veces
+        else:
+            indice = math.ceil(math.log(valor) / self.log_gamma)
+            self.buckets[indice] = self.buckets.get(indice, 0) + veces
+        self.conteo += veces
+        self.suma += valor * veces
+        self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+        self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+
+    def combinar(self, otro):
+        if otro.alfa != self.alfa:
+            raise ValueError("Solo se pueden combinar sketches con el mismo alfa")
+        for indice, cantidad in otro.buckets.items():
+            self.buckets[indice] = self.buckets.get(indice, 0) + cantidad
+        self.ceros += otro.ceros
+        self.conteo += otro.conteo
+        self.suma += otro.suma
+        if otro.minimo is not None:
+            self.minimo = otro.minimo if self.minimo is None else min(self.minimo, otro.minimo)
+            self.maximo = otro.maximo if self.maximo is None else max(self.maximo, otro.maximo)
+        return self
+
+    def _valor_bucket(self, indice):
+        return 2 * self.gamma ** indice / (self.gamma + 1)
+
+    def cuantil(self, q):
+        """Valor aproximado del cuantil q (0..1); None si el sketch está vacío"""
+        if self.conteo == 0:
+            return None
+        rango = q * (self.conteo - 1)
+        acumulado = self.ceros
+        if rango < acumulado:
+            return 0.0
+        for indice in sorted(self.buckets):
+            acumulado += self.buckets[indice]
+            if rango < acumulado:
+                # Acotar a los extremos observados, que son exactos
+                return min(max(self._valor_bucket(indice), self.minimo), self.maximo)
+        return self.maximo
+
+    def promedio(self):
+        return self.suma / self.conteo if self.conteo else None
+
+    def muestra(self, cantidad):
+        """Valores representativos repartidos según los buckets (para dibujar distribuciones)"""
+        if self.conteo == 0:
+            return []
+        factor = min(1.0, cantidad / self.conteo)
+        valores = [0.0] * round(self.ceros * factor)
+        for indice in sorted(self.buckets):
+            valores.extend([self._valor_bucket(indice)] * max(1, round(self.buckets[indice] * factor)))
+        return valores
+
+    def a_dict(self):
+        """Representación serializable (por Pyro o JSON)"""
+        return {
+            "alfa": self.alfa,
+            "buckets": {str(indice): cantidad for indice, cantidad in self.buckets.items()},
+            "ceros": self.ceros,
+            "conteo": self.conteo,
+            "suma": self.suma,
+            "minimo": self.minimo,
+            "maximo": self.maximo
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        sketch = cls(alfa=datos["alfa"])
+        sketch.buckets = {int(indice): cantidad for indice, cantidad in datos["buckets"].items()}
+        sketch.ceros = datos["ceros"]
+        sketch.conteo = datos["conteo"]
+        sketch.suma = datos["suma"]
+        sketch.minimo = datos["minimo"]
+        sketch.maximo = datos["maximo"]
+        return sketch
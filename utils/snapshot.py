@@ -0,0 +1,303 @@
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from utils.ranking import ArregloPorTramos, ColumnaDocumentos, IndiceInvertido, MapaPorTramos
+
+# Formato del snapshot:
+#   prefijo  "<8sII": MAGIC, versión del formato, largo del encabezado
+#   encabezado JSON: checksum (crc32 del contenido), firma del JSON de origen,
+#                    cantidad de documentos, formato de la sección de ids
+#                    y tabla de secciones {nombre: [offset, largo]}
+#   contenido: secciones alineadas a 8 bytes (arreglos de enteros y blobs UTF-8)
+MAGIC = b"BDSNAP01"
+VERSION_FORMATO = 2
+PREFIJO = struct.Struct("<8sII")
+ALINEACION = 8
+BLOQUE_CHECKSUM = 16 * 1024 * 1024
+
+class SnapshotInvalido(Exception):
+    pass
+
+def ruta_snapshot_de(ruta_json):
+    """Ruta por defecto del snapshot de una colección: el mismo nombre con extensión .snap"""
+    return os.path.splitext(ruta_json)[0] + ".snap"
+
+def firma_fuente(ruta):
+    """Tamaño y fecha del JSON de origen; si cambian, el snapshot quedó viejo"""
+    info = os.stat(ruta)
+    return {"tamanio": info.st_size, "mtime_ns": info.st_mtime_ns,
+            "version_datos": f"{info.st_mtime_ns:x}-{info.st_size:x}"}
+
+def _arreglo(tipo, valores):
+    datos = array.array(tipo, valores)
+    if sys.byteorder != "little":
+        datos.byteswap()
+    return datos.tobytes()
+
+def _blob(partes):
+    """Concatena bytes y devuelve (blob, offsets de inicio de cada parte + final)"""
+    offsets = [0]
+    for parte in partes:
+        offsets.append(offsets[-1] + len(parte))
+    return b"".join(partes), offsets
+
+def ids_crecientes(ids):
+    """Indica si los ids son enteros estrictamente crecientes (se pueden buscar por bisección)"""
+    anterior = None
+    for doc_id in ids:
+        if not isinstance(doc_id, int) or isinstance(doc_id, bool) or (anterior is not None and doc_id <= anterior):
+            return False
+        anterior = doc_id
+    return True
+
+def compilar_snapshot(ruta_json, ruta_snapshot):
+    """
+    Compila una colección JSON a un snapshot binario: tokens normalizados con
+    sus posting lists, categorías internadas y los documentos serializados.
+    Usa IndiceInvertido para que la normalización sea idéntica a la del esclavo.
+    """
+    firma = firma_fuente(ruta_json)
+    with open(ruta_json, 'r', encoding='utf-8') as f:
+        documentos = json.load(f)
+    indice = IndiceInvertido(documentos)
+
+    # Términos ordenados por sus bytes UTF-8 para buscarlos con bisección
+    terminos = sorted(indice.postings, key=lambda termino: termino.encode("utf-8"))
+    terminos_blob, terminos_offsets = _blob([termino.encode("utf-8") for termino in terminos])
+    postings_offsets = [0]
+    for termino in terminos:
+        postings_offsets.append(postings_offsets[-1] + len(indice.postings[termino]))
+    docs_blob, docs_offsets = _blob([json.dumps(doc, ensure_ascii=False).encode("utf-8") for doc in documentos])
+    docs_categoria_offsets = [0]
+    for posiciones in indice.docs_por_categoria:
+        docs_categoria_offsets.append(docs_categoria_offsets[-1] + len(posiciones))
+    # id de cada documento (sin campo "id" es su posición), para los cambios por /admin:
+    # enteros crecientes como arreglo, cualquier otro caso como lista JSON
+    ids = [doc.get("id", posicion) for posicion, doc in enumerate(documentos)]
+    formato_ids = "crecientes" if ids_crecientes(ids) else "json"
+
+    secciones = [
+        ("categorias", json.dumps(indice.categorias, ensure_ascii=False).encode("utf-8")),
+        ("categoria_de", _arreglo("I", indice.categoria_de)),
+        ("docs_categoria_offsets", _arreglo("Q", docs_categoria_offsets)),
+        ("docs_categoria", _arreglo("I", (p for posiciones in indice.docs_por_categoria for p in posiciones))),
+        ("terminos_offsets", _arreglo("Q", terminos_offsets)),
+        ("terminos", terminos_blob),
+        ("postings_offsets", _arreglo("Q", postings_offsets)),
+        ("postings", _arreglo("I", (p for termino in terminos for p in indice.postings[termino]))),
+        ("docs_offsets", _arreglo("Q", docs_offsets)),
+        ("docs", docs_blob),
+        ("ids", _arreglo("q", ids) if formato_ids == "crecientes"
+                else json.dumps(ids, ensure_ascii=False).encode("utf-8")),
+    ]
+
+    # Armar el contenido y la tabla de secciones (offsets relativos al contenido)
+    contenido = bytearray()
+    tabla = {}
+    for nombre, datos in secciones:
+        contenido.extend(b"\0" * (-len(contenido) % ALINEACION))
+        tabla[nombre] = [len(contenido), len(datos)]
+        contenido.extend(datos)
+
+    encabezado = json.dumps({
+        "version": VERSION_FORMATO,
+        "checksum": zlib.crc32(contenido),
+        "fuente": firma,
+        "documentos": len(documentos),
+        "terminos": len(terminos),
+        "ids": formato_ids,
+        "secciones": tabla
+    }).encode("utf-8")
+    # El contenido empieza alineado para poder ver los arreglos sin copiarlos
+    encabezado += b" " * (-(PREFIJO.size + len(encabezado)) % ALINEACION)
+
+    temporal = ruta_snapshot + ".tmp"
+    with open(temporal, 'wb') as f:
+        f.write(PREFIJO.pack(MAGIC, VERSION_FORMATO, len(encabezado)))
+        f.write(encabezado)
+        f.write(contenido)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta_snapshot)
+    return {"documentos": len(documentos), "terminos": len(terminos), "bytes": os.path.getsize(ruta_snapshot)}
+
+class _Blobs:
+    """Secuencia de solo lectura sobre un blob y sus offsets (sin copiar)"""
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, posicion):
+        return self.blob[self.offsets[posicion]:self.offsets[posicion + 1]]
+
+    def __iter__(self):
+        for posicion in range(len(self)):
+            yield self[posicion]
+
+class _Documentos(_Blobs):
+    """Los documentos se decodifican recién cuando se devuelven en una respuesta"""
+    def __getitem__(self, posicion):
+        if posicion < 0 or posicion >= len(self):
+            raise IndexError(posicion)
+        return json.loads(bytes(super().__getitem__(posicion)))
+
+class _Postings:
+    """Mapa token -> posiciones sobre el snapshot; busca el token por bisección"""
+    def __init__(self, terminos, offsets, postings):
+        self.terminos = terminos
+        self.offsets = offsets
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.terminos)
+
+    def get(self, token, defecto=None):
+        clave = token.encode("utf-8")
+        posicion = bisect.bisect_left(_Claves(self.terminos), clave)
+        if posicion < len(self.terminos) and self.terminos[posicion] == clave:
+            return self.postings[self.offsets[posicion]:self.offsets[posicion + 1]]
+        return defecto
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def items(self):
+        for posicion in range(len(self.terminos)):
+            token = bytes(self.terminos[posicion]).decode("utf-8")
+            yield token, self.postings[self.offsets[posicion]:self.offsets[posicion + 1]]
+
+class _Claves:
+    # bisect necesita comparar bytes, no memoryviews
+    def __init__(self, terminos):
+        self.terminos = terminos
+
+    def __len__(self):
+        return len(self.terminos)
+
+    def __getitem__(self, posicion):
+        return bytes(self.terminos[posicion])
+
+class IndiceSnapshot(IndiceInvertido):
+    """
+    IndiceInvertido servido desde un snapshot mapeado en memoria. Nada se
+    parsea al abrirlo: las posting lists y las categorías se leen directo de
+    las páginas del archivo, que el sistema operativo comparte entre todos los
+    procesos que abren el mismo snapshot.
+    """
+    def __init__(self, ruta, verificar=True):
+        self.ruta = ruta
+        self.archivo = open(ruta, 'rb')
+        try:
+            self.mapa = mmap.mmap(self.archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self.archivo.close()
+            raise SnapshotInvalido(f"Snapshot vacío: {ruta}") from e
+        try:
+            self._abrir(verificar)
+        except SnapshotInvalido:
+            self.cerrar()
+            raise
+
+    def _abrir(self, verificar):
+        if len(self.mapa) < PREFIJO.size:
+            raise SnapshotInvalido(f"Snapshot truncado: {self.ruta}")
+        magic, version, largo = PREFIJO.unpack_from(self.mapa, 0)
+        if magic != MAGIC or version != VERSION_FORMATO:
+            raise SnapshotInvalido(f"Formato de snapshot no soportado en {self.ruta}")
+        try:
+            self.encabezado = json.loads(self.mapa[PREFIJO.size:PREFIJO.size + largo])
+        except ValueError as e:
+            raise SnapshotInvalido(f"Encabezado de snapshot inválido en {self.ruta}") from e
+        inicio = PREFIJO.size + largo
+        vista = memoryview(self.mapa)
+        if verificar:
+            checksum = 0
+            for posicion in range(inicio, len(self.mapa), BLOQUE_CHECKSUM):
+                checksum = zlib.crc32(vista[posicion:min(posicion + BLOQUE_CHECKSUM, len(self.mapa))], checksum)
+            if checksum != self.encabezado["checksum"]:
+                raise SnapshotInvalido(f"Checksum inválido en {self.ruta}")
+
+        def seccion(nombre, tipo=None):
+            offset, largo_seccion = self.encabezado["secciones"][nombre]
+            datos = vista[inicio + offset:inicio + offset + largo_seccion]
+            return datos.cast(tipo) if tipo else datos
+
+        if sys.byteorder != "little":
+            raise SnapshotInvalido("Los snapshots se leen sin copiar solo en máquinas little-endian")
+        self.documentos = _Documentos(seccion("docs"), seccion("docs_offsets", "Q"))
+        self.categorias = json.loads(bytes(seccion("categorias")))
+        self.categoria_de = seccion("categoria_de", "I")
+        self.docs_por_categoria = _Blobs(seccion("docs_categoria", "I"), seccion("docs_categoria_offsets", "Q"))
+        self.postings = _Postings(_Blobs(seccion("terminos"), seccion("terminos_offsets", "Q")),
+                                  seccion("postings_offsets", "Q"), seccion("postings", "I"))
+        self.ids = seccion("ids", "q") if self.encabezado["ids"] == "crecientes" else None
+        self._ids_json = None if self.ids is not None else seccion("ids")
+
+    def ids_documentos(self):
+        """
+        id de cada documento por posición: una vista sin copiar si son enteros
+        crecientes, si no una lista (se decodifica solo la sección de ids)
+        """
+        if self.ids is not None:
+            return self.ids
+        return json.loads(bytes(self._ids_json))
+
+    def _copiar(self):
+        # Para modificarlo se pasa a un IndiceInvertido en memoria (una sola vez)
+        copia = IndiceInvertido.__new__(IndiceInvertido)
+        copia.documentos = ColumnaDocumentos.desde_blob(self.documentos.blob, self.documentos.offsets)
+        copia.postings = MapaPorTramos({token: array.array("I", posiciones)
+                                        for token, posiciones in self.postings.items()})
+        copia.categorias = list(self.categorias)
+        copia.categoria_de = ArregloPorTramos("i", self.categoria_de)
+        copia.docs_por_categoria = [array.array("I", posiciones) for posiciones in self.docs_por_categoria]
+        return copia
+
+    @property
+    def version_datos(self):
+        return self.encabezado["fuente"]["version_datos"]
+
+    def vigente(self, ruta_json):
+        """Indica si el snapshot corresponde al JSON actual (mismo tamaño y fecha)"""
+        try:
+            actual = firma_fuente(ruta_json)
+        except OSError:
+            return True  # sin JSON de origen solo queda el snapshot
+        fuente = self.encabezado["fuente"]
+        return actual["tamanio"] == fuente["tamanio"] and actual["mtime_ns"] == fuente["mtime_ns"]
+
+    def cerrar(self):
+        # Las vistas sobre el mmap deben soltarse antes de cerrarlo
+        for atributo in ("documentos", "categoria_de", "docs_por_categoria", "postings", "ids", "_ids_json"):
+            self.__dict__.pop(atributo, None)
+        try:
+            self.mapa.close()
+        except BufferError:
+            pass  # quedan vistas vivas; el mapa se libera con el proceso
+        self.archivo.close()
+
+def abrir_snapshot(ruta_snapshot, ruta_json=None, verificar=True):
+    """
+    Abre el snapshot si existe, es válido y no quedó viejo respecto del JSON.
+    Devuelve None (y explica por qué) cuando hay que volver a cargar el JSON.
+    """
+    if not os.path.exists(ruta_snapshot):
+        return None
+    try:
+        indice = IndiceSnapshot(ruta_snapshot, verificar=verificar)
+    except (OSError, SnapshotInvalido, KeyError) as e:
+        print(f"Snapshot {ruta_snapshot} descartado: {e}")
+        return None
+    if ruta_json is not None and not indice.vigente(ruta_json):
+        print(f"Snapshot {ruta_snapshot} desactualizado respecto de {ruta_json}")
+        indice.cerrar()
+        return None
+    return indice
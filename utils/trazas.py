@@ -0,0 +1,93 @@
+import datetime
+import re
+import time
+import uuid
+
+# Cabecera con que el maestro propaga el id de traza a los esclavos
+CABECERA_TRAZA = "X-Trace-Id"
+# Un id que llega de afuera solo se acepta si es corto y sin caracteres raros
+TRAZA_VALIDA = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+def nuevo_trace_id():
+    return uuid.uuid4().hex
+
+def trace_id_de(valor):
+    """El id recibido en la cabecera, o uno nuevo si falta o no es válido"""
+    if valor and TRAZA_VALIDA.match(valor):
+        return valor
+    return nuevo_trace_id()
+
+class Cronometro:
+    """
+    Mide las etapas consecutivas de una petición: cada `marcar` guarda el
+    tiempo transcurrido desde la marca anterior con el nombre de la etapa.
+    """
+    def __init__(self):
+        self.inicio = self.ultimo = time.perf_counter()
+        self.etapas = {}
+
+    def marcar(self, etapa):
+        ahora = time.perf_counter()
+        self.etapas[etapa] = self.etapas.get(etapa, 0.0) + (ahora - self.ultimo)
+        self.ultimo = ahora
+
+    def total(self):
+        return self.ultimo - self.inicio
+
+def formatear_etapas(etapas):
+    """Etapas como texto para el CSV de logs: "parse=0.000120;rank=0.002100" (segundos)"""
+    return ";".join(f"{etapa}={duracion:.6f}" for etapa, duracion in etapas.items())
+
+def leer_etapas(texto):
+    etapas = {}
+    for parte in str(texto or "").split(";"):
+        etapa, _, duracion = parte.partition("=")
+        try:
+            etapas[etapa] = float(duracion)
+        except ValueError:
+            continue
+    return etapas
+
+def server_timing(etapas):
+    """Valor de la cabecera Server-Timing (duraciones en milisegundos, como pide el estándar)"""
+    return ", ".join(f"{etapa};dur={duracion * 1000:.3f}" for etapa, duracion in etapas.items())
+
+def leer_server_timing(valor):
+    """Etapas informadas por un esclavo en Server-Timing, en segundos"""
+    etapas = {}
+    for metrica in str(valor or "").split(","):
+        nombre, *parametros = [parte.strip() for parte in metrica.split(";")]
+        for parametro in parametros:
+            clave, _, duracion = parametro.partition("=")
+            if nombre and clave == "dur":
+                try:
+                    etapas[nombre] = float(duracion) / 1000
+                except ValueError:
+                    pass
+    return etapas
+
+def registro_llamada(trace_id, maquina, destino, query, duracion, etapas_esclavo, bytes_respuesta, score=0):
+    """
+    Registro de log del maestro para una llamada a un esclavo. `duracion` es
+    la ida y vuelta medida por el maestro (envío hasta recibir el cuerpo
+    completo); lo que no pasó dentro del esclavo según su Server-Timing es
+    la latencia de red.
+    """
+    recepcion = datetime.datetime.now()
+    envio = recepcion - datetime.timedelta(seconds=duracion)
+    tiempo_esclavo = sum(etapas_esclavo.values())
+    return {
+        "timestamp_ini": envio.isoformat(),
+        "timestamp_fin": recepcion.isoformat(),
+        "maquina": maquina,
+        "tipo_maquina": "maestro",
+        "query": query,
+        "tiempo_fin": round(duracion, 6),
+        "score": score,
+        "rango_etario": "",
+        "trace_id": trace_id,
+        "destino": destino,
+        "latencia_red": round(max(0.0, duracion - tiempo_esclavo), 6) if etapas_esclavo else "",
+        "bytes_respuesta": bytes_respuesta,
+        "etapas": formatear_etapas(etapas_esclavo)
+    }